@@ -0,0 +1,474 @@
+"""
+离线基准测试
+在本地启动一个模拟 Cloudflare 过渡页的 HTTP 服务，以指定并发调用 /health、/solve、/get_session、/close_driver，
+统计吞吐量、p50 / p95 / p99 延迟和驱动内存，结果写成 JSON 便于在不同提交之间对比；
+指定 --batches 时再测 /solve_batch（每批 --batch-size 个不同域名，记录各工作进程分到的 URL 数）
+
+模拟页面（都在本地，不访问外网）:
+    /redirect?delay_ms=1500    过渡页，delay_ms 后 JS 跳转到正文
+    /cookie?delay_ms=1500      过渡页，delay_ms 后由服务端下发 cf_clearance 再刷新
+    /js?work=200000            过渡页，JS 完成一段计算后提交答案，校验通过才下发 cf_clearance
+
+用法:
+    python benchmark.py run --requests 20 --concurrency 4                # 服务需已在 5000 端口运行
+    python benchmark.py run --spawn --challenge cookie --delay-ms 800     # 自动启动 serve.py bypass
+    python benchmark.py run --batches 10 --batch-size 8                  # 对 serve.py sharded 测批量分片
+    python benchmark.py compare bench_results/base.json bench_results/new.json
+    python benchmark.py server --port 8900                               # 只启动模拟页面，手动调试
+"""
+
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+CHALLENGE_KINDS = ("redirect", "cookie", "js")
+
+INTERSTITIAL_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Just a moment...</title></head>
+<body>
+<div id="challenge-running">Checking your browser before accessing the site.</div>
+<script>
+{script}
+</script>
+</body></html>
+"""
+
+CONTENT_TEMPLATE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Benchmark content</title></head>
+<body><h1>OK</h1><p>{host}</p></body></html>
+"""
+
+
+def js_answer(work):
+    """与页面中 JS 相同的计算，服务端用来校验答案"""
+    value = 0
+    for i in range(work):
+        value = (value * 31 + i) % 1000003
+    return value
+
+
+class ChallengeHandler(BaseHTTPRequestHandler):
+    """模拟 Cloudflare 过渡页，cf_clearance 的值由服务端签发"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html; charset=utf-8", headers=()):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("Cache-Control", "no-store")
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _cleared(self):
+        return "cf_clearance=" in (self.headers.get("Cookie") or "")
+
+    def _clearance_cookie(self):
+        return ("Set-Cookie", f"cf_clearance=bench-{int(time.time() * 1000)}; Path=/; Max-Age=3600")
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        delay_ms = int(query.get("delay_ms", "1000"))
+        host = self.headers.get("Host", "")
+
+        if parsed.path == "/content" or (parsed.path in ("/redirect", "/cookie", "/js") and self._cleared()):
+            self._send(200, CONTENT_TEMPLATE.format(host=host))
+        elif parsed.path == "/redirect":
+            script = f"setTimeout(function () {{ location.replace('/content'); }}, {delay_ms});"
+            self._send(503, INTERSTITIAL_TEMPLATE.format(script=script))
+        elif parsed.path == "/cookie":
+            script = (
+                f"setTimeout(function () {{ fetch('/cdn-cgi/clear', {{credentials: 'same-origin'}})"
+                f".then(function () {{ location.reload(); }}); }}, {delay_ms});"
+            )
+            self._send(503, INTERSTITIAL_TEMPLATE.format(script=script))
+        elif parsed.path == "/js":
+            work = int(query.get("work", "200000"))
+            script = (
+                f"setTimeout(function () {{ var v = 0; for (var i = 0; i < {work}; i++) {{ v = (v * 31 + i) % 1000003; }}"
+                f" location.replace('/cdn-cgi/verify?work={work}&answer=' + v); }}, {delay_ms});"
+            )
+            self._send(503, INTERSTITIAL_TEMPLATE.format(script=script))
+        elif parsed.path == "/cdn-cgi/clear":
+            self._send(204, "", headers=[self._clearance_cookie()])
+        elif parsed.path == "/cdn-cgi/verify":
+            work = int(query.get("work", "0"))
+            if query.get("answer") == str(js_answer(work)):
+                self._send(302, "", headers=[self._clearance_cookie(), ("Location", "/content")])
+            else:
+                self._send(403, "<html><head><title>Attention Required!</title></head><body>bad answer</body></html>")
+        else:
+            self._send(404, "<html><head><title>Not found</title></head></html>")
+
+
+def start_challenge_server(host="127.0.0.1", port=0):
+    """在后台线程启动模拟页面服务，返回 server（server.server_address[1] 为实际端口）"""
+    server = ThreadingHTTPServer((host, port), ChallengeHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="challenge-server", daemon=True).start()
+    return server
+
+
+def percentile(values, pct):
+    """线性插值百分位"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(samples, wall_time):
+    """samples: [(成功, 延迟秒)]"""
+    latencies = [latency for _, latency in samples]
+    ok = [latency for success, latency in samples if success]
+    return {
+        "count": len(samples),
+        "ok": len(ok),
+        "errors": len(samples) - len(ok),
+        "wall_time": round(wall_time, 3),
+        "throughput_rps": round(len(samples) / wall_time, 3) if wall_time else None,
+        "latency": {
+            "mean": round(sum(latencies) / len(latencies), 4) if latencies else None,
+            "p50": round(percentile(latencies, 50), 4) if latencies else None,
+            "p95": round(percentile(latencies, 95), 4) if latencies else None,
+            "p99": round(percentile(latencies, 99), 4) if latencies else None,
+            "max": round(max(latencies), 4) if latencies else None,
+        },
+    }
+
+
+class MemorySampler:
+    """定期读取 /health 中的驱动内存和数量"""
+
+    def __init__(self, service_url, interval=1.0):
+        self.service_url = service_url
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="memory-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=5)
+        rss = [sample["rss_mb"] for sample in self.samples if sample["rss_mb"] is not None]
+        drivers = [sample["active_drivers"] for sample in self.samples]
+        return {
+            "samples": len(self.samples),
+            "peak_rss_mb": max(rss) if rss else None,
+            "avg_rss_mb": round(sum(rss) / len(rss), 1) if rss else None,
+            "peak_active_drivers": max(drivers) if drivers else None,
+        }
+
+    def _loop(self):
+        with requests.Session() as http:
+            while not self._stop.wait(self.interval):
+                try:
+                    health = http.get(f"{self.service_url}/health", timeout=5).json()
+                except (requests.RequestException, ValueError):
+                    continue
+                lifecycle = health.get("driver_lifecycle") or {}
+                self.samples.append({
+                    "t": time.time(),
+                    "rss_mb": lifecycle.get("total_rss_mb"),
+                    "active_drivers": health.get("active_drivers", 0),
+                })
+
+
+def run_phase(name, count, concurrency, fn):
+    """以 concurrency 并发执行 fn(i) count 次，fn 返回 (成功, 附带数据)"""
+    samples = [None] * count
+    extras = [None] * count
+
+    def call(i):
+        started = time.perf_counter()
+        try:
+            success, extra = fn(i)
+        except Exception as e:
+            success, extra = False, {"error": str(e)}
+        samples[i] = (success, time.perf_counter() - started)
+        extras[i] = extra
+
+    print(f"[{datetime.now()}] ▶️  {name}: {count} 次，并发 {concurrency}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(count)))
+    wall_time = time.perf_counter() - started
+
+    summary = summarize(samples, wall_time)
+    errors = [extra.get("error") for (success, _), extra in zip(samples, extras) if not success and extra]
+    if errors:
+        summary["sample_errors"] = sorted(set(str(error) for error in errors))[:5]
+    print(f"[{datetime.now()}] ✅ {name}: {summary['throughput_rps']} req/s, "
+          f"p50={summary['latency']['p50']}s p95={summary['latency']['p95']}s p99={summary['latency']['p99']}s, "
+          f"失败 {summary['errors']}")
+    return summary, extras
+
+
+def wait_for_service(service_url, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f"{service_url}/health", timeout=2).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(1)
+    return False
+
+
+def spawn_service(port):
+    """用 serve.py 启动一个 bypass 服务进程"""
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py"), "bypass",
+               "--host", "127.0.0.1", "--port", str(port)]
+    return subprocess.Popen(command)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(args):
+    server = start_challenge_server(port=args.challenge_port)
+    challenge_port = server.server_address[1]
+    print(f"[{datetime.now()}] 🧪 模拟过渡页: http://127.0.0.1:{challenge_port}/{args.challenge}")
+
+    service = None
+    if args.spawn:
+        service = spawn_service(urlparse(args.service).port or 5000)
+    if not wait_for_service(args.service, args.startup_timeout):
+        print(f"❌ 服务 {args.service} 未就绪")
+        if service is not None:
+            service.terminate()
+        return None
+
+    def target_url(i):
+        # *.localhost 由 Chrome 直接解析到本机，不同子域名对应不同会话，避免同域名请求被合并
+        domain = f"b{i % args.domains}.localhost" if args.domains > 0 else "127.0.0.1"
+        query = f"delay_ms={args.delay_ms}"
+        if args.challenge == "js":
+            query += f"&work={args.js_work}"
+        return f"http://{domain}:{challenge_port}/{args.challenge}?{query}"
+
+    http = requests.Session()
+    http.mount("http://", HTTPAdapter(pool_maxsize=args.concurrency * 2))
+    results = {}
+    memory = MemorySampler(args.service, args.memory_interval)
+    memory.start()
+
+    try:
+        def health(i):
+            response = http.get(f"{args.service}/health", timeout=30)
+            return response.status_code == 200, {"error": None if response.ok else f"HTTP {response.status_code}"}
+
+        if args.health_requests > 0:
+            results["health"], _ = run_phase("/health", args.health_requests, args.concurrency, health)
+
+        def solve(i):
+            response = http.post(f"{args.service}/solve", json={
+                "url": target_url(i),
+                "headless": True,
+                "timeout": args.timeout,
+                "wait_mode": args.wait_mode,
+                "wait_time": args.delay_ms / 1000 + 1,
+                "use_cache": False,
+            }, timeout=args.timeout + 60)
+            payload = response.json()
+            return bool(payload.get("success")), {
+                "driver_id": payload.get("driver_id"),
+                "time_to_clear": payload.get("time_to_clear"),
+                "error": payload.get("error"),
+            }
+
+        results["solve"], solve_extras = run_phase("/solve", args.requests, args.concurrency, solve)
+        clear_times = [extra["time_to_clear"] for extra in solve_extras if extra and extra.get("time_to_clear")]
+        if clear_times:
+            results["solve"]["time_to_clear"] = {
+                "p50": round(percentile(clear_times, 50), 4),
+                "p95": round(percentile(clear_times, 95), 4),
+            }
+
+        def get_session(i):
+            # 只查询 /solve 阶段已求解过的域名
+            response = http.post(f"{args.service}/get_session", json={"url": target_url(i % args.requests)}, timeout=30)
+            payload = response.json()
+            return bool(payload.get("success") and payload.get("exists")), {"error": payload.get("error")}
+
+        results["get_session"], _ = run_phase("/get_session", args.session_requests, args.concurrency, get_session)
+
+        driver_ids = [extra["driver_id"] for extra in solve_extras if extra and extra.get("driver_id")]
+
+        def close_driver(i):
+            response = http.post(f"{args.service}/close_driver", json={"driver_id": driver_ids[i]}, timeout=60)
+            payload = response.json()
+            return bool(payload.get("success")), {"error": payload.get("error") or payload.get("message")}
+
+        if driver_ids:
+            results["close_driver"], _ = run_phase("/close_driver", len(driver_ids), args.concurrency, close_driver)
+
+        def solve_batch(i):
+            # 与 /solve 阶段不重叠的域名，不命中会话缓存
+            urls = [target_url(args.requests + i * args.batch_size + j) for j in range(args.batch_size)]
+            response = http.post(f"{args.service}/solve_batch", json={
+                "urls": urls,
+                "headless": True,
+                "timeout": args.timeout,
+                "wait_mode": args.wait_mode,
+                "wait_time": args.delay_ms / 1000 + 1,
+                "use_cache": False,
+                "stream": False,
+            }, timeout=args.timeout * args.batch_size + 60)
+            payload = response.json()
+            summary = payload.get("summary") or {}
+            errors = [result.get("error") for result in payload.get("results", []) if result.get("error")]
+            # 分片模式的汇总带各进程分到的 URL 数；单进程服务或旧版本按响应头记为整批落在一个进程
+            workers = summary.get("workers") or {response.headers.get("X-CF-Worker", "single"): len(urls)}
+            return bool(payload.get("success")), {"workers": workers,
+                                                   "error": payload.get("error") or (errors[0] if errors else None)}
+
+        if args.batches > 0:
+            results["solve_batch"], batch_extras = run_phase("/solve_batch", args.batches, args.concurrency, solve_batch)
+            spread = {}
+            for extra in batch_extras:
+                for worker, count in ((extra or {}).get("workers") or {}).items():
+                    spread[worker] = spread.get(worker, 0) + count
+            results["solve_batch"]["batch_size"] = args.batch_size
+            results["solve_batch"]["worker_spread"] = dict(sorted(spread.items()))
+    finally:
+        results["memory"] = memory.stop()
+        http.close()
+        server.shutdown()
+        if service is not None:
+            service.terminate()
+            try:
+                service.wait(timeout=90)
+            except subprocess.TimeoutExpired:
+                service.kill()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "commit": git_commit(),
+            "host": socket.gethostname(),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key != "func"},
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join("bench_results", f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"[{datetime.now()}] 💾 结果已写入 {output}")
+    return report
+
+
+def compare_reports(args):
+    """对比两份结果，打印各接口的吞吐量和延迟变化"""
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    print(f"基准: {args.base} ({base['meta'].get('commit')})")
+    print(f"对比: {args.new} ({new['meta'].get('commit')})")
+    print(f"{'接口':<14}{'指标':<16}{'基准':>12}{'对比':>12}{'变化':>10}")
+
+    for name in ("health", "solve", "get_session", "close_driver", "solve_batch"):
+        old, cur = base["results"].get(name), new["results"].get(name)
+        if not old or not cur:
+            continue
+        rows = [("throughput_rps", old["throughput_rps"], cur["throughput_rps"])]
+        rows += [(key, old["latency"][key], cur["latency"][key]) for key in ("p50", "p95", "p99")]
+        rows.append(("errors", old["errors"], cur["errors"]))
+        for metric, before, after in rows:
+            change = f"{(after - before) / before * 100:+.1f}%" if before and after is not None else "-"
+            print(f"{name:<14}{metric:<16}{before!s:>12}{after!s:>12}{change:>10}")
+        if "worker_spread" in old or "worker_spread" in cur:
+            print(f"{name:<14}{'worker_spread':<16}{json.dumps(old.get('worker_spread'))}  ->  "
+                  f"{json.dumps(cur.get('worker_spread'))}")
+
+    old_mem, cur_mem = base["results"].get("memory", {}), new["results"].get("memory", {})
+    print(f"{'memory':<14}{'peak_rss_mb':<16}{old_mem.get('peak_rss_mb')!s:>12}{cur_mem.get('peak_rss_mb')!s:>12}")
+
+
+def serve_challenge_pages(args):
+    server = start_challenge_server(port=args.port)
+    print(f"🧪 模拟过渡页运行在 http://127.0.0.1:{server.server_address[1]}/ ({', '.join(CHALLENGE_KINDS)})")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cloudflare 绕过服务离线基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("--service", default="http://localhost:5000")
+    run_parser.add_argument("--spawn", action="store_true", help="自动启动 serve.py bypass（端口取自 --service）")
+    run_parser.add_argument("--startup-timeout", type=int, default=120)
+    run_parser.add_argument("--challenge", choices=CHALLENGE_KINDS, default="cookie")
+    run_parser.add_argument("--challenge-port", type=int, default=0)
+    run_parser.add_argument("--delay-ms", type=int, default=1500, help="过渡页停留时间")
+    run_parser.add_argument("--js-work", type=int, default=200000, help="js 过渡页的计算量")
+    run_parser.add_argument("--domains", type=int, default=1000, help="轮换的子域名数（0 表示全部同一域名）")
+    run_parser.add_argument("--requests", type=int, default=20, help="/solve 次数")
+    run_parser.add_argument("--health-requests", type=int, default=200, help="/health 次数（0 表示跳过）")
+    run_parser.add_argument("--session-requests", type=int, default=200, help="/get_session 次数")
+    run_parser.add_argument("--batches", type=int, default=0, help="/solve_batch 次数（0 表示跳过）")
+    run_parser.add_argument("--batch-size", type=int, default=8, help="每次 /solve_batch 的 URL 数")
+    run_parser.add_argument("--concurrency", type=int, default=4)
+    run_parser.add_argument("--timeout", type=int, default=60)
+    run_parser.add_argument("--wait-mode", choices=("adaptive", "fixed"), default="adaptive")
+    run_parser.add_argument("--memory-interval", type=float, default=1.0)
+    run_parser.add_argument("--output", default=None, help="默认 bench_results/bench_<时间>.json")
+    run_parser.set_defaults(func=run_benchmark)
+
+    compare_parser = subparsers.add_parser("compare", help="对比两份结果")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.set_defaults(func=compare_reports)
+
+    server_parser = subparsers.add_parser("server", help="只启动模拟过渡页")
+    server_parser.add_argument("--port", type=int, default=8900)
+    server_parser.set_defaults(func=serve_challenge_pages)
+
+    args = parser.parse_args()
+    result = args.func(args)
+    if args.command == "run" and result is None:
+        sys.exit(1)
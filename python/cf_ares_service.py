@@ -7,8 +7,13 @@ from flask import Flask, request, jsonify
 from cf_ares import AresClient, CloudflareChallengeFailed, CloudflareSessionExpired
 import json
 import os
+import time
 from datetime import datetime
 
+from session_backends import JsonFileBackend
+from session_store import SessionStore
+from session_verifier import SessionVerifier
+
 app = Flask(__name__)
 
 # 会话存储目录
@@ -18,12 +23,50 @@ os.makedirs(SESSION_DIR, exist_ok=True)
 # 活跃的客户端缓存
 active_clients = {}
 
+# 会话信息缓存（会话文件由 cf_ares 自行保存，这里只缓存解析结果）
+session_store = SessionStore(backend=JsonFileBackend(SESSION_DIR))
+
+# /verify_session：请求超时、最多读取的正文字节数、是否先用 HEAD 探测、结论缓存时间（秒）、按域名复用的客户端数
+VERIFY_TIMEOUT = int(os.environ.get("CF_VERIFY_TIMEOUT", "15"))
+VERIFY_MAX_BYTES = int(os.environ.get("CF_VERIFY_MAX_BYTES", "32768"))
+VERIFY_USE_HEAD = os.environ.get("CF_VERIFY_USE_HEAD", "1") == "1"
+VERIFY_CACHE_TTL = float(os.environ.get("CF_VERIFY_CACHE_TTL", "10"))
+VERIFY_MAX_CLIENTS = int(os.environ.get("CF_VERIFY_MAX_CLIENTS", "64"))
+# /verify_sessions：默认并发数和单次最多会话数
+VERIFY_BATCH_CONCURRENCY = int(os.environ.get("CF_VERIFY_BATCH_CONCURRENCY", "8"))
+VERIFY_BATCH_MAX = int(os.environ.get("CF_VERIFY_BATCH_MAX", "200"))
+
+session_verifier = SessionVerifier(
+    lambda: AresClient(timeout=VERIFY_TIMEOUT),
+    expired_errors=(CloudflareSessionExpired,),
+    max_bytes=VERIFY_MAX_BYTES,
+    use_head=VERIFY_USE_HEAD,
+    cache_ttl=VERIFY_CACHE_TTL,
+    max_clients=VERIFY_MAX_CLIENTS
+)
+
 def get_session_file(url):
     """根据 URL 生成会话文件名"""
     from urllib.parse import urlparse
     domain = urlparse(url).netloc.replace(":", "_")
     return os.path.join(SESSION_DIR, f"session_{domain}.json")
 
+def load_session_info(url):
+    """返回 session_store 使用的加载函数：通过 cf_ares 读取会话文件并提取 cookies / UA"""
+    def loader(session_file):
+        client = AresClient()
+        try:
+            client.load_session(session_file)
+            session_info = client.get_session_info(url)
+        finally:
+            client.close()
+        return {
+            "cookies": session_info.get('cookies', {}),
+            "user_agent": session_info.get('user_agent', ''),
+            "timestamp": datetime.fromtimestamp(os.path.getmtime(session_file)).isoformat()
+        }
+    return loader
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查"""
@@ -31,7 +74,9 @@ def health_check():
         "status": "ok",
         "service": "CF-Ares Service",
         "version": "1.0.0",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "session_store": session_store.stats(),
+        "session_verifier": session_verifier.stats()
     })
 
 @app.route('/solve', methods=['POST'])
@@ -96,6 +141,11 @@ def solve_challenge():
         # 保存会话
         session_file = get_session_file(url)
         client.save_session(session_file)
+        session_store.put(session_file, {
+            "cookies": cookies,
+            "user_agent": user_agent,
+            "timestamp": datetime.now().isoformat()
+        }, persist=False)
         
         print(f"[{datetime.now()}] 会话已保存: {session_file}")
         print(f"  - Cookies: {len(cookies)} 个")
@@ -158,19 +208,16 @@ def get_session():
         
         session_file = get_session_file(url)
         
-        if not os.path.exists(session_file):
+        # 加载会话（内存命中且文件未变化时不再重新解析）
+        session_info = session_store.get(session_file, loader=load_session_info(url))
+        
+        if session_info is None:
             return jsonify({
                 "success": False,
                 "exists": False,
                 "message": "会话不存在"
             })
         
-        # 加载会话
-        client = AresClient()
-        client.load_session(session_file)
-        
-        session_info = client.get_session_info(url)
-        
         return jsonify({
             "success": True,
             "exists": True,
@@ -185,6 +232,19 @@ def get_session():
             "error": str(e)
         }), 500
 
+def resolve_verify_item(item):
+    """请求中没有带 cookies 时使用该 URL 已保存的会话，返回 (url, cookies, user_agent)，会话不存在时 cookies 为 None"""
+    url = item.get('url')
+    cookies = item.get('cookies')
+    user_agent = item.get('user_agent')
+    if cookies is None:
+        session_info = session_store.get(get_session_file(url), loader=load_session_info(url))
+        if session_info is None:
+            return url, None, user_agent
+        cookies = session_info.get('cookies', {})
+        user_agent = user_agent or session_info.get('user_agent')
+    return url, cookies, user_agent
+
 @app.route('/verify_session', methods=['POST'])
 def verify_session():
     """
@@ -193,7 +253,7 @@ def verify_session():
     请求体:
     {
         "url": "https://m.iyf.tv/",
-        "cookies": {...},
+        "cookies": {...},          // 可选，不传时使用该 URL 已保存的会话
         "user_agent": "..."
     }
     
@@ -201,45 +261,94 @@ def verify_session():
     {
         "success": true,
         "valid": true,
+        "status_code": 200,
+        "probe": "head",           // head / get（HEAD 无法判断时读取少量正文）/ expired
+        "cached": false,           // 为 true 时是 CF_VERIFY_CACHE_TTL 秒内的缓存结论
+        "elapsed": 0.09,
         "message": "会话有效"
     }
     """
     try:
         data = request.get_json()
-        url = data.get('url')
-        cookies = data.get('cookies')
-        user_agent = data.get('user_agent')
         
-        if not url:
+        if not data or not data.get('url'):
             return jsonify({"success": False, "error": "URL is required"}), 400
         
-        # 创建客户端并设置 cookies
-        client = AresClient()
+        url, cookies, user_agent = resolve_verify_item(data)
+        if cookies is None:
+            return jsonify({"success": True, "valid": False, "exists": False, "message": "会话不存在"})
         
-        # 手动设置 cookies
-        for name, value in cookies.items():
-            client.cookies[name] = value
+        verdict = session_verifier.verify(url, cookies, user_agent)
         
-        # 尝试访问
-        try:
-            response = client.get(url)
-            
-            # 检查是否被 Cloudflare 拦截
-            is_valid = response.status_code == 200 and 'cloudflare' not in response.text.lower()
-            
-            return jsonify({
-                "success": True,
-                "valid": is_valid,
-                "status_code": response.status_code,
-                "message": "会话有效" if is_valid else "会话已过期"
-            })
-            
-        except CloudflareSessionExpired:
-            return jsonify({
-                "success": True,
-                "valid": False,
-                "message": "会话已过期"
-            })
+        return jsonify({
+            "success": True,
+            **verdict,
+            "message": "会话有效" if verdict['valid'] else "会话已过期"
+        })
+        
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@app.route('/verify_sessions', methods=['POST'])
+def verify_sessions():
+    """
+    并发验证多个会话
+    
+    请求体:
+    {
+        "sessions": [
+            {"url": "https://m.iyf.tv/", "cookies": {...}, "user_agent": "..."},
+            {"url": "https://example.com/"}          // 不带 cookies 时使用已保存的会话
+        ],
+        "concurrency": 8                              // 可选
+    }
+    
+    响应:
+    {
+        "success": true,
+        "results": [{"url": "...", "valid": true, "status_code": 200, "cached": false, ...}],
+        "valid": 1,
+        "invalid": 1,
+        "elapsed": 0.4
+    }
+    """
+    try:
+        data = request.get_json()
+        sessions = data.get('sessions') if data else None
+        
+        if not sessions or not isinstance(sessions, list):
+            return jsonify({"success": False, "error": "sessions must be a non-empty list"}), 400
+        if len(sessions) > VERIFY_BATCH_MAX:
+            return jsonify({"success": False, "error": f"too many sessions ({len(sessions)} > {VERIFY_BATCH_MAX})"}), 400
+        if any(not isinstance(item, dict) or not item.get('url') for item in sessions):
+            return jsonify({"success": False, "error": "every session needs a url"}), 400
+        
+        started = time.monotonic()
+        items = []
+        missing = {}
+        for index, item in enumerate(sessions):
+            url, cookies, user_agent = resolve_verify_item(item)
+            if cookies is None:
+                missing[index] = {"url": url, "valid": False, "exists": False, "message": "会话不存在"}
+            else:
+                items.append({"url": url, "cookies": cookies, "user_agent": user_agent})
+        
+        verified = iter(session_verifier.verify_many(items, data.get('concurrency', VERIFY_BATCH_CONCURRENCY)))
+        results = [missing[index] if index in missing else next(verified) for index in range(len(sessions))]
+        valid = sum(1 for result in results if result.get('valid'))
+        
+        print(f"[{datetime.now()}] 批量验证 {len(results)} 个会话: 有效 {valid} 个 ({time.monotonic() - started:.2f}s)")
+        
+        return jsonify({
+            "success": True,
+            "results": results,
+            "valid": valid,
+            "invalid": len(results) - valid,
+            "elapsed": round(time.monotonic() - started, 3)
+        })
         
     except Exception as e:
         return jsonify({
@@ -271,6 +380,21 @@ def close_client():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def start_background_workers():
+    """CF-Ares 服务没有常驻后台线程"""
+
+def cleanup():
+    """关闭缓存的客户端并落盘会话"""
+    print("\n正在清理资源...")
+    for client in list(active_clients.values()):
+        try:
+            client.close()
+        except Exception:
+            pass
+    active_clients.clear()
+    session_verifier.close()
+    session_store.close()
+
 if __name__ == '__main__':
     print("=" * 60)
     print("🚀 Cloudflare 绕过服务启动中...")
@@ -283,7 +407,13 @@ if __name__ == '__main__':
     print("  POST /solve           - 解决 Cloudflare 挑战")
     print("  POST /get_session     - 获取已保存的会话")
     print("  POST /verify_session  - 验证会话是否有效")
+    print("  POST /verify_sessions - 批量并发验证会话")
     print("  POST /close_client    - 关闭客户端")
+    print("\n💡 生产环境请使用: python serve.py ares")
     print("\n" + "=" * 60)
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    # debug=True 会启用重载器（双进程）和调试器，仅在需要时通过 CF_DEBUG=1 打开
+    try:
+        app.run(host='0.0.0.0', port=5000, debug=os.environ.get("CF_DEBUG") == "1")
+    finally:
+        cleanup()
@@ -0,0 +1,21 @@
+"""
+Cloudflare 绕过服务的 Python 客户端（集成参考实现，同时用作压测工具）
+
+- BypassClient: 同步客户端，requests 连接池 + keep-alive
+- AsyncBypassClient: asyncio 客户端（需要 aiohttp）
+- 5xx / 429 / 连接错误按指数退避重试，批量接口 solve_many / get_sessions
+- python -m cf_bypass_client replay urls.txt --rps 5: 按目标 RPS 回放 URL 列表
+"""
+
+from .async_client import AsyncBypassClient
+from .client import RETRY_STATUSES, BypassClient, BypassError
+from .replay import load_targets, replay
+
+__all__ = [
+    "AsyncBypassClient",
+    "BypassClient",
+    "BypassError",
+    "RETRY_STATUSES",
+    "load_targets",
+    "replay",
+]
@@ -0,0 +1,67 @@
+"""
+命令行入口
+
+用法:
+    python -m cf_bypass_client health
+    python -m cf_bypass_client solve https://m.iyf.tv/
+    python -m cf_bypass_client replay urls.txt --rps 5 --duration 60 --output replay.json
+    python -m cf_bypass_client replay urls.txt --endpoint get_session --rps 50
+"""
+
+import argparse
+import json
+import sys
+
+from .client import BypassClient, BypassError
+from .replay import ENDPOINTS, run
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="cf_bypass_client", description="Cloudflare 绕过服务客户端")
+    parser.add_argument("--base-url", default="http://localhost:5000", help="服务地址")
+    parser.add_argument("--retries", type=int, default=3, help="5xx / 连接错误的重试次数")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("health", help="查看服务状态")
+
+    solve = subparsers.add_parser("solve", help="求解单个 URL")
+    solve.add_argument("url")
+    solve.add_argument("--headed", action="store_true", help="显示浏览器窗口")
+    solve.add_argument("--timeout", type=int, default=60)
+
+    session = subparsers.add_parser("get_session", help="获取已保存的会话")
+    session.add_argument("url")
+
+    replay = subparsers.add_parser("replay", help="按目标 RPS 回放 URL 列表")
+    replay.add_argument("urls", help="URL 列表文件（每行一个 URL 或 JSON 对象）")
+    replay.add_argument("--rps", type=float, default=1.0, help="目标每秒请求数")
+    replay.add_argument("--duration", type=float, help="运行秒数（循环使用列表）；不指定则发送一轮")
+    replay.add_argument("--endpoint", choices=ENDPOINTS, default="solve")
+    replay.add_argument("--max-in-flight", type=int, default=64, help="最大在途请求数，超过则跳过")
+    replay.add_argument("--timeout", type=int, default=60, help="求解超时（秒）")
+    replay.add_argument("--wait-mode", help="求解等待模式（fixed / adaptive）")
+    replay.add_argument("--headed", action="store_true", help="显示浏览器窗口")
+    replay.add_argument("--output", help="把报告写入 JSON 文件")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "replay":
+        run(args)
+        return 0
+
+    with BypassClient(args.base_url, retries=args.retries) as client:
+        try:
+            if args.command == "health":
+                result = client.health()
+            elif args.command == "solve":
+                result = client.solve(args.url, headless=not args.headed, timeout=args.timeout)
+            else:
+                result = client.get_session(args.url)
+        except BypassError as e:
+            result = e.payload or {"success": False, "error": str(e)}
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    return 0 if result.get("success", True) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
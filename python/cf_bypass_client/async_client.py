@@ -0,0 +1,204 @@
+"""
+asyncio 客户端：aiohttp 连接池（需要 pip install aiohttp），接口与 BypassClient 一致
+"""
+
+import asyncio
+import json
+import time
+
+try:
+    import aiohttp
+except ImportError:  # 可选依赖，只有异步客户端需要
+    aiohttp = None
+
+from .client import RETRY_STATUSES, BypassError, _error_message, _should_retry, backoff_delay
+
+
+class AsyncBypassClient:
+    """
+    Cloudflare 绕过服务的 asyncio 客户端
+
+        async with AsyncBypassClient("http://localhost:5000") as client:
+            result = await client.solve("https://m.iyf.tv/")
+            results = await client.solve_many(urls, concurrency=32)
+    """
+
+    def __init__(self, base_url="http://localhost:5000", timeout=120, retries=3, backoff=0.5, max_backoff=8.0,
+                 pool_size=64, retry_statuses=RETRY_STATUSES):
+        if aiohttp is None:
+            raise ImportError("AsyncBypassClient 需要 aiohttp: pip install aiohttp")
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = tuple(retry_statuses)
+        self.pool_size = pool_size
+        self.stats = {"requests": 0, "retries": 0, "errors": 0}
+        self._http = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @property
+    def http(self):
+        # 在事件循环内惰性创建会话
+        if self._http is None:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=30)
+            self._http = aiohttp.ClientSession(connector=connector)
+        return self._http
+
+    async def close(self):
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    async def request(self, method, path, json=None, params=None, timeout=None, headers=None):
+        """发送请求并返回 JSON；可重试的错误按退避重试，最终失败时抛出 BypassError"""
+        url = f"{self.base_url}{path}"
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+
+        for attempt in range(self.retries + 1):
+            self.stats["requests"] += 1
+            try:
+                async with self.http.request(method, url, json=json, params=params, headers=headers,
+                                             timeout=client_timeout) as response:
+                    status = response.status
+                    retry_after = response.headers.get("Retry-After")
+                    try:
+                        payload = await response.json(content_type=None)
+                    except ValueError:
+                        payload = None
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt < self.retries:
+                    await self._sleep_before_retry(attempt)
+                    continue
+                self.stats["errors"] += 1
+                raise BypassError(f"请求失败: {e}") from e
+
+            if _should_retry(status, payload, self.retry_statuses) and attempt < self.retries:
+                await self._sleep_before_retry(attempt, retry_after)
+                continue
+            if status >= 400:
+                self.stats["errors"] += 1
+                raise BypassError(_error_message(status, payload), status, payload)
+            if payload is None:
+                self.stats["errors"] += 1
+                raise BypassError("响应不是 JSON", status)
+            return payload
+
+    async def _sleep_before_retry(self, attempt, retry_after=None):
+        self.stats["retries"] += 1
+        await asyncio.sleep(backoff_delay(attempt, self.backoff, self.max_backoff, retry_after))
+
+    # ---- 接口 ----
+
+    async def health(self):
+        return await self.request("GET", "/health")
+
+    async def solve(self, url, headless=True, timeout=60, request_id=None, **options):
+        body = {"url": url, "headless": headless, "timeout": timeout, **options}
+        headers = {"X-Request-ID": request_id} if request_id else None
+        return await self.request("POST", "/solve", json=body, timeout=max(self.timeout, timeout + 30),
+                                  headers=headers)
+
+    async def submit_solve(self, url, headless=True, timeout=60, **options):
+        body = {"url": url, "headless": headless, "timeout": timeout, "async": True, **options}
+        return (await self.request("POST", "/solve", json=body))["job_id"]
+
+    async def job(self, job_id, wait=0):
+        return await self.request("GET", f"/jobs/{job_id}", params={"wait": wait} if wait else None,
+                                  timeout=self.timeout + wait)
+
+    async def wait_job(self, job_id, timeout=120, poll=30):
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            job = await self.job(job_id, wait=max(min(poll, remaining), 0))
+            if job.get("status") in ("succeeded", "failed", "cancelled") or remaining <= 0:
+                return job
+
+    async def cancel(self, request_id=None, job_id=None):
+        """取消进行中的求解：request_id 为同步请求发送的 X-Request-ID，job_id 为异步任务 id"""
+        body = {"job_id": job_id} if job_id else {"request_id": request_id}
+        return await self.request("POST", "/cancel", json=body)
+
+    async def cancel_job(self, job_id):
+        return await self.request("DELETE", f"/jobs/{job_id}")
+
+    async def get_session(self, url, proxy=None):
+        """proxy: 会话是通过代理求解的时候传同一个代理"""
+        return await self.request("POST", "/get_session", json={"url": url, **({"proxy": proxy} if proxy else {})})
+
+    async def fetch(self, url, **options):
+        return await self.request("POST", "/fetch", json={"url": url, **options})
+
+    async def fetch_many(self, urls, **options):
+        return await self.request("POST", "/fetch_many", json={"urls": list(urls), **options})
+
+    async def proxy_fetch(self, url, **options):
+        body = {"url": url, **options}
+        timeout = options.get('timeout', 15) + options.get('solve_timeout', 60) + 30
+        return await self.request("POST", "/proxy_fetch", json=body, timeout=max(self.timeout, timeout))
+
+    async def close_driver(self, driver_id):
+        return await self.request("POST", "/close_driver", json={"driver_id": driver_id})
+
+    async def close_all(self):
+        return await self.request("POST", "/close_all", json={})
+
+    # ---- 批量 ----
+
+    async def _map(self, fn, items, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def call(item):
+            async with semaphore:
+                try:
+                    return await fn(item)
+                except BypassError as e:
+                    return {"success": False, "error": str(e), "status": e.status}
+
+        return await asyncio.gather(*(call(item) for item in items))
+
+    async def solve_many(self, urls, concurrency=4, **options):
+        """并发求解多个 URL，结果顺序与 urls 一致；单个失败不会中断其余请求"""
+        async def one(url):
+            return {"url": url, **await self.solve(url, **options)}
+        return await self._map(one, urls, concurrency)
+
+    def solve_events(self, url, headless=True, timeout=60, **options):
+        """流式求解，逐个产出进度事件（async for），最后一条为 result 事件"""
+        body = {"url": url, "headless": headless, "timeout": timeout, "stream": "ndjson", **options}
+        return self._stream("/solve", body)
+
+    def solve_batch(self, urls, parallelism=None, **options):
+        """调用 /solve_batch，按完成顺序逐个产出结果（async for），最后一条为汇总"""
+        body = {"urls": list(urls), **options}
+        if parallelism:
+            body["parallelism"] = parallelism
+        return self._stream("/solve_batch", body)
+
+    async def _stream(self, path, body):
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.timeout)
+        try:
+            async with self.http.post(f"{self.base_url}{path}", json=body, timeout=timeout) as response:
+                if response.status >= 400:
+                    try:
+                        payload = await response.json(content_type=None)
+                    except ValueError:
+                        payload = None
+                    raise BypassError(_error_message(response.status, payload), response.status, payload)
+                async for line in response.content:
+                    if line.strip():
+                        yield json.loads(line)
+        except aiohttp.ClientConnectionError as e:
+            raise BypassError(f"请求失败: {e}") from e
+
+    async def get_sessions(self, urls, concurrency=8):
+        async def one(url):
+            return {"url": url, **await self.get_session(url)}
+        return await self._map(one, urls, concurrency)
@@ -0,0 +1,259 @@
+"""
+同步客户端：requests.Session 连接池 + 5xx / 连接错误指数退避重试
+"""
+
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# 默认重试的状态码（429 为任务队列已满）
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class BypassError(Exception):
+    """服务返回错误状态码或无法解析的响应"""
+
+    def __init__(self, message, status=None, payload=None):
+        super().__init__(message)
+        self.status = status
+        self.payload = payload
+
+
+def backoff_delay(attempt, backoff, max_backoff, retry_after=None):
+    """第 attempt 次重试前的等待秒数（指数退避 + 全抖动，优先使用 Retry-After）"""
+    if retry_after:
+        try:
+            return min(float(retry_after), max_backoff)
+        except ValueError:
+            pass
+    return random.uniform(0, min(backoff * 2 ** attempt, max_backoff))
+
+
+def _should_retry(status, payload, retry_statuses):
+    """服务端主动中止的请求（超过截止时间 504）重试也会再次超时，不重试"""
+    if status not in retry_statuses:
+        return False
+    return not (isinstance(payload, dict) and payload.get("deadline_exceeded"))
+
+
+def _error_message(status, payload):
+    if isinstance(payload, dict):
+        return payload.get("error") or payload.get("message") or f"HTTP {status}"
+    return f"HTTP {status}"
+
+
+class BypassClient:
+    """
+    Cloudflare 绕过服务客户端
+
+        with BypassClient("http://localhost:5000") as client:
+            result = client.solve("https://m.iyf.tv/")
+            results = client.solve_many(urls, concurrency=8)
+
+    - timeout: 单次 HTTP 请求的超时（/solve 会按请求中的 timeout 自动放宽）
+    - retries / backoff / max_backoff: 5xx、429 和连接错误的重试次数与退避参数
+    - pool_size: keep-alive 连接池大小（应不小于批量并发数）
+    """
+
+    def __init__(self, base_url="http://localhost:5000", timeout=120, retries=3, backoff=0.5, max_backoff=8.0,
+                 pool_size=16, retry_statuses=RETRY_STATUSES):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = tuple(retry_statuses)
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.http.mount("http://", adapter)
+        self.http.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "retries": 0, "errors": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.http.close()
+
+    def request(self, method, path, json=None, params=None, timeout=None, headers=None):
+        """发送请求并返回 JSON；可重试的错误按退避重试，最终失败时抛出 BypassError"""
+        url = f"{self.base_url}{path}"
+        timeout = timeout or self.timeout
+
+        for attempt in range(self.retries + 1):
+            with self._lock:
+                self.stats["requests"] += 1
+            try:
+                response = self.http.request(method, url, json=json, params=params, timeout=timeout,
+                                             headers=headers)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt < self.retries:
+                    self._sleep_before_retry(attempt)
+                    continue
+                self._count("errors")
+                raise BypassError(f"请求失败: {e}") from e
+
+            try:
+                payload = response.json()
+            except ValueError:
+                payload = None
+
+            if _should_retry(response.status_code, payload, self.retry_statuses) and attempt < self.retries:
+                self._sleep_before_retry(attempt, response.headers.get("Retry-After"))
+                continue
+
+            if response.status_code >= 400:
+                self._count("errors")
+                raise BypassError(_error_message(response.status_code, payload), response.status_code, payload)
+            if payload is None:
+                self._count("errors")
+                raise BypassError("响应不是 JSON", response.status_code)
+            return payload
+
+    def _sleep_before_retry(self, attempt, retry_after=None):
+        self._count("retries")
+        time.sleep(backoff_delay(attempt, self.backoff, self.max_backoff, retry_after))
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
+
+    # ---- 接口 ----
+
+    def health(self):
+        return self.request("GET", "/health")
+
+    def solve(self, url, headless=True, timeout=60, request_id=None, **options):
+        """
+        同步求解，返回 /solve 响应（options 如 wait_mode、use_cache、max_age、proxy、deadline）
+
+        指定 request_id 后可在其他线程中用 cancel(request_id) 取消
+        """
+        body = {"url": url, "headless": headless, "timeout": timeout, **options}
+        headers = {"X-Request-ID": request_id} if request_id else None
+        return self.request("POST", "/solve", json=body, timeout=max(self.timeout, timeout + 30), headers=headers)
+
+    def submit_solve(self, url, headless=True, timeout=60, **options):
+        """提交异步求解，返回 job_id"""
+        body = {"url": url, "headless": headless, "timeout": timeout, "async": True, **options}
+        return self.request("POST", "/solve", json=body)["job_id"]
+
+    def job(self, job_id, wait=0):
+        return self.request("GET", f"/jobs/{job_id}", params={"wait": wait} if wait else None,
+                            timeout=self.timeout + wait)
+
+    def wait_job(self, job_id, timeout=120, poll=30):
+        """长轮询直到任务结束，返回任务信息（含 result）"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            job = self.job(job_id, wait=max(min(poll, remaining), 0))
+            if job.get("status") in ("succeeded", "failed", "cancelled") or remaining <= 0:
+                return job
+
+    def cancel(self, request_id=None, job_id=None):
+        """取消进行中的求解：request_id 为同步请求发送的 X-Request-ID，job_id 为异步任务 id"""
+        body = {"job_id": job_id} if job_id else {"request_id": request_id}
+        return self.request("POST", "/cancel", json=body)
+
+    def cancel_job(self, job_id):
+        return self.request("DELETE", f"/jobs/{job_id}")
+
+    def get_session(self, url, proxy=None):
+        """proxy: 会话是通过代理求解的时候传同一个代理"""
+        return self.request("POST", "/get_session", json={"url": url, **({"proxy": proxy} if proxy else {})})
+
+    def fetch(self, url, **options):
+        return self.request("POST", "/fetch", json={"url": url, **options})
+
+    def fetch_many(self, urls, **options):
+        return self.request("POST", "/fetch_many", json={"urls": list(urls), **options})
+
+    def proxy_fetch(self, url, **options):
+        """
+        用已保存会话直接发 HTTP 请求（options 如 method、headers、json、proxy、escalate），
+        遇到挑战时服务端会自动求解，因此超时按 solve_timeout 放宽
+        """
+        body = {"url": url, **options}
+        timeout = options.get('timeout', 15) + options.get('solve_timeout', 60) + 30
+        return self.request("POST", "/proxy_fetch", json=body, timeout=max(self.timeout, timeout))
+
+    def close_driver(self, driver_id):
+        return self.request("POST", "/close_driver", json={"driver_id": driver_id})
+
+    def close_all(self):
+        return self.request("POST", "/close_all", json={})
+
+    def metrics(self):
+        """返回 /metrics 的原始文本"""
+        response = self.http.get(f"{self.base_url}/metrics", timeout=self.timeout)
+        response.raise_for_status()
+        return response.text
+
+    # ---- 批量 ----
+
+    def _map(self, fn, items, concurrency):
+        def call(item):
+            try:
+                return fn(item)
+            except BypassError as e:
+                return {"success": False, "error": str(e), "status": e.status}
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            return list(executor.map(call, items))
+
+    def solve_many(self, urls, concurrency=4, **options):
+        """并发求解多个 URL，结果顺序与 urls 一致；单个失败不会中断其余请求"""
+        return self._map(lambda url: {"url": url, **self.solve(url, **options)}, urls, concurrency)
+
+    def solve_events(self, url, headless=True, timeout=60, **options):
+        """
+        流式求解，逐个产出进度事件（driver_acquired、challenge_detected、cleared ...），
+        最后一条为 {"event": "result", "status_code": ..., "result": {...}}
+        """
+        body = {"url": url, "headless": headless, "timeout": timeout, "stream": "ndjson", **options}
+        return self._stream("/solve", body)
+
+    def solve_batch(self, urls, parallelism=None, **options):
+        """
+        调用 /solve_batch，按完成顺序逐个产出结果（最后一条为 {"done": true, "summary": ...}）
+
+        urls 中的元素可以是 URL 字符串或带单独参数的字典 {"url": ..., "proxy": ...}
+        """
+        body = {"urls": list(urls), **options}
+        if parallelism:
+            body["parallelism"] = parallelism
+        return self._stream("/solve_batch", body)
+
+    def _stream(self, path, body):
+        """POST 并逐行解析 NDJSON 响应；流式响应中途断开无法安全重试，因此不做重试"""
+        try:
+            response = self.http.post(f"{self.base_url}{path}", json=body, stream=True, timeout=(self.timeout, None))
+        except (requests.ConnectionError, requests.Timeout) as e:
+            raise BypassError(f"请求失败: {e}") from e
+
+        with response:
+            if response.status_code >= 400:
+                try:
+                    payload = response.json()
+                except ValueError:
+                    payload = None
+                raise BypassError(_error_message(response.status_code, payload), response.status_code, payload)
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+
+    def get_sessions(self, urls, concurrency=8):
+        """并发获取多个会话，结果顺序与 urls 一致"""
+        return self._map(lambda url: {"url": url, **self.get_session(url)}, urls, concurrency)
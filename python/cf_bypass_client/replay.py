@@ -0,0 +1,168 @@
+"""
+按目标 RPS 回放录制的 URL 列表（开环压测：按时间表发送，不等待上一个请求返回）
+
+URL 列表格式：每行一个 URL（# 开头为注释），或每行一个 JSON 对象 {"url": ..., 其他请求参数}
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from .client import BypassClient, BypassError
+
+ENDPOINTS = ("solve", "get_session", "fetch")
+
+
+def load_targets(path):
+    """读取 URL 列表，返回 [(url, options)]"""
+    targets = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                entry = json.loads(line)
+                url = entry.pop("url")
+                targets.append((url, entry))
+            else:
+                targets.append((line, {}))
+    return targets
+
+
+def percentile(values, pct):
+    """线性插值百分位"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def _call(client, endpoint, url, options):
+    if endpoint == "solve":
+        return client.solve(url, **options)
+    if endpoint == "get_session":
+        return client.get_session(url)
+    return client.fetch(url, **options)
+
+
+def replay(client, targets, rps, endpoint="solve", duration=None, max_in_flight=64, defaults=None):
+    """
+    以 rps 的速率循环发送 targets，直到发送完一轮（duration 为空）或运行 duration 秒
+    - 同时在途请求达到 max_in_flight 时本次发送记为 skipped（服务已跟不上，继续堆积没有意义）
+    返回统计报告
+    """
+    if not targets:
+        raise ValueError("URL 列表为空")
+    defaults = defaults or {}
+    interval = 1.0 / rps
+    total = None if duration else len(targets)
+
+    samples = []
+    statuses = Counter()
+    lags = []
+    in_flight = threading.Semaphore(max_in_flight)
+    lock = threading.Lock()
+    skipped = 0
+
+    def run_one(url, options):
+        start = time.perf_counter()
+        try:
+            result = _call(client, endpoint, url, {**defaults, **options})
+            success = bool(result.get("success"))
+            status = "ok" if success else "failed"
+        except BypassError as e:
+            success = False
+            status = str(e.status or "error")
+        finally:
+            in_flight.release()
+        with lock:
+            samples.append((success, time.perf_counter() - start))
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    sent = 0
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        while True:
+            if total is not None and sent >= total:
+                break
+            scheduled = started + sent * interval
+            if duration and scheduled - started >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            lags.append(max(0.0, time.perf_counter() - scheduled))
+
+            url, options = targets[sent % len(targets)]
+            sent += 1
+            if not in_flight.acquire(blocking=False):
+                skipped += 1
+                continue
+            executor.submit(run_one, url, options)
+        send_time = time.perf_counter() - started
+    wall_time = time.perf_counter() - started
+
+    latencies = [latency for _, latency in samples]
+    ok = sum(1 for success, _ in samples if success)
+
+    def rounded(value):
+        return round(value, 4) if value is not None else None
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "base_url": client.base_url,
+        "endpoint": endpoint,
+        "target_rps": rps,
+        "sent": sent,
+        "completed": len(samples),
+        "ok": ok,
+        "errors": len(samples) - ok,
+        "skipped": skipped,
+        "statuses": dict(statuses),
+        "offered_rps": round(sent / send_time, 3) if send_time else None,
+        "throughput_rps": round(len(samples) / wall_time, 3) if wall_time else None,
+        "wall_time": round(wall_time, 3),
+        "latency": {
+            "mean": rounded(sum(latencies) / len(latencies)) if latencies else None,
+            "p50": rounded(percentile(latencies, 50)),
+            "p90": rounded(percentile(latencies, 90)),
+            "p99": rounded(percentile(latencies, 99)),
+            "max": rounded(max(latencies)) if latencies else None,
+        },
+        "schedule_lag_p99": rounded(percentile(lags, 99)),
+        "client": dict(client.stats),
+    }
+
+
+def run(args):
+    targets = load_targets(args.urls)
+    defaults = {}
+    if args.endpoint == "solve":
+        defaults = {"headless": not args.headed, "timeout": args.timeout}
+        if args.wait_mode:
+            defaults["wait_mode"] = args.wait_mode
+
+    print(f"[{datetime.now()}] 🚀 回放 {len(targets)} 个 URL -> {args.base_url}/{args.endpoint} @ {args.rps} rps")
+    with BypassClient(args.base_url, timeout=args.timeout + 30, retries=args.retries,
+                      pool_size=args.max_in_flight) as client:
+        report = replay(client, targets, args.rps, endpoint=args.endpoint, duration=args.duration,
+                        max_in_flight=args.max_in_flight, defaults=defaults)
+
+    latency = report["latency"]
+    print(f"[{datetime.now()}] 📊 发送 {report['sent']} / 完成 {report['completed']} / 成功 {report['ok']}"
+          f" / 跳过 {report['skipped']}，吞吐 {report['throughput_rps']} rps")
+    print(f"[{datetime.now()}] ⏱️ 延迟 p50={latency['p50']}s p90={latency['p90']}s p99={latency['p99']}s"
+          f" max={latency['max']}s")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"[{datetime.now()}] 💾 报告已保存: {args.output}")
+    return report
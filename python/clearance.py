@@ -0,0 +1,146 @@
+"""
+Cloudflare 验证完成检测
+用轻量的 cookie / execute_script 探测代替固定 sleep + 读取完整 page_source
+"""
+
+import time
+
+# 验证通过后 Cloudflare 下发的 cookie
+CLEARANCE_COOKIE = "cf_clearance"
+
+# 只返回少量字段的页面探测脚本，避免每次轮询都传输整页 HTML
+PROBE_SCRIPT = """
+var title = document.title || '';
+var lower = title.toLowerCase();
+var markers = [
+    '#challenge-form',
+    '#challenge-running',
+    '#challenge-stage',
+    '#cf-challenge-running',
+    '.cf-browser-verification',
+    'iframe[src*="challenges.cloudflare.com"]',
+    'script[src*="/cdn-cgi/challenge-platform/"]'
+];
+var hasMarker = false;
+for (var i = 0; i < markers.length; i++) {
+    if (document.querySelector(markers[i])) { hasMarker = true; break; }
+}
+return {
+    url: location.href,
+    title: title,
+    ready_state: document.readyState,
+    challenge: hasMarker
+        || lower.indexOf('just a moment') !== -1
+        || lower.indexOf('checking your browser') !== -1
+        || lower.indexOf('attention required') !== -1
+        || title.indexOf('请稍候') !== -1
+};
+"""
+
+
+def probe_page(driver):
+    """执行探测脚本，返回 {url, title, ready_state, challenge}"""
+    return driver.execute_script(PROBE_SCRIPT) or {}
+
+
+def has_clearance_cookie(driver):
+    """cookie jar 中是否已有 cf_clearance"""
+    try:
+        return driver.get_cookie(CLEARANCE_COOKIE) is not None
+    except Exception:
+        return False
+
+
+def wait_for_clearance(driver, timeout, initial_interval=0.25, max_interval=2.0, backoff=1.5, cancel_event=None,
+                       on_challenge=None):
+    """
+    以指数退避轮询页面，直到验证通过或超时
+
+    判定通过的条件（任一满足）:
+    - 出现 cf_clearance cookie
+    - 页面已加载且不再包含挑战特征（标题 / 挑战表单 / challenge-platform 脚本）
+
+    传入 cancel_event 时，事件被设置后立即以 "cancelled" 返回；
+    on_challenge(state) 在第一次探测到挑战页面时调用一次
+
+    返回:
+    {
+        "cleared": true,
+        "reason": "clearance_cookie" | "no_challenge" | "redirected" | "challenge_passed" | "timeout" | "cancelled",
+        "elapsed": 1.52,          // 本函数内等待的秒数
+        "polls": 5,
+        "challenge_seen": true,
+        "url": "...",
+        "title": "..."
+    }
+    """
+    started = time.monotonic()
+    deadline = started + timeout
+    interval = initial_interval
+    polls = 0
+    challenge_seen = False
+    start_url = None
+    state = {}
+
+    while True:
+        polls += 1
+
+        if has_clearance_cookie(driver):
+            return _result(True, "clearance_cookie", started, polls, challenge_seen, state)
+
+        try:
+            state = probe_page(driver)
+        except Exception:
+            # 页面跳转过程中脚本可能执行失败，下一轮再试
+            state = {}
+
+        if state:
+            if start_url is None:
+                start_url = state.get("url")
+            if state.get("challenge"):
+                if not challenge_seen and on_challenge is not None:
+                    on_challenge(state)
+                challenge_seen = True
+            elif state.get("ready_state") != "loading":
+                if not challenge_seen:
+                    return _result(True, "no_challenge", started, polls, challenge_seen, state)
+                reason = "redirected" if state.get("url") != start_url else "challenge_passed"
+                return _result(True, reason, started, polls, challenge_seen, state)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return _result(False, "timeout", started, polls, challenge_seen, state)
+
+        if cancel_event is not None:
+            if cancel_event.wait(min(interval, remaining)):
+                return _result(False, "cancelled", started, polls, challenge_seen, state)
+        else:
+            time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
+
+
+def _result(cleared, reason, started, polls, challenge_seen, state):
+    return {
+        "cleared": cleared,
+        "reason": reason,
+        "elapsed": round(time.monotonic() - started, 3),
+        "polls": polls,
+        "challenge_seen": challenge_seen,
+        "url": state.get("url"),
+        "title": state.get("title"),
+    }
+
+
+# Navigation Timing 中的 HTTP 状态码（Chrome 109+ 支持 responseStatus）
+NAVIGATION_STATUS_SCRIPT = """
+var entries = performance.getEntriesByType('navigation');
+return entries.length && entries[0].responseStatus ? entries[0].responseStatus : null;
+"""
+
+
+def navigation_status(driver):
+    """最近一次导航的 HTTP 状态码，浏览器不支持时返回 None"""
+    try:
+        return driver.execute_script(NAVIGATION_STATUS_SCRIPT)
+    except Exception:
+        return None
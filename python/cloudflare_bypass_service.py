@@ -3,32 +3,445 @@ Cloudflare 绕过服务 - 基于 undetected-chromedriver
 提供 HTTP API 供 C# 应用调用
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 import undetected_chromedriver as uc
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+import base64
+import contextvars
+import hashlib
 import json
+import logging
 import os
+import queue
+import socket
+import threading
 import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from urllib.parse import urlparse
 
+import requests
+
+from clearance import navigation_status, wait_for_clearance
+from cluster import ClusterJobQueue, ClusterNode, SqliteBroker
+from driver_cache import DriverCache
+from driver_manager import DriverManager
+from driver_pool import DriverPool, DriverWatchdog, is_driver_alive
+from http_fast_path import HostBusy, HttpFastPath, is_text, looks_challenged, response_charset
+from job_queue import (CancelRegistry, CancelToken, JobCancelled, JobManager, JobQueueFull,
+                       SingleFlight, raise_if_cancelled)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, Registry
+from page_load import (PAGE_LOAD_STRATEGIES, PROFILES as BLOCK_PROFILES, apply_blocking, blocked_patterns,
+                       load_rules, navigate, network_usage)
+from profile_cache import ProfileCache
+import progress
+from session_backends import create_backend
+from session_refresher import SessionRefresher
+from session_store import SessionStore, parse_timestamp
+from structured_logging import (bind_request_id, configure as configure_logging, fields, get_request_id,
+                                new_request_id, reset_request_id, shutdown as shutdown_logging,
+                                stats as logging_stats, step)
+
 app = Flask(__name__)
 
+# 日志：CF_LOG_FORMAT=json 输出 JSON lines，CF_LOG_LEVEL / CF_LOG_SAMPLE_RATE 控制级别和逐步日志采样
+configure_logging()
+logger = logging.getLogger("cf_bypass")
+
 # 会话存储目录
 SESSION_DIR = "cf_sessions"
 os.makedirs(SESSION_DIR, exist_ok=True)
 
-# 活跃的浏览器实例
-active_drivers = {}
+# 驱动预热池配置（可通过环境变量覆盖）
+POOL_MIN_HEADLESS = int(os.environ.get("CF_POOL_MIN_HEADLESS", "1"))
+POOL_MIN_HEADED = int(os.environ.get("CF_POOL_MIN_HEADED", "0"))
+POOL_MAX_SIZE = int(os.environ.get("CF_POOL_MAX_SIZE", "4"))
+
+# chromedriver 补丁缓存：按 Chrome 主版本号缓存到本机共享目录，启动时不再重新探测版本和下载
+DRIVER_CACHE_ENABLED = os.environ.get("CF_DRIVER_CACHE", "1") == "1"
+DRIVER_CACHE_DIR = os.environ.get("CF_DRIVER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cf_bypass", "chromedriver"))
+CHROME_VERSION = os.environ.get("CF_CHROME_VERSION") or None
+
+# 持久化 profile：按域名（+ 代理）复用 Chrome user-data-dir，保留 HTTP 缓存和 localStorage，重复求解更快；
+# CF_PROFILES=1 时默认启用，也可在请求中用 "profile": true / false 单独指定
+PROFILES_DEFAULT = os.environ.get("CF_PROFILES", "0") == "1"
+PROFILE_DIR = os.environ.get("CF_PROFILE_DIR", "cf_profiles")
+PROFILE_MAX_COUNT = int(os.environ.get("CF_PROFILE_MAX_COUNT", "50"))
+PROFILE_MAX_TOTAL_MB = int(os.environ.get("CF_PROFILE_MAX_TOTAL_MB", "2048"))
+PROFILE_MAX_MB = int(os.environ.get("CF_PROFILE_MAX_MB", "200"))
+
+# 求解时的资源拦截：默认档位（off / media / aggressive，可在请求中用 block_resources 覆盖）和按域名规则文件
+BLOCK_PROFILE = os.environ.get("CF_BLOCK_PROFILE", "off")
+BLOCK_RULES_FILE = os.environ.get("CF_BLOCK_RULES", "")
+# 页面加载策略 normal / eager / none（eager / none 时 driver.get 提前返回，由验证轮询判断结果）
+PAGE_LOAD_STRATEGY = os.environ.get("CF_PAGE_LOAD_STRATEGY", "normal")
+# 通过 performance 日志统计每次求解的传输字节数（默认关闭：开启后 chromedriver 会为每个浏览器缓存全部网络事件，
+# 预热池和常驻驱动空闲时也在累积，只在每次求解 / 抓取和归还预热池时清空）
+NETWORK_STATS = os.environ.get("CF_NETWORK_STATS", "0") == "1"
+
+block_rules = load_rules(BLOCK_RULES_FILE)
+
+# /proxy_fetch：用已保存会话直接发 HTTP 请求的连接池（每主机并发上限、HTTP/2）
+PROXY_FETCH_MAX_HOSTS = int(os.environ.get("CF_PROXY_FETCH_MAX_HOSTS", "32"))
+PROXY_FETCH_PER_HOST = int(os.environ.get("CF_PROXY_FETCH_PER_HOST", "8"))
+PROXY_FETCH_HTTP2 = os.environ.get("CF_PROXY_FETCH_HTTP2", "1") == "1"
+PROXY_FETCH_TIMEOUT = int(os.environ.get("CF_PROXY_FETCH_TIMEOUT", "15"))
+PROXY_FETCH_MAX_BYTES = int(os.environ.get("CF_PROXY_FETCH_MAX_BYTES", str(10 * 1024 * 1024)))
+# 重新求解后 HTTP 仍被挑战的主机，在这段时间内直接走浏览器（秒）
+PROXY_FETCH_BROWSER_TTL = int(os.environ.get("CF_PROXY_FETCH_BROWSER_TTL", "600"))
+
+# 已求解驱动的生命周期：空闲回收时间、最多导航次数、数量 / 内存上限
+DRIVER_IDLE_TTL = int(os.environ.get("CF_DRIVER_IDLE_TTL", "300"))
+DRIVER_MAX_USES = int(os.environ.get("CF_DRIVER_MAX_USES", "50"))
+MAX_ACTIVE_DRIVERS = int(os.environ.get("CF_MAX_ACTIVE_DRIVERS", "20"))
+DRIVER_MEMORY_LIMIT_MB = int(os.environ.get("CF_DRIVER_MEMORY_LIMIT_MB", "4096"))
+
+# 异步任务配置
+JOB_WORKERS = int(os.environ.get("CF_JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.environ.get("CF_JOB_QUEUE_SIZE", "100"))
+JOB_RETENTION = int(os.environ.get("CF_JOB_RETENTION", "600"))
+JOB_MAX_WAIT = 60
+
+# 取消与截止时间：默认截止时间为 timeout + CF_SOLVE_DEADLINE_GRACE 秒（覆盖取驱动、导航、等待、保存），
+# 取消后驱动 CF_CANCEL_GRACE 秒内仍卡在浏览器调用上则强杀
+SOLVE_DEADLINE_GRACE = int(os.environ.get("CF_SOLVE_DEADLINE_GRACE", "30"))
+CANCEL_GRACE = float(os.environ.get("CF_CANCEL_GRACE", "3"))
+
+# /solve_batch：所有批量请求共享的最大并行求解数、单次最多 URL 数
+BATCH_PARALLELISM = int(os.environ.get("CF_BATCH_PARALLELISM", str(POOL_MAX_SIZE)))
+BATCH_MAX_URLS = int(os.environ.get("CF_BATCH_MAX_URLS", "1000"))
+
+# 集群模式：CF_CLUSTER_DB 指向各节点共享的 SQLite 文件（会话库 + 任务队列 + 求解租约），为空时不启用
+CLUSTER_DB = os.environ.get("CF_CLUSTER_DB", "")
+CLUSTER_NODE_ID = os.environ.get("CF_CLUSTER_NODE_ID", f"{socket.gethostname()}-{os.getpid()}")
+# 其他节点转发同域名请求时使用的地址，如 http://10.0.0.5:5000；为空时本节点不接收转发
+CLUSTER_ADVERTISE_URL = os.environ.get("CF_CLUSTER_ADVERTISE_URL", "")
+CLUSTER_LEASE_TTL = int(os.environ.get("CF_CLUSTER_LEASE_TTL", "30"))
+CLUSTER_AFFINITY_GRACE = float(os.environ.get("CF_CLUSTER_AFFINITY_GRACE", "5"))
+
+# 会话缓存配置：/solve 默认是否先查缓存，以及缓存会话的最长保存时间（秒）
+SOLVE_USE_CACHE = os.environ.get("CF_SOLVE_USE_CACHE", "0") == "1"
+SESSION_MAX_AGE = int(os.environ.get("CF_SESSION_MAX_AGE", "1800"))
+
+# 会话持久化后端: "json"（每个域名一个文件）或 "sqlite"
+# 集群模式下默认与其他节点共用 CF_CLUSTER_DB
+SESSION_BACKEND = os.environ.get("CF_SESSION_BACKEND", "sqlite" if CLUSTER_DB else "json")
+SESSION_DB = os.environ.get("CF_SESSION_DB", CLUSTER_DB or os.path.join(SESSION_DIR, "sessions.db"))
+
+# 内存会话存储上限
+SESSION_STORE_MAX_ENTRIES = int(os.environ.get("CF_SESSION_STORE_MAX_ENTRIES", "1000"))
+SESSION_STORE_MAX_BYTES = int(os.environ.get("CF_SESSION_STORE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+# 会话后台刷新：cookie 过期前 REFRESH_LEAD_TIME 秒重新求解
+REFRESH_ENABLED = os.environ.get("CF_REFRESH_ENABLED", "1") == "1"
+REFRESH_LEAD_TIME = int(os.environ.get("CF_REFRESH_LEAD_TIME", "300"))
+REFRESH_JITTER = int(os.environ.get("CF_REFRESH_JITTER", "60"))
+REFRESH_CONCURRENCY = int(os.environ.get("CF_REFRESH_CONCURRENCY", "2"))
+REFRESH_IDLE_CUTOFF = int(os.environ.get("CF_REFRESH_IDLE_CUTOFF", "3600"))
+
+MOBILE_USER_AGENT = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1"
+
+def apply_mobile_emulation(driver, user_agent=None):
+    """使用 CDP 设置移动设备模拟（iPhone），user_agent 为空时使用 MOBILE_USER_AGENT"""
+    step(logger, "📱 设置移动设备指标...")
+    try:
+        driver.execute_cdp_cmd("Emulation.setDeviceMetricsOverride", {
+            "width": 390,
+            "height": 844,
+            "deviceScaleFactor": 3,
+            "mobile": True,
+            "screenWidth": 390,
+            "screenHeight": 844,
+            "positionX": 0,
+            "positionY": 0
+        })
+        
+        driver.execute_cdp_cmd("Emulation.setTouchEmulationEnabled", {
+            "enabled": True,
+            "configuration": "mobile"
+        })
+        
+        driver.execute_cdp_cmd("Emulation.setUserAgentOverride", {
+            "userAgent": user_agent or MOBILE_USER_AGENT,
+            "platform": "iPhone"
+        })
+        
+        step(logger, "✅ 移动设备模拟已设置 (iPhone 12 Pro)")
+    except Exception as e:
+        logger.warning("⚠️  移动设备设置失败，将使用桌面模式: %s", e)
+
+driver_cache = DriverCache(DRIVER_CACHE_DIR, enabled=DRIVER_CACHE_ENABLED, chrome_version_override=CHROME_VERSION)
+
+profile_cache = ProfileCache(
+    PROFILE_DIR,
+    max_profiles=PROFILE_MAX_COUNT,
+    max_total_bytes=PROFILE_MAX_TOTAL_MB * 1024 ** 2,
+    max_profile_bytes=PROFILE_MAX_MB * 1024 ** 2
+)
+
+def create_driver(headless, proxy=None, user_data_dir=None, refill=False, user_agent=None):
+    """
+    启动一个新的 undetected-chromedriver 实例并应用移动设备模拟（user_data_dir 为持久化 profile 目录，
+    user_agent 覆盖默认的 MOBILE_USER_AGENT）
+    
+    refill=True 表示预热池后台补充，耗时记为 refill_launch / refill_cdp_setup，不计入求解路径的 launch / cdp_setup
+    """
+    phase_prefix = "refill_" if refill else ""
+    # 配置 Chrome 选项
+    options = uc.ChromeOptions()
+    
+    if headless:
+        options.add_argument('--headless=new')
+    
+    if proxy:
+        options.add_argument(f'--proxy-server={proxy}')
+    
+    # 其他选项
+    options.add_argument('--disable-blink-features=AutomationControlled')
+    options.add_argument('--disable-dev-shm-usage')
+    options.add_argument('--no-sandbox')
+    options.add_argument('--disable-gpu')
+    
+    if PAGE_LOAD_STRATEGY in PAGE_LOAD_STRATEGIES:
+        options.page_load_strategy = PAGE_LOAD_STRATEGY
+    if NETWORK_STATS:
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    
+    if user_data_dir:
+        for argument in profile_cache.chrome_arguments():
+            options.add_argument(argument)
+        launch_options = {**driver_cache.launch_options(), "user_data_dir": os.path.abspath(user_data_dir)}
+    else:
+        launch_options = driver_cache.launch_options()
+    
+    step(logger, "🔧 启动 undetected-chromedriver (headless=%s)...", headless)
+    progress.emit("driver_launching", headless=headless, proxy=bool(proxy))
+    
+    # 创建驱动（使用缓存的 chromedriver，首次调用时解析 / 下载）
+    launch_started = time.perf_counter()
+    with solve_phase_seconds.time(phase=phase_prefix + "launch"):
+        driver = uc.Chrome(options=options, **launch_options)
+    launch_seconds = time.perf_counter() - launch_started
+    driver_cache.record_launch(launch_seconds)
+    
+    logger.info("✅ 浏览器启动成功 (%.0fms, chromedriver 缓存=%s)", launch_seconds * 1000,
+                "是" if 'driver_executable_path' in launch_options else "否",
+                extra=fields(launch_ms=round(launch_seconds * 1000, 1), headless=headless,
+                             patch_cache='driver_executable_path' in launch_options, profile=user_data_dir))
+    progress.emit("driver_launched", launch_ms=round(launch_seconds * 1000, 1))
+    
+    with solve_phase_seconds.time(phase=phase_prefix + "cdp_setup"):
+        apply_mobile_emulation(driver, user_agent)
+    return driver
+
+def create_profile_driver(headless, proxy, lease, user_agent=None):
+    """用持久化 profile 启动驱动；驱动关闭时（预热池 on_quit 回调）归还 profile"""
+    try:
+        driver = create_driver(headless, proxy, lease.path, user_agent=user_agent)
+    except Exception:
+        lease.release()
+        raise
+    profile_cache.attach(lease, driver)
+    return driver
+
+driver_pool = DriverPool(
+    create_driver,
+    min_sizes={True: POOL_MIN_HEADLESS, False: POOL_MIN_HEADED},
+    max_size=POOL_MAX_SIZE,
+    on_quit=profile_cache.release_driver,
+    refill_factory=lambda headless: create_driver(headless, refill=True)
+)
+
+# 活跃的浏览器实例（/solve 成功后保留的驱动）
+active_drivers = DriverManager(
+    driver_pool.release,
+    driver_pool.discard,
+    idle_ttl=DRIVER_IDLE_TTL,
+    max_uses=DRIVER_MAX_USES,
+    max_drivers=MAX_ACTIVE_DRIVERS,
+    max_rss_bytes=DRIVER_MEMORY_LIMIT_MB * 1024 * 1024
+)
+
+if CLUSTER_DB:
+    cluster_node = ClusterNode(
+        SqliteBroker(CLUSTER_DB),
+        CLUSTER_NODE_ID,
+        CLUSTER_ADVERTISE_URL,
+        lease_ttl=CLUSTER_LEASE_TTL,
+        retention=JOB_RETENTION
+    )
+    # 异步任务写入共享队列，由域名归属节点认领
+    job_manager = ClusterJobQueue(
+        cluster_node,
+        {"solve": lambda params, cancel_event: run_solve(params, cancel_event)},
+        max_workers=JOB_WORKERS,
+        max_queue=JOB_QUEUE_SIZE,
+        retention=JOB_RETENTION,
+        affinity_grace=CLUSTER_AFFINITY_GRACE
+    )
+else:
+    cluster_node = None
+    job_manager = JobManager(
+        max_workers=JOB_WORKERS,
+        max_queue=JOB_QUEUE_SIZE,
+        retention=JOB_RETENTION
+    )
+
+# 同域名并发 /solve 合并为一次求解
+solve_flights = SingleFlight()
+
+# 进行中的同步请求（按关联 id），供 /cancel 取消
+inflight_requests = CancelRegistry()
+
+# 所有 /solve_batch 请求共享的求解名额，多个批量请求同时进行时总并行数也不会超过上限
+batch_slots = threading.BoundedSemaphore(BATCH_PARALLELISM)
+
+session_store = SessionStore(
+    backend=create_backend(SESSION_BACKEND, SESSION_DIR, SESSION_DB),
+    max_entries=SESSION_STORE_MAX_ENTRIES,
+    max_bytes=SESSION_STORE_MAX_BYTES,
+    default_ttl=SESSION_MAX_AGE
+)
 
-def get_session_file(url):
-    """根据 URL 生成会话文件名"""
+def refresh_session(session_file, session_data):
+    """后台刷新一个会话：重新求解后立即归还驱动"""
+    url = session_data.get('url')
+    if not url:
+        # 旧格式的会话文件没有记录 URL，无法刷新
+        return False
+    
+    # 沿用原会话的代理和 User-Agent，刷新结果写回同一个会话（cf_clearance 与 IP / UA 绑定）
+    solve_data = {"url": url, "headless": True, "use_cache": False}
+    for field in ('proxy', 'user_agent'):
+        if session_data.get(field):
+            solve_data[field] = session_data[field]
+    
+    token = bind_request_id(f"refresh-{new_request_id()[:6]}")
+    try:
+        payload, _ = run_solve(solve_data)
+    finally:
+        reset_request_id(token)
+    
+    if not payload.get('coalesced') and payload.get('driver_id'):
+        active_drivers.close(payload['driver_id'])
+    
+    return bool(payload.get('success'))
+
+session_refresher = SessionRefresher(
+    session_store,
+    refresh_session,
+    lead_time=REFRESH_LEAD_TIME,
+    jitter=REFRESH_JITTER,
+    max_concurrent=REFRESH_CONCURRENCY,
+    idle_cutoff=REFRESH_IDLE_CUTOFF
+)
+
+# Prometheus 指标（/metrics）
+metrics_registry = Registry()
+
+solve_phase_seconds = metrics_registry.histogram(
+    "cf_solve_phase_seconds",
+    "求解各阶段耗时（秒）: launch / cdp_setup / acquire / navigate / wait / save_cookies / response；"
+    "预热池后台补充的启动耗时记为 refill_launch / refill_cdp_setup",
+    ["phase"]
+)
+solve_duration_seconds = metrics_registry.histogram(
+    "cf_solve_duration_seconds", "一次求解的总耗时（秒），source 为 browser / cache / coalesced", ["source"]
+)
+solve_time_to_cookie_seconds = metrics_registry.histogram(
+    "cf_solve_time_to_cookie_seconds", "从开始求解到 cookie 保存完成的秒数", ["block_profile"]
+)
+solve_transfer_bytes_total = metrics_registry.counter(
+    "cf_solve_transfer_bytes_total", "求解过程中浏览器传输的字节数", ["block_profile"]
+)
+solve_blocked_requests_total = metrics_registry.counter(
+    "cf_solve_blocked_requests_total", "求解过程中被拦截的请求数", ["block_profile"]
+)
+proxy_fetch_total = metrics_registry.counter(
+    "cf_proxy_fetch_total", "/proxy_fetch 请求数，via 为 http / http_after_solve / browser，result 为 ok / challenged / error",
+    ["via", "result"]
+)
+proxy_fetch_seconds = metrics_registry.histogram(
+    "cf_proxy_fetch_duration_seconds", "/proxy_fetch 耗时（秒）", ["via"]
+)
+solve_results_total = metrics_registry.counter(
+    "cf_solve_results_total", "浏览器求解结果，reason 为验证通过方式或异常类型", ["result", "reason"]
+)
+http_requests_total = metrics_registry.counter(
+    "cf_http_requests_total", "HTTP 请求数", ["endpoint", "method", "status"]
+)
+http_request_seconds = metrics_registry.histogram(
+    "cf_http_request_duration_seconds", "HTTP 请求处理耗时（秒）", ["endpoint"]
+)
+
+metrics_registry.gauge(
+    "cf_pool_idle_drivers", "预热池中的空闲驱动数",
+    lambda: [({"mode": mode}, count) for mode, count in driver_pool.stats()["idle"].items()],
+    ["mode"]
+)
+metrics_registry.gauge("cf_pool_launching_drivers", "预热池正在启动的驱动数", lambda: driver_pool.stats()["launching"])
+metrics_registry.gauge("cf_pool_checked_out_drivers", "从预热池取出的驱动数", lambda: driver_pool.stats()["checked_out"])
+metrics_registry.counter_from(
+    "cf_pool_acquire_total", "从预热池取驱动的次数，result 为 hit / miss",
+    lambda: [({"result": "hit"}, driver_pool.stats()["hits"]), ({"result": "miss"}, driver_pool.stats()["misses"])],
+    ["result"]
+)
+metrics_registry.gauge("cf_active_drivers", "已求解并保留的驱动数", lambda: len(active_drivers))
+metrics_registry.gauge("cf_active_drivers_in_use", "正在被 /fetch 使用的驱动数", lambda: active_drivers.stats()["in_use"])
+
+def active_drivers_rss_bytes():
+    total_rss_mb = active_drivers.stats()["total_rss_mb"]
+    return None if total_rss_mb is None else int(total_rss_mb * 1024 * 1024)
+
+metrics_registry.gauge("cf_active_drivers_rss_bytes", "已保留驱动的总内存（需要 psutil）", active_drivers_rss_bytes)
+metrics_registry.gauge("cf_job_queue_depth", "排队中的异步任务数", lambda: job_manager.stats()["queue_depth"])
+metrics_registry.gauge("cf_jobs_running", "执行中的异步任务数", lambda: job_manager.stats()["running"])
+metrics_registry.gauge("cf_single_flight_in_flight", "进行中的合并求解数", lambda: solve_flights.stats()["in_flight"])
+metrics_registry.counter_from(
+    "cf_session_cache_lookups_total", "会话缓存查询次数，result 为 hit / miss / stale",
+    lambda: [({"result": name}, session_store.stats()[key]) for name, key in
+             (("hit", "hits"), ("miss", "misses"), ("stale", "stale"))],
+    ["result"]
+)
+metrics_registry.gauge("cf_session_cache_hit_ratio", "会话缓存命中率", lambda: session_store.stats()["hit_ratio"])
+metrics_registry.gauge("cf_session_store_entries", "内存中的会话数", lambda: session_store.stats()["entries"])
+
+@app.before_request
+def start_request():
+    g.request_started = time.perf_counter()
+    # 关联 id：沿用调用方传入的 X-Request-ID，否则新生成
+    g.request_id = request.headers.get('X-Request-ID') or new_request_id()
+    g.request_id_token = bind_request_id(g.request_id)
+
+@app.teardown_request
+def end_request(exc):
+    token = getattr(g, 'request_id_token', None)
+    if token is not None:
+        reset_request_id(token)
+
+@app.after_request
+def record_request_metrics(response):
+    if getattr(g, 'request_id', None):
+        response.headers['X-Request-ID'] = g.request_id
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        # 用路由规则而不是实际路径作标签，避免 /jobs/<id> 产生大量时间序列
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        http_requests_total.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+        http_request_seconds.observe(time.perf_counter() - started, endpoint=endpoint)
+    return response
+
+def get_session_file(url, proxy=None):
+    """根据 URL（+ 代理）生成会话文件名，同一主机直连和走代理求解的会话分开保存"""
     domain = urlparse(url).netloc.replace(":", "_").replace(".", "_")
+    if proxy:
+        domain += "-" + hashlib.sha1(proxy.encode("utf-8")).hexdigest()[:8]
     return os.path.join(SESSION_DIR, f"session_{domain}.json")
 
-def save_cookies(driver, session_file):
+def save_cookies(driver, session_file, url=None, proxy=None):
     """保存 cookies 到文件"""
     cookies = driver.get_cookies()
     user_agent = driver.execute_script("return navigator.userAgent")
@@ -39,25 +452,30 @@ def save_cookies(driver, session_file):
         "timestamp": datetime.now().isoformat()
     }
     
-    with open(session_file, 'w', encoding='utf-8') as f:
-        json.dump(session_data, f, indent=2, ensure_ascii=False)
+    if url:
+        # 后台刷新时需要知道原始 URL
+        session_data["url"] = url
+        session_data["domain"] = urlparse(url).netloc
     
-    return session_data
+    if proxy:
+        # 后台刷新时需要通过同一个代理重新求解
+        session_data["proxy"] = proxy
+    
+    # 写入内存存储，由后台线程原子落盘
+    return session_store.put(session_file, session_data)
 
 def load_cookies(driver, session_file):
     """从文件加载 cookies"""
-    if not os.path.exists(session_file):
+    session_data = session_store.get(session_file)
+    if session_data is None:
         return None
     
-    with open(session_file, 'r', encoding='utf-8') as f:
-        session_data = json.load(f)
-    
     # 添加 cookies
     for cookie in session_data['cookies']:
         try:
             driver.add_cookie(cookie)
         except Exception as e:
-            print(f"添加 cookie 失败: {e}")
+            logger.warning("添加 cookie 失败: %s", e)
     
     return session_data
 
@@ -69,9 +487,33 @@ def health_check():
         "service": "Cloudflare Bypass Service (undetected-chromedriver)",
         "version": "1.0.0",
         "timestamp": datetime.now().isoformat(),
-        "active_drivers": len(active_drivers)
+        "active_drivers": len(active_drivers),
+        "driver_lifecycle": active_drivers.stats(),
+        "driver_pool": driver_pool.stats(),
+        "driver_cache": driver_cache.stats(),
+        "http_fast_path": {**http_fast_path.stats(), "browser_only_hosts": sorted(
+            host for host, expires in list(browser_only_hosts.items()) if expires > time.monotonic())},
+        "page_load": {
+            "strategy": PAGE_LOAD_STRATEGY,
+            "block_profile": BLOCK_PROFILE,
+            "block_rules": sorted(block_rules),
+            "network_stats": NETWORK_STATS
+        },
+        "profiles": {"default": PROFILES_DEFAULT, **profile_cache.stats()},
+        "jobs": job_manager.stats(),
+        "single_flight": solve_flights.stats(),
+        "session_store": session_store.stats(),
+        "refresher": session_refresher.stats() if REFRESH_ENABLED else None,
+        "cluster": cluster_node.stats() if cluster_node else None,
+        "inflight_requests": len(inflight_requests),
+        "logging": logging_stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 文本格式的指标"""
+    return Response(metrics_registry.render(), mimetype=METRICS_CONTENT_TYPE)
+
 @app.route('/solve', methods=['POST'])
 def solve_challenge():
     """
@@ -82,7 +524,18 @@ def solve_challenge():
         "url": "https://m.iyf.tv/",
         "headless": true,
         "timeout": 60,
-        "wait_time": 10
+        "wait_mode": "adaptive",  // 可选: "adaptive"（轮询直到通过）或 "fixed"（固定等待 wait_time）
+                                  //   未指定时：传了 wait_time 为 "fixed"（兼容旧调用方），否则为 "adaptive"
+        "wait_time": 10,          // 仅 fixed 模式使用
+        "async": false,           // 可选，为 true 时立即返回 job_id，结果通过 /jobs/<id> 获取
+        "use_cache": true,        // 可选，先返回仍然有效的已保存会话（默认 CF_SOLVE_USE_CACHE）
+        "max_age": 1800,          // 可选，缓存会话的最长保存时间（秒）
+        "deadline": 90,           // 可选，整个求解的硬截止时间（秒，默认 timeout + CF_SOLVE_DEADLINE_GRACE）
+        "stream": "sse",          // 可选，"sse" / "ndjson" 流式返回进度事件（也可用 Accept: text/event-stream）
+        "proxy": "http://host:port", // 可选，通过代理求解；会话按 域名 + 代理 分开保存
+        "user_agent": "...",      // 可选，覆盖默认的移动端 User-Agent（后台刷新时沿用会话保存的 UA）
+        "profile": true,          // 可选，使用该域名（+ 代理）的持久化 profile（默认 CF_PROFILES）
+        "block_resources": "media" // 可选，资源拦截档位 off / media / aggressive（默认 CF_BLOCK_PROFILE）
     }
     
     响应:
@@ -92,120 +545,483 @@ def solve_challenge():
         "user_agent": "...",
         "session_file": "...",
         "driver_id": "...",
+        "time_to_clear": 1.8,     // 从开始访问到验证通过的秒数
+        "profile": "m.iyf.tv",    // 使用的持久化 profile，profile_warm 表示是否复用了已有 profile
+        "time_to_cookie": 3.2,    // 从开始求解（含取驱动）到 cookie 保存完成的秒数
+        "network": {"bytes": 183220, "requests": 14, "blocked": 9, "from_cache": 3},  // 仅 CF_NETWORK_STATS=1 时返回，否则为 null
+        "clearance": {...},       // adaptive 模式的轮询详情
+        "from_cache": false,      // 为 true 时未启动浏览器，driver_id 为 null
         "message": "挑战成功"
     }
+    
+    async 模式响应 (202):
+    {
+        "success": true,
+        "job_id": "...",
+        "status": "queued",
+        "status_url": "/jobs/<id>"
+    }
+    
+    流式响应（text/event-stream 或 application/x-ndjson），每个事件带 elapsed（秒）和 ts:
+    accepted -> driver_acquired -> navigation_started -> navigation_done -> challenge_detected
+    -> cleared / clearance_timeout（fixed 模式为 fixed_wait_done）-> cookies_saved -> result（status_code + 完整响应体）
+    命中缓存 / 合并请求时为 cache_hit / coalesced；客户端提前断开会取消本次求解
+    
+    同步请求可通过 POST /cancel {"request_id": "<X-Request-ID>"} 取消（409），超过截止时间返回 504；
+    在 waitress 下客户端断开连接也会中止求解
     """
-    driver = None
     try:
         data = request.get_json()
-        url = data.get('url')
+        error = validate_solve_request(data)
         
-        if not url:
-            return jsonify({"success": False, "error": "URL is required"}), 400
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+        
+        if not data.get('async'):
+            forwarded = forward_to_owner('/solve', data, urlparse(data.get('url')).netloc)
+            if forwarded is not None:
+                return forwarded
+        
+        # 只有外部调用算作访问，后台刷新本身不会延长会话的刷新期
+        session_refresher.touch(get_session_file(data.get('url'), data.get('proxy')))
+        
+        stream_format = progress.stream_format(data.get('stream'), request.headers.get('Accept'))
+        if stream_format and not data.get('async'):
+            request_id = g.request_id
+            cancel_event = CancelToken()
+            inflight_requests.register(request_id, cancel_event)
+            
+            def solve():
+                try:
+                    return run_solve(data, cancel_event)
+                finally:
+                    inflight_requests.unregister(request_id, cancel_event)
+            
+            events = progress.stream(solve, stream_format, cancel_event)
+            return Response(stream_with_context(events), mimetype=progress.CONTENT_TYPES[stream_format],
+                            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+        
+        if data.get('async'):
+            try:
+                job = job_manager.submit(run_solve, data)
+            except JobQueueFull as e:
+                return jsonify({"success": False, "error": str(e)}), 429
+            
+            logger.info("📥 已提交异步任务 %s: %s", job.id, data.get('url'), extra=fields(job_id=job.id))
+            
+            return jsonify({
+                "success": True,
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}"
+            }), 202
+        
+        cancel_event = CancelToken(parents=[client_disconnect_probe()])
+        inflight_requests.register(g.request_id, cancel_event)
+        try:
+            payload, status_code = run_solve(data, cancel_event)
+        finally:
+            inflight_requests.unregister(g.request_id, cancel_event)
+        
+        with solve_phase_seconds.time(phase="response"):
+            response = jsonify(payload)
+        return response, status_code
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def validate_solve_request(data):
+    """校验 /solve 请求体，返回错误信息（无错误时返回 None）"""
+    if not data or not data.get('url'):
+        return "URL is required"
+    
+    if resolve_wait_mode(data) not in ('adaptive', 'fixed'):
+        return "wait_mode must be 'adaptive' or 'fixed'"
+    
+    if data.get('block_resources') and data['block_resources'] not in BLOCK_PROFILES:
+        return f"block_resources must be one of: {', '.join(BLOCK_PROFILES)}"
+    
+    return None
+
+def resolve_wait_mode(data):
+    """未指定 wait_mode 时，传了 wait_time 的旧调用方按固定等待处理，其余默认轮询"""
+    if data.get('wait_mode'):
+        return data['wait_mode']
+    return 'fixed' if data.get('wait_time') is not None else 'adaptive'
+
+def forward_to_owner(path, data, domain):
+    """
+    集群模式下把请求转发给域名归属节点（其会话和已求解驱动都在那里）
+    
+    本节点就是归属节点、归属节点未配置地址、请求已被转发过或转发失败时返回 None，由本节点处理
+    """
+    if cluster_node is None or request.headers.get('X-CF-Forwarded-By'):
+        return None
+    
+    owner = cluster_node.owner_of(domain.lower())
+    if owner is None or owner['node_id'] == cluster_node.node_id or not owner['url']:
+        return None
+    
+    try:
+        response = requests.post(
+            f"{owner['url']}{path}",
+            json=data,
+            headers={'X-CF-Forwarded-By': cluster_node.node_id, 'X-Request-ID': get_request_id() or ''},
+            timeout=data.get('timeout', 60) + 30,
+            stream=True
+        )
+    except requests.RequestException as e:
+        logger.warning("⚠️  转发到节点 %s 失败，本地处理: %s", owner['node_id'], e)
+        return None
+    
+    cluster_node.count('forwarded')
+    # 逐块转发，流式进度事件不会被缓冲到求解结束
+    return app.response_class(response.iter_content(chunk_size=None), status=response.status_code,
+                              content_type=response.headers.get('Content-Type', 'application/json'))
+
+class ClientDisconnect:
+    """waitress 的客户端断开探测，作为 CancelToken 的父标记使用"""
+    
+    reason = "disconnected"
+    
+    def __init__(self, probe):
+        self.probe = probe
+    
+    def is_set(self):
+        try:
+            return bool(self.probe())
+        except Exception:
+            return False
+
+def client_disconnect_probe():
+    """当前请求的断开探测，服务器不支持时返回 None（需要 waitress 且 channel_request_lookahead > 0）"""
+    probe = request.environ.get('waitress.client_disconnected')
+    return ClientDisconnect(probe) if probe else None
+
+def check_cancelled(cancel_event):
+    """任务被取消时抛出 JobCancelled；超过截止时间时抛出其子类 job_queue.DeadlineExceeded"""
+    raise_if_cancelled(cancel_event)
+
+def solve_budget(data):
+    """整个求解的硬截止时间（秒）"""
+    return float(data.get('deadline') or data.get('timeout', 60) + SOLVE_DEADLINE_GRACE)
+
+def aborted_payload(cancel_event):
+    """被取消 / 超过截止时间时的响应"""
+    if cancel_event.reason == "deadline":
+        return {"success": False, "deadline_exceeded": True, "error": "超过截止时间",
+                "request_id": get_request_id()}, 504
+    return {"success": False, "cancelled": True, "reason": cancel_event.reason or "cancelled",
+            "error": "任务已取消"}, 409
+
+def solve_flight_key(data):
+    """合并 key：域名 + 代理 + User-Agent + 无头模式"""
+    return (
+        urlparse(data.get('url')).netloc.lower(),
+        data.get('proxy') or '',
+        data.get('user_agent') or '',
+        bool(data.get('headless', True))
+    )
+
+def run_solve(data, cancel_event=None):
+    """
+    执行一次挑战求解，同步请求和异步任务共用
+    
+    同一 key 的并发请求只启动一个浏览器，其余请求等待并共享结果（响应中 coalesced 为 true）
+    
+    返回 (响应字典, HTTP 状态码)
+    """
+    started = time.perf_counter()
+    
+    # 请求的截止时间和外部取消（任务取消、/cancel、客户端断开）合并为一个取消标记，贯穿整个求解
+    cancel_event = CancelToken(deadline=time.monotonic() + solve_budget(data), parents=[cancel_event])
+    
+    try:
+        return solve_with_flight(data, cancel_event, started)
+    except JobCancelled:
+        # 等待同 key 求解或其他节点租约期间被取消 / 超时
+        return aborted_payload(cancel_event)
+
+def solve_with_flight(data, cancel_event, started):
+    """缓存 -> 合并同 key 的并发求解 -> 集群租约 -> 浏览器求解"""
+    if data.get('use_cache', SOLVE_USE_CACHE):
+        cached = serve_cached_session(data)
+        if cached is not None:
+            solve_duration_seconds.observe(time.perf_counter() - started, source="cache")
+            progress.emit("cache_hit", cache_age=cached['cache_age'])
+            return cached, 200
+    
+    key = solve_flight_key(data)
+    
+    while True:
+        (payload, status_code), shared = solve_flights.do(
+            key, lambda: solve_with_lease(data, cancel_event), cancel_event
+        )
         
+        if shared and (payload.get('cancelled') or payload.get('deadline_exceeded')):
+            # 发起者被取消或超过了它自己的截止时间，由当前请求重新发起
+            check_cancelled(cancel_event)
+            continue
+        break
+    
+    if shared:
+        logger.info("🔗 复用同域名进行中的求解结果: %s", data.get('url'))
+        progress.emit("coalesced")
+        payload = {**payload, "coalesced": True}
+    
+    source = "coalesced" if payload.get('coalesced') else "browser"
+    solve_duration_seconds.observe(time.perf_counter() - started, source=source)
+    
+    return payload, status_code
+
+def solve_with_lease(data, cancel_event=None):
+    """
+    集群模式下先获取该 key 的求解租约：其他节点正在求解时等待其完成，
+    再直接使用共享会话库中刚保存的会话，避免跨节点重复求解
+    """
+    if cluster_node is None:
+        return solve_once(data, cancel_event)
+    
+    lease_key = "solve:" + "|".join(str(part) for part in solve_flight_key(data))
+    started = time.time()
+    wait_budget = cancel_event.remaining() if cancel_event is not None else data.get('timeout', 60) + 30
+    
+    while True:
+        holder = cluster_node.try_lease(lease_key)
+        if holder is None:
+            break
+        
+        logger.info("🔗 节点 %s 正在求解同一域名，等待其完成: %s", holder, data.get('url'))
+        progress.emit("waiting_for_node", node_id=holder)
+        released = cluster_node.wait_lease(lease_key, max(wait_budget - (time.time() - started), 0), cancel_event)
+        
+        # 只接受等待开始之后保存的会话
+        cached = serve_cached_session(data, max_age=time.time() - started + 1)
+        if cached is not None:
+            return {**cached, "coalesced": True, "solved_by": holder}, 200
+        
+        if not released:
+            # 持有者迟迟没有结果，本节点自行求解（不持有租约）
+            return solve_once(data, cancel_event)
+    
+    try:
+        payload, status_code = solve_once(data, cancel_event)
+        if payload.get('success'):
+            # 释放租约前落盘，等待中的节点才能读到
+            session_store.flush()
+        return payload, status_code
+    finally:
+        cluster_node.release_lease(lease_key)
+
+def serve_cached_session(data, max_age=None):
+    """已保存的会话仍然有效时直接构造 /solve 响应，否则返回 None"""
+    url = data.get('url')
+    session_file = get_session_file(url, data.get('proxy'))
+    if max_age is None:
+        max_age = data.get('max_age', SESSION_MAX_AGE)
+    
+    session_data, reason = session_store.get_fresh(session_file, max_age)
+    
+    if session_data is None:
+        step(logger, "🗂️  缓存未命中 (%s): %s", reason, url)
+        return None
+    
+    saved_at = parse_timestamp(session_data.get('timestamp'))
+    cache_age = round(time.time() - saved_at, 1)
+    
+    logger.info("⚡ 使用缓存会话 (%ss 前保存): %s", cache_age, url, extra=fields(url=url, cache_age=cache_age))
+    
+    return {
+        "success": True,
+        "cookies": {cookie['name']: cookie['value'] for cookie in session_data['cookies']},
+        "cookies_list": session_data['cookies'],
+        "user_agent": session_data['user_agent'],
+        "session_file": session_file,
+        "driver_id": None,
+        "from_cache": True,
+        "cache_age": cache_age,
+        "timestamp": session_data.get('timestamp'),
+        "message": "使用缓存会话"
+    }
+
+def solve_once(data, cancel_event=None):
+    """
+    实际启动/取出浏览器完成一次挑战
+    
+    cancel_event 的截止时间同时约束页面加载超时和验证等待；取消后浏览器调用仍卡住时由看门狗强杀驱动
+    """
+    if cancel_event is None:
+        cancel_event = CancelToken()
+    driver = None
+    watchdog = None
+    solve_started = time.monotonic()
+    try:
+        url = data.get('url')
         headless = data.get('headless', True)
         timeout = data.get('timeout', 60)
         wait_time = data.get('wait_time', 10)
+        wait_mode = resolve_wait_mode(data)
+        block_profile = data.get('block_resources', BLOCK_PROFILE) or 'off'
         
-        print(f"\n{'='*60}")
-        print(f"[{datetime.now()}] 🚀 开始解决 Cloudflare 挑战")
-        print(f"{'='*60}")
-        print(f"  URL: {url}")
-        print(f"  无头模式: {headless}")
-        print(f"  超时时间: {timeout}s")
-        print(f"  等待时间: {wait_time}s")
-        print(f"{'='*60}\n")
+        logger.info(
+            "🚀 开始解决 Cloudflare 挑战: %s (无头模式=%s, 超时=%ss, 等待模式=%s)", url, headless, timeout, wait_mode,
+            extra=fields(url=url, headless=headless, timeout=timeout, wait_mode=wait_mode, wait_time=wait_time)
+        )
         
-        # 配置 Chrome 选项
-        options = uc.ChromeOptions()
+        # 持久化 profile 正被其他浏览器使用时退回一次性 profile
+        profile = None
+        if data.get('profile', PROFILES_DEFAULT):
+            profile = profile_cache.acquire(urlparse(url).netloc.lower(), data.get('proxy'))
+            if profile is None:
+                step(logger, "⚠️  profile 正在使用中，本次使用临时 profile")
+                progress.emit("profile_busy")
         
-        if headless:
-            options.add_argument('--headless=new')
+        # 从预热池取出驱动（池为空时现场启动）；带代理、自定义 User-Agent 或持久化 profile 时单独启动，
+        # 用完不会回到预热池
+        user_agent = data.get('user_agent')
+        custom_user_agent = bool(user_agent) and user_agent != MOBILE_USER_AGENT
+        with solve_phase_seconds.time(phase="acquire"):
+            if profile is not None:
+                driver, pool_hit = create_profile_driver(headless, data.get('proxy'), profile, user_agent), False
+            elif data.get('proxy') or custom_user_agent:
+                driver, pool_hit = create_driver(headless, data.get('proxy'), user_agent=user_agent), False
+            else:
+                driver, pool_hit = driver_pool.acquire(headless)
         
-        # 其他选项
-        options.add_argument('--disable-blink-features=AutomationControlled')
-        options.add_argument('--disable-dev-shm-usage')
-        options.add_argument('--no-sandbox')
-        options.add_argument('--disable-gpu')
+        step(logger, "♻️  使用预热驱动" if pool_hit else "🆕 预热池为空，已新建驱动")
+        progress.emit("driver_acquired", pool_hit=pool_hit, profile=profile.name if profile else None,
+                      profile_warm=profile.warm if profile else None)
         
-        print(f"[{datetime.now()}] 🔧 启动 undetected-chromedriver...")
+        check_cancelled(cancel_event)
         
-        # 创建驱动
-        driver = uc.Chrome(options=options, version_main=None)
+        # 取消后驱动仍阻塞在 driver.get 等调用上时强杀浏览器
+        watchdog = DriverWatchdog(driver, cancel_event, CANCEL_GRACE).start()
         
-        print(f"[{datetime.now()}] ✅ 浏览器启动成功")
+        # 页面加载超时不超过剩余的截止时间
+        remaining_budget = cancel_event.remaining()
+        page_load_timeout = max(min(timeout, remaining_budget if remaining_budget is not None else timeout), 1)
+        driver.set_page_load_timeout(page_load_timeout)
         
-        # 使用 CDP 设置移动设备模拟（iPhone）
-        print(f"[{datetime.now()}] 📱 设置移动设备指标...")
+        # 资源拦截（每次都重新设置，覆盖复用驱动上次的拦截列表）；丢弃预热 / 上次使用期间的网络日志
+        patterns = blocked_patterns(block_profile, urlparse(url).netloc.lower(), block_rules)
         try:
-            driver.execute_cdp_cmd("Emulation.setDeviceMetricsOverride", {
-                "width": 390,
-                "height": 844,
-                "deviceScaleFactor": 3,
-                "mobile": True,
-                "screenWidth": 390,
-                "screenHeight": 844,
-                "positionX": 0,
-                "positionY": 0
-            })
-            
-            driver.execute_cdp_cmd("Emulation.setTouchEmulationEnabled", {
-                "enabled": True,
-                "configuration": "mobile"
-            })
-            
-            driver.execute_cdp_cmd("Emulation.setUserAgentOverride", {
-                "userAgent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1",
-                "platform": "iPhone"
-            })
-            
-            print(f"[{datetime.now()}] ✅ 移动设备模拟已设置 (iPhone 12 Pro)")
+            apply_blocking(driver, patterns)
         except Exception as e:
-            print(f"[{datetime.now()}] ⚠️  移动设备设置失败: {e}")
-            print(f"[{datetime.now()}] ℹ️  将使用桌面模式")
+            logger.warning("⚠️  资源拦截设置失败，按完整加载继续: %s", e)
+        if NETWORK_STATS:
+            network_usage(driver)
         
-        # 设置超时
-        driver.set_page_load_timeout(timeout)
+        # 持久化 profile 里保留着上次的 cf_clearance，不删除的话 wait_for_clearance 第一次轮询就会把旧 cookie
+        # 当作验证通过（刷新 / 快速通道升级拿回的仍是已失效的会话）
+        if profile is not None:
+            try:
+                driver.execute_cdp_cmd("Network.deleteCookies", {"name": "cf_clearance", "url": url})
+            except Exception as e:
+                logger.warning("⚠️  清除 profile 中旧的 cf_clearance 失败: %s", e)
         
         # 访问 URL
-        print(f"[{datetime.now()}] 🌐 访问 URL: {url}")
-        driver.get(url)
-        
-        # 等待页面加载
-        print(f"[{datetime.now()}] ⏳ 等待 {wait_time} 秒让 Cloudflare 完成验证...")
-        time.sleep(wait_time)
-        
-        # 检查是否成功
-        current_url = driver.current_url
-        page_source = driver.page_source
+        step(logger, "🌐 访问 URL: %s (拦截档位=%s, %d 个模式, 加载策略=%s)",
+             url, block_profile, len(patterns), PAGE_LOAD_STRATEGY)
+        progress.emit("navigation_started", url=url, block_profile=block_profile, page_load_strategy=PAGE_LOAD_STRATEGY)
+        nav_started = time.monotonic()
+        with solve_phase_seconds.time(phase="navigate"):
+            navigate(driver, url, PAGE_LOAD_STRATEGY, page_load_timeout)
+        progress.emit("navigation_done", url=driver.current_url if progress.active() else None)
         
-        # 简单判断是否通过验证
-        is_challenge = 'challenge' in page_source.lower() or 'cloudflare' in page_source.lower()
+        check_cancelled(cancel_event)
         
-        if is_challenge and 'checking your browser' in page_source.lower():
-            print(f"[{datetime.now()}] ⚠️  仍在验证中，再等待 10 秒...")
-            time.sleep(10)
+        wait_started = time.perf_counter()
+        clearance = None
+        if wait_mode == 'adaptive':
+            # 轮询 cookie / 页面特征，验证通过立即返回
+            remaining = max(timeout - (time.monotonic() - nav_started), 0)
+            if cancel_event.remaining() is not None:
+                remaining = min(remaining, cancel_event.remaining())
+            step(logger, "⏳ 轮询等待 Cloudflare 完成验证（最多 %.0f 秒）...", remaining)
+            clearance = wait_for_clearance(
+                driver, remaining, cancel_event=cancel_event,
+                on_challenge=lambda state: progress.emit("challenge_detected", title=state.get('title'))
+            )
+            check_cancelled(cancel_event)
+            current_url = clearance['url'] or driver.current_url
+            
+            if clearance['cleared']:
+                step(logger, "✅ 验证通过 (%s)，轮询 %s 次", clearance['reason'], clearance['polls'])
+                progress.emit("cleared", reason=clearance['reason'], polls=clearance['polls'],
+                              challenge_seen=clearance['challenge_seen'])
+            else:
+                logger.warning("⚠️  等待验证超时，保存当前会话: %s", url)
+                progress.emit("clearance_timeout", polls=clearance['polls'])
+        else:
+            # 等待页面加载
+            step(logger, "⏳ 等待 %s 秒让 Cloudflare 完成验证...", wait_time)
+            cancel_event.wait(wait_time)
+            check_cancelled(cancel_event)
+            
+            # 检查是否成功
+            current_url = driver.current_url
             page_source = driver.page_source
+            
+            # 简单判断是否通过验证
+            is_challenge = 'challenge' in page_source.lower() or 'cloudflare' in page_source.lower()
+            
+            if is_challenge and 'checking your browser' in page_source.lower():
+                step(logger, "⚠️  仍在验证中，再等待 10 秒...")
+                cancel_event.wait(10)
+                check_cancelled(cancel_event)
+                page_source = driver.page_source
+            
+            progress.emit("fixed_wait_done", challenge_seen=is_challenge)
+        
+        solve_phase_seconds.observe(time.perf_counter() - wait_started, phase="wait")
+        time_to_clear = round(time.monotonic() - nav_started, 3)
+        step(logger, "⏱️  验证耗时: %ss", time_to_clear)
         
         # 保存会话
-        session_file = get_session_file(url)
-        session_data = save_cookies(driver, session_file)
+        session_file = get_session_file(url, data.get('proxy'))
+        with solve_phase_seconds.time(phase="save_cookies"):
+            session_data = save_cookies(driver, session_file, url, data.get('proxy'))
+        
+        step(logger, "💾 会话已保存: %s（%d 个 cookies，UA: %s...）",
+             session_file, len(session_data['cookies']), session_data['user_agent'][:50])
+        time_to_cookie = round(time.monotonic() - solve_started, 3)
+        network = network_usage(driver) if NETWORK_STATS else None
+        solve_time_to_cookie_seconds.observe(time_to_cookie, block_profile=block_profile)
+        if network is not None:
+            solve_transfer_bytes_total.inc(network['bytes'], block_profile=block_profile)
+            solve_blocked_requests_total.inc(network['blocked'], block_profile=block_profile)
         
-        print(f"[{datetime.now()}] 💾 会话已保存: {session_file}")
-        print(f"[{datetime.now()}] 📊 Cookies: {len(session_data['cookies'])} 个")
-        print(f"[{datetime.now()}] 🔍 User-Agent: {session_data['user_agent'][:50]}...")
+        progress.emit("cookies_saved", cookies=len(session_data['cookies']), time_to_clear=time_to_clear,
+                      time_to_cookie=time_to_cookie, bytes=network['bytes'] if network else None)
         
         # 转换 cookies 为字典格式
         cookies_dict = {cookie['name']: cookie['value'] for cookie in session_data['cookies']}
         
+        watchdog.stop()
+        
         # 缓存驱动（可选）
-        driver_id = f"{urlparse(url).netloc}_{int(time.time())}"
-        active_drivers[driver_id] = driver
+        driver_id = f"{urlparse(url).netloc}_{int(time.time())}_{uuid.uuid4().hex[:6]}"
+        active_drivers.park(driver_id, driver, urlparse(url).netloc.lower())
         
-        print(f"[{datetime.now()}] ✅ 挑战完成!")
-        print(f"{'='*60}\n")
+        if clearance is None:
+            solve_results_total.inc(result="success", reason="fixed_wait")
+        elif clearance['cleared']:
+            solve_results_total.inc(result="success", reason=clearance['reason'])
+        else:
+            solve_results_total.inc(result="timeout", reason=clearance['reason'])
         
-        return jsonify({
+        logger.info(
+            "✅ 挑战完成: %s (%ss)", url, time_to_clear,
+            extra=fields(url=url, driver_id=driver_id, time_to_clear=time_to_clear, pool_hit=pool_hit,
+                         reason=clearance['reason'] if clearance else "fixed_wait",
+                         profile=profile.name if profile else None,
+                         profile_warm=profile.warm if profile else None,
+                         time_to_cookie=time_to_cookie, block_profile=block_profile,
+                         transfer_bytes=network['bytes'] if network else None,
+                         blocked_requests=network['blocked'] if network else None)
+        )
+        
+        return {
             "success": True,
             "cookies": cookies_dict,
             "cookies_list": session_data['cookies'],
@@ -213,25 +1029,328 @@ def solve_challenge():
             "session_file": session_file,
             "driver_id": driver_id,
             "current_url": current_url,
+            "pool_hit": pool_hit,
+            "profile": profile.name if profile else None,
+            "profile_warm": profile.warm if profile else None,
+            "wait_mode": wait_mode,
+            "time_to_clear": time_to_clear,
+            "time_to_cookie": time_to_cookie,
+            "block_resources": block_profile,
+            "network": network,
+            "clearance": clearance,
+            "from_cache": False,
             "message": "挑战成功"
-        })
+        }, 200
+        
+    except JobCancelled:
+        return abort_solve(data, driver, cancel_event, watchdog)
         
     except Exception as e:
-        print(f"[{datetime.now()}] ❌ 错误: {e}")
-        import traceback
-        traceback.print_exc()
+        if cancel_event.is_set():
+            # 取消 / 截止时间导致的中断（页面加载超时、浏览器被看门狗强杀）
+            return abort_solve(data, driver, cancel_event, watchdog)
+        
+        # 堆栈只写日志，响应中带上关联 id 便于排查
+        logger.exception("❌ 错误: %s", e, extra=fields(url=data.get('url')))
+        solve_results_total.inc(result="error", reason=type(e).__name__)
         
         if driver:
-            try:
-                driver.quit()
-            except:
-                pass
+            driver_pool.discard(driver)
         
-        return jsonify({
+        return {
             "success": False,
             "error": str(e),
-            "traceback": traceback.format_exc()
-        }), 500
+            "request_id": get_request_id()
+        }, 500
+    
+    finally:
+        if watchdog is not None:
+            watchdog.stop()
+
+def abort_solve(data, driver, cancel_event, watchdog):
+    """求解被取消或超过截止时间：驱动仍可用时归还预热池，被强杀或已失效时丢弃"""
+    reason = cancel_event.reason or "cancelled"
+    killed = watchdog is not None and watchdog.killed
+    logger.info("🛑 求解已中止 (%s%s): %s", reason, "，浏览器已强制结束" if killed else "", data.get('url'),
+                extra=fields(url=data.get('url'), reason=reason, killed=killed))
+    solve_results_total.inc(result="deadline" if reason == "deadline" else "cancelled",
+                            reason="killed" if killed else reason)
+    progress.emit("aborted", reason=reason, killed=killed)
+    
+    if driver:
+        if watchdog is not None:
+            watchdog.stop()
+        if killed or not is_driver_alive(driver):
+            driver_pool.discard(driver)
+        else:
+            driver_pool.release(driver)
+    
+    return aborted_payload(cancel_event)
+
+@app.route('/solve_batch', methods=['POST'])
+def solve_batch():
+    """
+    批量求解：按域名去重后并行求解，每完成一个就以 NDJSON 输出一行
+    
+    请求体:
+    {
+        "urls": [
+            "https://a.example.com/",
+            {"url": "https://b.example.com/", "proxy": "http://127.0.0.1:8080", "headless": false, "timeout": 90}
+        ],
+        "parallelism": 4,         // 可选，本批次的并行数（不超过 CF_BATCH_PARALLELISM）
+        "keep_drivers": false,    // 可选，为 true 时保留驱动供 /fetch 使用，否则求解后立即归还预热池
+        "stream": true,           // 可选，为 false 时等全部完成后返回一个 JSON
+        "headless": true,         // 其余字段（headless / timeout / wait_mode / use_cache / max_age / proxy）
+        "timeout": 60             // 作为每个 URL 的默认值，可被单个 URL 覆盖
+    }
+    
+    流式响应 (application/x-ndjson)，按完成顺序每行一个结果，最后一行为汇总:
+    {"index": 0, "url": "...", "status_code": 200, "success": true, "cookies": {...}, ...}
+    {"index": 2, "url": "...", "duplicate_of": 0, "status_code": 200, "success": true, ...}
+    {"done": true, "summary": {"total": 3, "unique": 2, "succeeded": 3, "failed": 0, "elapsed": 4.2, ...}}
+    
+    域名 + 代理 + User-Agent + 无头模式相同的 URL 只求解一次，其余带 duplicate_of 共享结果
+    """
+    try:
+        data = request.get_json()
+        items, error = parse_batch_items(data)
+        
+        if error:
+            return jsonify({"success": False, "error": error}), 400
+        
+        parallelism = max(1, min(int(data.get('parallelism', BATCH_PARALLELISM)), BATCH_PARALLELISM))
+        batch = BatchSolve(items, parallelism, keep_drivers=bool(data.get('keep_drivers')), request_id=g.request_id)
+        batch.start()
+        
+        if not data.get('stream', True):
+            results = [result for result in batch.results() if 'index' in result]
+            results.sort(key=lambda result: result['index'])
+            return jsonify({
+                "success": all(result['success'] for result in results),
+                "results": results,
+                "summary": batch.summary()
+            })
+        
+        def generate():
+            for result in batch.results():
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+        
+        return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def parse_batch_items(data):
+    """把 /solve_batch 请求体展开为每个 URL 的 /solve 参数列表，返回 (items, 错误信息)"""
+    urls = data.get('urls') if data else None
+    if not urls or not isinstance(urls, list):
+        return None, "urls must be a non-empty list"
+    if len(urls) > BATCH_MAX_URLS:
+        return None, f"too many urls ({len(urls)} > {BATCH_MAX_URLS})"
+    
+    defaults = {key: value for key, value in data.items()
+                if key not in ('urls', 'parallelism', 'keep_drivers', 'stream', 'async')}
+    
+    items = []
+    for index, entry in enumerate(urls):
+        item = {**defaults, **(entry if isinstance(entry, dict) else {"url": entry})}
+        error = validate_solve_request(item)
+        if error:
+            return None, f"urls[{index}]: {error}"
+        items.append(item)
+    return items, None
+
+class BatchSolve:
+    """
+    一次 /solve_batch：按 solve_flight_key 去重，用 parallelism 个线程求解，
+    结果按完成顺序放入队列；调用方不再读取（客户端断开）或 /cancel 该请求 id 时取消剩余求解
+    """
+    
+    def __init__(self, items, parallelism, keep_drivers=False, request_id=None):
+        self.items = items
+        self.parallelism = parallelism
+        self.keep_drivers = keep_drivers
+        self.request_id = request_id
+        self.cancel_event = CancelToken(parents=[client_disconnect_probe()])
+        
+        # key -> 该 key 下所有 URL 的下标，第一个为实际求解的 URL
+        self.groups = {}
+        for index, item in enumerate(items):
+            self.groups.setdefault(solve_flight_key(item), []).append(index)
+        
+        self._results = queue.Queue()
+        self._executor = None
+        self._started = None
+        self._counts = {"succeeded": 0, "failed": 0}
+    
+    def start(self):
+        self._started = time.monotonic()
+        if self.request_id:
+            inflight_requests.register(self.request_id, self.cancel_event)
+        self._executor = ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="solve-batch")
+        logger.info("📦 批量求解 %d 个 URL（去重后 %d 个，并行 %d）", len(self.items), len(self.groups),
+                    self.parallelism, extra=fields(total=len(self.items), unique=len(self.groups),
+                                                   parallelism=self.parallelism))
+        for indexes in self.groups.values():
+            # 在请求上下文中复制 contextvars，求解日志带同一个关联 id
+            self._executor.submit(contextvars.copy_context().run, self._solve_group, indexes)
+        self._executor.shutdown(wait=False)
+    
+    def _solve_group(self, indexes):
+        data = self.items[indexes[0]]
+        try:
+            while not batch_slots.acquire(timeout=0.5):
+                check_cancelled(self.cancel_event)
+            try:
+                check_cancelled(self.cancel_event)
+                payload, status_code = run_solve(data, self.cancel_event)
+            finally:
+                batch_slots.release()
+        except JobCancelled:
+            payload, status_code = aborted_payload(self.cancel_event)
+        except Exception as e:
+            logger.exception("❌ 批量求解出错: %s", e, extra=fields(url=data.get('url')))
+            payload, status_code = {"success": False, "error": str(e)}, 500
+        
+        if payload.get('driver_id') and not payload.get('coalesced') and not self.keep_drivers:
+            active_drivers.close(payload['driver_id'])
+            payload = {**payload, "driver_id": None}
+        
+        for index in indexes:
+            result = {"index": index, "url": self.items[index]['url'], "status_code": status_code, **payload}
+            if index != indexes[0]:
+                result["duplicate_of"] = indexes[0]
+            self._results.put(result)
+    
+    def results(self):
+        """按完成顺序产出每个 URL 的结果，最后产出汇总；生成器被提前关闭时取消剩余求解"""
+        try:
+            for _ in range(len(self.items)):
+                result = self._results.get()
+                self._counts["succeeded" if result.get('success') else "failed"] += 1
+                yield result
+            yield {"done": True, "summary": self.summary()}
+        finally:
+            if self.request_id:
+                inflight_requests.unregister(self.request_id, self.cancel_event)
+            if len(self.items) > sum(self._counts.values()):
+                logger.warning("⚠️  批量求解的客户端已断开，取消剩余求解")
+                self.cancel_event.cancel("disconnected")
+    
+    def summary(self):
+        elapsed = time.monotonic() - self._started
+        return {
+            "total": len(self.items),
+            "unique": len(self.groups),
+            "parallelism": self.parallelism,
+            **self._counts,
+            "elapsed": round(elapsed, 3),
+            "throughput": round(len(self.groups) / elapsed, 3) if elapsed else None
+        }
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """列出当前跟踪的异步任务（不含结果）及队列状态"""
+    return jsonify({
+        "success": True,
+        "stats": job_manager.stats(),
+        "jobs": job_manager.list()
+    })
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    查询异步任务状态
+    
+    查询参数:
+        wait: 可选，长轮询秒数（最多 JOB_MAX_WAIT 秒），任务完成时立即返回
+    
+    响应:
+    {
+        "success": true,
+        "job_id": "...",
+        "status": "queued" | "running" | "succeeded" | "failed" | "cancelled",
+        "timings": {"queue_wait": 0.01, "run_time": 3.2, "total": 3.21},
+        "result": {...}           // 任务完成后为 /solve 的同步响应
+    }
+    """
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), JOB_MAX_WAIT)
+    except ValueError:
+        return jsonify({"success": False, "error": "wait must be a number"}), 400
+    
+    job = job_manager.wait(job_id, wait)
+    
+    if job is None:
+        return jsonify({"success": False, "error": "任务不存在"}), 404
+    
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """取消异步任务（排队中的直接取消，执行中的在下一个检查点中止）"""
+    job = job_manager.cancel(job_id)
+    
+    if job is None:
+        return jsonify({"success": False, "error": "任务不存在"}), 404
+    
+    return jsonify({"success": True, **job.to_dict()})
+
+@app.route('/cancel', methods=['POST'])
+def cancel_request():
+    """
+    取消进行中的求解
+    
+    请求体（二选一）:
+    {
+        "request_id": "...",   // 同步 /solve、/solve_batch 的 X-Request-ID（响应头中返回，也可由调用方指定）
+        "job_id": "..."        // 异步任务 id，等同于 DELETE /jobs/<id>
+    }
+    
+    被取消的请求在下一个检查点中止并返回 409；浏览器卡住超过 CF_CANCEL_GRACE 秒时强制结束
+    """
+    try:
+        data = request.get_json() or {}
+        
+        if data.get('job_id'):
+            job = job_manager.cancel(data['job_id'])
+            if job is None:
+                return jsonify({"success": False, "error": "任务不存在"}), 404
+            return jsonify({"success": True, **job.to_dict(include_result=False)})
+        
+        request_id = data.get('request_id')
+        if not request_id:
+            return jsonify({"success": False, "error": "request_id or job_id is required"}), 400
+        
+        cancelled = inflight_requests.cancel(request_id)
+        
+        if not cancelled and cluster_node is not None and not request.headers.get('X-CF-Forwarded-By'):
+            # 请求可能由其他节点处理（例如被转发到域名归属节点）
+            cancelled = broadcast_cancel(request_id)
+        
+        if not cancelled:
+            return jsonify({"success": False, "error": "请求不存在或已完成"}), 404
+        
+        logger.info("🛑 已取消请求 %s（%d 个）", request_id, cancelled, extra=fields(cancel_request_id=request_id))
+        return jsonify({"success": True, "request_id": request_id, "cancelled": cancelled})
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+def broadcast_cancel(request_id):
+    """让其他存活节点取消该请求 id，返回取消的数量"""
+    cancelled = 0
+    for node in cluster_node.live_nodes():
+        if node['node_id'] == cluster_node.node_id or not node['url']:
+            continue
+        try:
+            response = requests.post(f"{node['url']}/cancel", json={"request_id": request_id},
+                                     headers={'X-CF-Forwarded-By': cluster_node.node_id}, timeout=5)
+            cancelled += response.json().get('cancelled', 0)
+        except (requests.RequestException, ValueError):
+            pass
+    return cancelled
 
 @app.route('/get_session', methods=['POST'])
 def get_session():
@@ -240,7 +1359,8 @@ def get_session():
     
     请求体:
     {
-        "url": "https://m.iyf.tv/"
+        "url": "https://m.iyf.tv/",
+        "proxy": "http://host:port"  // 可选，获取通过该代理求解的会话
     }
     
     响应:
@@ -258,18 +1378,17 @@ def get_session():
         if not url:
             return jsonify({"success": False, "error": "URL is required"}), 400
         
-        session_file = get_session_file(url)
+        session_file = get_session_file(url, data.get('proxy'))
+        session_data = session_store.get(session_file)
+        session_refresher.touch(session_file)
         
-        if not os.path.exists(session_file):
+        if session_data is None:
             return jsonify({
                 "success": True,
                 "exists": False,
                 "message": "会话不存在"
             })
         
-        with open(session_file, 'r', encoding='utf-8') as f:
-            session_data = json.load(f)
-        
         cookies_dict = {cookie['name']: cookie['value'] for cookie in session_data['cookies']}
         
         return jsonify({
@@ -288,6 +1407,428 @@ def get_session():
             "error": str(e)
         }), 500
 
+def fetch_page(driver, url, timeout, include_html, include_cookies, expires_at=None):
+    """用已通过验证的驱动访问一个 URL，返回单条结果（expires_at 为截止时间，time.monotonic()）"""
+    started = time.monotonic()
+    try:
+        driver.set_page_load_timeout(timeout)
+        if NETWORK_STATS:
+            network_usage(driver)
+        navigate(driver, url, PAGE_LOAD_STRATEGY, timeout)
+        
+        # 再次遇到挑战时等待其自动完成（无挑战时只探测一次），不超过剩余的截止时间
+        clearance_timeout = timeout
+        if expires_at is not None:
+            clearance_timeout = max(min(timeout, expires_at - time.monotonic()), 0)
+        clearance = wait_for_clearance(driver, clearance_timeout)
+        
+        result = {
+            "success": clearance['cleared'],
+            "url": url,
+            "final_url": clearance['url'] or driver.current_url,
+            "status": navigation_status(driver),
+            "title": clearance['title'],
+            "challenge_seen": clearance['challenge_seen'],
+            "elapsed": round(time.monotonic() - started, 3)
+        }
+        
+        if NETWORK_STATS:
+            result["network"] = network_usage(driver)
+        if not clearance['cleared']:
+            result["error"] = "Cloudflare 验证未通过"
+        if include_html:
+            result["html"] = driver.page_source
+        if include_cookies:
+            result["cookies"] = {cookie['name']: cookie['value'] for cookie in driver.get_cookies()}
+        
+        return result
+        
+    except Exception as e:
+        return {
+            "success": False,
+            "url": url,
+            "error": str(e),
+            "elapsed": round(time.monotonic() - started, 3)
+        }
+
+def run_fetch(data, urls):
+    """
+    取出已求解的驱动依次访问 urls；带 deadline（秒）时超过截止时间不再访问剩余 URL，返回 504
+    
+    返回 (响应字典, HTTP 状态码)
+    """
+    driver_id = data.get('driver_id')
+    timeout = data.get('timeout', 30)
+    expires_at = time.monotonic() + float(data['deadline']) if data.get('deadline') else None
+    include_html = data.get('include_html', False)
+    include_cookies = data.get('include_cookies', False)
+    
+    if driver_id:
+        driver = active_drivers.checkout(driver_id)
+        if driver is None:
+            status = 409 if driver_id in active_drivers else 404
+            return {"success": False, "error": "驱动不存在或正在使用中"}, status
+    else:
+        domain = (data.get('domain') or urlparse(urls[0]).netloc).lower()
+        driver_id, driver = active_drivers.checkout_for_domain(domain)
+        if driver is None:
+            return {"success": False, "error": f"没有可用于 {domain} 的空闲驱动，请先调用 /solve"}, 404
+    
+    logger.info("📄 使用驱动 %s 访问 %d 个页面", driver_id, len(urls))
+    
+    started = time.monotonic()
+    results = []
+    deadline_exceeded = False
+    try:
+        for url in urls:
+            page_timeout = timeout
+            if expires_at is not None:
+                remaining = expires_at - time.monotonic()
+                if remaining <= 0:
+                    deadline_exceeded = True
+                    break
+                page_timeout = max(min(timeout, remaining), 1)
+            
+            result = fetch_page(driver, url, page_timeout, include_html, include_cookies, expires_at)
+            results.append(result)
+            
+            if not result['success'] and not is_driver_alive(driver):
+                # 浏览器已崩溃，剩余 URL 不再尝试
+                break
+        
+        if data.get('save_session') and is_driver_alive(driver):
+            # 导航过程中 cookie 可能被更新
+            save_cookies(driver, get_session_file(urls[0], data.get('proxy')), urls[0], data.get('proxy'))
+    finally:
+        if not is_driver_alive(driver):
+            logger.warning("⚠️  驱动 %s 已失效，关闭", driver_id)
+            active_drivers.pop(driver_id)
+            driver_pool.discard(driver)
+        else:
+            active_drivers.checkin(driver_id, navigations=len(results))
+    
+    success = all(result['success'] for result in results) and len(results) == len(urls)
+    if expires_at is not None and not success and time.monotonic() >= expires_at:
+        deadline_exceeded = True
+    
+    payload = {
+        "success": success,
+        "driver_id": driver_id,
+        "results": results,
+        "elapsed": round(time.monotonic() - started, 3)
+    }
+    if deadline_exceeded:
+        logger.warning("⏰ /fetch 超过截止时间，已访问 %d/%d 个页面", len(results), len(urls))
+        payload.update({"success": False, "deadline_exceeded": True, "error": "超过截止时间"})
+        return payload, 504
+    return payload, 200
+
+@app.route('/fetch', methods=['POST'])
+def fetch():
+    """
+    用 /solve 保留下来的浏览器访问页面，无需重新启动浏览器和过验证
+    
+    请求体:
+    {
+        "url": "https://m.iyf.tv/list",
+        "driver_id": "...",          // 可选，不传时按 URL 的域名选择空闲驱动
+        "domain": "m.iyf.tv",        // 可选，覆盖按 URL 推导的域名
+        "timeout": 30,
+        "include_html": false,
+        "include_cookies": false,
+        "save_session": false,       // 可选，访问后把最新 cookies 写回会话
+        "proxy": "http://host:port", // 可选，驱动是通过代理求解的时候传同一个代理，save_session 写回该代理的会话
+        "deadline": 60               // 可选，整个请求的截止时间（秒），超过后返回 504
+    }
+    
+    响应:
+    {
+        "success": true,
+        "driver_id": "...",
+        "url": "...",
+        "final_url": "...",
+        "status": 200,
+        "title": "...",
+        "elapsed": 0.8
+    }
+    """
+    try:
+        data = request.get_json()
+        url = data.get('url') if data else None
+        
+        if not url:
+            return jsonify({"success": False, "error": "URL is required"}), 400
+        
+        forwarded = forward_to_owner('/fetch', data, data.get('domain') or urlparse(url).netloc)
+        if forwarded is not None:
+            return forwarded
+        
+        payload, status_code = run_fetch(data, [url])
+        
+        if payload.get('results'):
+            payload = {"driver_id": payload['driver_id'], **payload['results'][0],
+                       **({"deadline_exceeded": True} if payload.get('deadline_exceeded') else {})}
+        
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+@app.route('/fetch_many', methods=['POST'])
+def fetch_many():
+    """
+    用同一个已求解的浏览器依次访问多个 URL
+    
+    请求体: 同 /fetch，url 换成 "urls": ["...", "..."]
+    
+    响应:
+    {
+        "success": true,
+        "driver_id": "...",
+        "results": [{"url": "...", "final_url": "...", "status": 200, ...}],
+        "elapsed": 3.1
+    }
+    """
+    try:
+        data = request.get_json()
+        urls = data.get('urls') if data else None
+        
+        if not urls or not isinstance(urls, list):
+            return jsonify({"success": False, "error": "urls must be a non-empty list"}), 400
+        
+        forwarded = forward_to_owner('/fetch_many', data, data.get('domain') or urlparse(urls[0]).netloc)
+        if forwarded is not None:
+            return forwarded
+        
+        payload, status_code = run_fetch(data, urls)
+        return jsonify(payload), status_code
+        
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+http_fast_path = HttpFastPath(
+    max_hosts=PROXY_FETCH_MAX_HOSTS,
+    per_host=PROXY_FETCH_PER_HOST,
+    http2=PROXY_FETCH_HTTP2
+)
+
+# 主机 -> 到期时间：HTTP 快速通道在重新求解后仍被挑战（如校验 TLS 指纹），到期前直接用浏览器访问
+browser_only_hosts = {}
+
+PROXY_FETCH_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+PROXY_FETCH_DEFAULT_HEADERS = {
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+    "Accept-Language": "zh-CN,zh;q=0.9,en;q=0.8",
+}
+
+def session_cookie_header(url, proxy=None):
+    """按 URL 的主机（+ 代理）从会话存储取 Cookie 头（重定向的每一跳都会重新调用）"""
+    session_data = session_store.get(get_session_file(url, proxy))
+    if not session_data or not session_data.get('cookies'):
+        return None
+    return "; ".join(f"{cookie['name']}={cookie['value']}" for cookie in session_data['cookies'])
+
+def escalate_to_solve(data, url):
+    """HTTP 请求遇到挑战或没有会话时用浏览器重新求解，返回 (响应字典, 状态码)"""
+    solve_data = {"url": url, "headless": True, "timeout": data.get('solve_timeout', 60), "use_cache": False}
+    if data.get('proxy'):
+        solve_data['proxy'] = data['proxy']
+    return run_solve(solve_data)
+
+def send_proxy_fetch(data, url, method, user_agent):
+    """用会话的 User-Agent + cookies 发送一次 HTTP 请求"""
+    headers = {**PROXY_FETCH_DEFAULT_HEADERS, **(data.get('headers') or {}), "User-Agent": user_agent}
+    body = data.get('body')
+    if data.get('json') is not None:
+        body = json.dumps(data['json'], ensure_ascii=False).encode('utf-8')
+        headers.setdefault("Content-Type", "application/json")
+    return http_fast_path.fetch(
+        method, url,
+        headers=headers,
+        body=body,
+        cookie_header_for=lambda hop_url: session_cookie_header(hop_url, data.get('proxy')),
+        proxy=data.get('proxy'),
+        timeout=data.get('timeout', PROXY_FETCH_TIMEOUT),
+        max_bytes=data.get('max_bytes', PROXY_FETCH_MAX_BYTES)
+    )
+
+def proxy_fetch_payload(url, response, challenged, via, started, include_headers):
+    """HTTP 响应 -> /proxy_fetch 响应体（文本按 charset 解码，其余类型 base64）"""
+    headers = response['headers']
+    payload = {
+        "success": not challenged,
+        "via": via,
+        "url": url,
+        "final_url": response['url'],
+        "status": response['status'],
+        "http_version": response['http_version'],
+        "redirects": response['redirects'],
+        "challenged": challenged,
+        "truncated": response['truncated'],
+        "bytes": len(response['body']),
+        "set_cookies": response['set_cookies'],
+        "http_elapsed": response['elapsed'],
+        "elapsed": round(time.monotonic() - started, 3)
+    }
+    if include_headers:
+        payload["headers"] = headers
+    if is_text(headers):
+        try:
+            payload["body"] = response['body'].decode(response_charset(headers), errors="replace")
+        except LookupError:
+            payload["body"] = response['body'].decode("utf-8", errors="replace")
+    else:
+        payload["body"] = base64.b64encode(response['body']).decode("ascii")
+        payload["body_encoding"] = "base64"
+    if challenged:
+        payload["error"] = "Cloudflare 挑战未通过"
+    return payload
+
+def browser_fallback(data, url, started):
+    """HTTP 无法通过时用该域名已保留的浏览器访问，没有空闲驱动时返回 None"""
+    payload, status_code = run_fetch({"domain": urlparse(url).netloc.lower(), "include_html": True,
+                                      "timeout": data.get('solve_timeout', 60)}, [url])
+    if 'results' not in payload:
+        return None
+    result = payload['results'][0]
+    return {
+        "success": result['success'],
+        "via": "browser",
+        "url": url,
+        "final_url": result.get('final_url'),
+        "status": result.get('status'),
+        "challenged": not result['success'],
+        "body": result.get('html'),
+        "driver_id": payload['driver_id'],
+        "elapsed": round(time.monotonic() - started, 3),
+        **({"error": result['error']} if result.get('error') else {})
+    }
+
+def run_proxy_fetch(data):
+    """
+    HTTP 快速通道：会话 cookies + UA 直接请求，遇到挑战时重新求解后重试一次，仍失败时退回浏览器
+
+    返回 (响应字典, HTTP 状态码)
+    """
+    url = data['url']
+    method = (data.get('method') or 'GET').upper()
+    escalate = data.get('escalate', True)
+    host = urlparse(url).netloc.lower()
+    started = time.monotonic()
+    
+    # 已知 HTTP 走不通的主机直接用浏览器
+    if method == 'GET' and browser_only_hosts.get(host, 0) > time.monotonic():
+        payload = browser_fallback(data, url, started)
+        if payload is not None:
+            return payload, 200
+    
+    session_file = get_session_file(url, data.get('proxy'))
+    session_refresher.touch(session_file)
+    session_data = session_store.get(session_file)
+    
+    solved = None
+    if session_data is None:
+        if not escalate:
+            return {"success": False, "exists": False, "error": "会话不存在，请先调用 /solve"}, 404
+        logger.info("🆕 /proxy_fetch 没有会话，先求解: %s", url, extra=fields(url=url))
+        solved, status_code = escalate_to_solve(data, url)
+        if not solved.get('success'):
+            return solved, status_code
+        session_data = {"cookies": solved['cookies_list'], "user_agent": solved['user_agent']}
+    
+    response = send_proxy_fetch(data, url, method, session_data['user_agent'])
+    challenged = looks_challenged(response['status'], response['headers'], response['body'])
+    
+    if challenged and escalate and solved is None:
+        logger.info("🔁 HTTP 请求遇到挑战 (%s)，重新求解: %s", response['status'], url,
+                    extra=fields(url=url, status=response['status']))
+        solved, status_code = escalate_to_solve(data, url)
+        if not solved.get('success'):
+            return solved, status_code
+        response = send_proxy_fetch(data, url, method, solved['user_agent'])
+        challenged = looks_challenged(response['status'], response['headers'], response['body'])
+    
+    via = "http" if solved is None else "http_after_solve"
+    
+    if challenged and solved is not None and method == 'GET' and data.get('browser_fallback', True):
+        # 刚求解的 cookie 仍被拒绝：HTTP 客户端本身被识别，记住该主机并改用浏览器
+        browser_only_hosts[host] = time.monotonic() + PROXY_FETCH_BROWSER_TTL
+        logger.warning("⚠️  重新求解后 HTTP 仍被挑战，%ss 内改用浏览器: %s", PROXY_FETCH_BROWSER_TTL, host,
+                       extra=fields(url=url, host=host))
+        payload = browser_fallback(data, url, started)
+        if payload is not None:
+            return payload, 200
+    elif solved is not None and not solved.get('coalesced') and solved.get('driver_id'):
+        # HTTP 已经可用，求解用的浏览器不再需要
+        active_drivers.close(solved['driver_id'])
+    
+    return proxy_fetch_payload(url, response, challenged, via, started, data.get('include_headers', True)), 200
+
+@app.route('/proxy_fetch', methods=['POST'])
+def proxy_fetch():
+    """
+    用已保存会话的 cookies + User-Agent 直接发 HTTP 请求（连接池 keep-alive，可用时 HTTP/2），
+    响应是 Cloudflare 挑战页时才升级为浏览器求解
+    
+    请求体:
+    {
+        "url": "https://m.iyf.tv/api/list",
+        "method": "GET",             // 可选
+        "headers": {...},            // 可选，附加请求头（User-Agent 和 Cookie 固定使用会话中的值）
+        "body": "...",               // 可选，原始请求体；或 "json": {...}
+        "proxy": "http://...",       // 可选，会话是通过代理求解的时候必须使用同一个代理
+        "timeout": 15,
+        "max_bytes": 10485760,       // 可选，响应体最多读取的字节数
+        "escalate": true,            // 可选，没有会话或遇到挑战时是否自动求解（默认 true）
+        "browser_fallback": true,    // 可选，重新求解后仍被挑战时是否用浏览器访问（仅 GET）
+        "solve_timeout": 60,
+        "include_headers": true
+    }
+    
+    响应:
+    {
+        "success": true,
+        "via": "http",               // http / http_after_solve / browser
+        "status": 200,
+        "final_url": "...",
+        "http_version": "HTTP/2",
+        "headers": {...},
+        "body": "...",               // 非文本类型时为 base64，body_encoding 为 "base64"
+        "challenged": false,
+        "set_cookies": {...},
+        "elapsed": 0.12
+    }
+    """
+    via = "http"
+    started = time.perf_counter()
+    try:
+        data = request.get_json()
+        url = data.get('url') if data else None
+        
+        if not url:
+            return jsonify({"success": False, "error": "URL is required"}), 400
+        if (data.get('method') or 'GET').upper() not in PROXY_FETCH_METHODS:
+            return jsonify({"success": False, "error": f"method must be one of: {', '.join(PROXY_FETCH_METHODS)}"}), 400
+        
+        payload, status_code = run_proxy_fetch(data)
+        via = payload.get('via', via)
+        if status_code == 200:
+            proxy_fetch_total.inc(via=via, result="ok" if payload.get('success') else "challenged")
+        else:
+            proxy_fetch_total.inc(via=via, result="error")
+        return jsonify(payload), status_code
+        
+    except HostBusy as e:
+        proxy_fetch_total.inc(via=via, result="error")
+        return jsonify({"success": False, "error": str(e)}), 429
+    except Exception as e:
+        logger.warning("⚠️  /proxy_fetch 失败: %s", e, extra=fields(url=(request.get_json(silent=True) or {}).get('url')))
+        proxy_fetch_total.inc(via=via, result="error")
+        return jsonify({"success": False, "error": str(e)}), 502
+    finally:
+        proxy_fetch_seconds.observe(time.perf_counter() - started, via=via)
+
 @app.route('/close_driver', methods=['POST'])
 def close_driver():
     """
@@ -302,11 +1843,14 @@ def close_driver():
         data = request.get_json()
         driver_id = data.get('driver_id')
         
-        if driver_id and driver_id in active_drivers:
-            driver = active_drivers[driver_id]
-            driver.quit()
-            del active_drivers[driver_id]
-            return jsonify({"success": True, "message": "驱动已关闭"})
+        recycled = active_drivers.close(driver_id) if driver_id else None
+        
+        if recycled is not None:
+            return jsonify({
+                "success": True,
+                "recycled": recycled,
+                "message": "驱动已回收到预热池" if recycled else "驱动已关闭"
+            })
         
         return jsonify({"success": False, "message": "驱动不存在"})
         
@@ -318,11 +1862,10 @@ def close_all():
     """关闭所有浏览器驱动"""
     try:
         count = 0
-        for driver_id in list(active_drivers.keys()):
+        for driver_id in active_drivers.ids():
             try:
-                active_drivers[driver_id].quit()
-                del active_drivers[driver_id]
-                count += 1
+                if active_drivers.close(driver_id) is not None:
+                    count += 1
             except:
                 pass
         
@@ -334,29 +1877,66 @@ def close_all():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def start_background_workers():
+    """启动预热池、驱动回收和会话刷新线程"""
+    driver_pool.start()
+    active_drivers.start()
+    profile_cache.enforce_limits()
+    if cluster_node is not None:
+        cluster_node.start()
+        job_manager.start()
+    if REFRESH_ENABLED:
+        session_refresher.start()
+
+def cleanup():
+    """停止后台线程，落盘会话并关闭所有驱动"""
+    logger.info("正在清理资源...")
+    session_refresher.shutdown()
+    job_manager.shutdown()
+    if cluster_node is not None:
+        cluster_node.shutdown()
+    session_store.close()
+    http_fast_path.close()
+    active_drivers.shutdown()
+    driver_pool.shutdown()
+    shutdown_logging()
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 Cloudflare 绕过服务启动中...")
     print("="*60)
     print(f"📦 使用引擎: undetected-chromedriver")
-    print(f"📁 会话存储目录: {os.path.abspath(SESSION_DIR)}")
+    print(f"📁 会话存储目录: {os.path.abspath(SESSION_DIR)} (后端: {SESSION_BACKEND})")
+    print(f"🔄 会话刷新: {'提前 ' + str(REFRESH_LEAD_TIME) + 's' if REFRESH_ENABLED else '关闭'}")
+    print(f"🕸️  集群模式: {'节点 ' + CLUSTER_NODE_ID + ' @ ' + CLUSTER_DB if CLUSTER_DB else '关闭'}")
+    print(f"🧩 chromedriver 缓存: {DRIVER_CACHE_DIR if DRIVER_CACHE_ENABLED else '关闭'}")
+    print(f"🗂️  持久化 profile: {os.path.abspath(PROFILE_DIR)} ({'默认启用' if PROFILES_DEFAULT else '按请求启用'}, 最多 {PROFILE_MAX_COUNT} 个 / {PROFILE_MAX_TOTAL_MB}MB)")
+    print(f"🚫 资源拦截: {BLOCK_PROFILE} (规则: {BLOCK_RULES_FILE or '无'}), 加载策略: {PAGE_LOAD_STRATEGY}")
+    print(f"♨️  预热池: 无头 {POOL_MIN_HEADLESS} / 有头 {POOL_MIN_HEADED} (每桶最多 {POOL_MAX_SIZE})")
     print(f"🌐 服务地址: http://localhost:5000")
     print("="*60)
     print("\n可用的 API 端点:")
     print("  GET  /health          - 健康检查")
-    print("  POST /solve           - 解决 Cloudflare 挑战")
+    print("  GET  /metrics         - Prometheus 指标")
+    print("  POST /solve           - 解决 Cloudflare 挑战（async: true 时返回 job_id）")
+    print("  POST /solve_batch     - 批量求解（按域名去重、并行，NDJSON 流式返回）")
+    print("  GET  /jobs            - 异步任务列表")
+    print("  GET  /jobs/<id>       - 查询异步任务（?wait= 长轮询）")
+    print("  DELETE /jobs/<id>     - 取消异步任务")
+    print("  POST /cancel          - 按请求 id / 任务 id 取消进行中的求解")
+    print("  POST /fetch           - 用已求解的驱动访问页面")
+    print("  POST /fetch_many      - 用已求解的驱动批量访问页面")
+    print("  POST /proxy_fetch     - 用已保存会话直接发 HTTP 请求（遇到挑战时自动求解）")
     print("  POST /get_session     - 获取已保存的会话")
     print("  POST /close_driver    - 关闭指定驱动")
     print("  POST /close_all       - 关闭所有驱动")
+    print("\n💡 生产环境请使用: python serve.py bypass")
     print("\n" + "="*60 + "\n")
     
+    start_background_workers()
+    
     try:
         app.run(host='0.0.0.0', port=5000, debug=False)
     finally:
         # 清理所有驱动
-        print("\n正在清理资源...")
-        for driver in active_drivers.values():
-            try:
-                driver.quit()
-            except:
-                pass
+        cleanup()
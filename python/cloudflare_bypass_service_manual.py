@@ -2,14 +2,20 @@
 Cloudflare 绕过服务 - 支持手动干预
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import undetected_chromedriver as uc
-import json
 import os
+import threading
 import time
 from datetime import datetime
 from urllib.parse import urlparse
 
+import progress
+from clearance import has_clearance_cookie, probe_page
+from driver_cache import DriverCache
+from session_backends import create_backend
+from session_store import SessionStore
+
 app = Flask(__name__)
 
 SESSION_DIR = "cf_sessions"
@@ -17,6 +23,19 @@ os.makedirs(SESSION_DIR, exist_ok=True)
 
 active_drivers = {}
 
+# 与 cloudflare_bypass_service.py 使用相同的后端配置
+SESSION_BACKEND = os.environ.get("CF_SESSION_BACKEND", "json")
+SESSION_DB = os.environ.get("CF_SESSION_DB", os.path.join(SESSION_DIR, "sessions.db"))
+
+session_store = SessionStore(backend=create_backend(SESSION_BACKEND, SESSION_DIR, SESSION_DB))
+
+# 与 cloudflare_bypass_service.py 共用同一个 chromedriver 缓存目录
+DRIVER_CACHE_ENABLED = os.environ.get("CF_DRIVER_CACHE", "1") == "1"
+DRIVER_CACHE_DIR = os.environ.get("CF_DRIVER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cf_bypass", "chromedriver"))
+
+driver_cache = DriverCache(DRIVER_CACHE_DIR, enabled=DRIVER_CACHE_ENABLED,
+                           chrome_version_override=os.environ.get("CF_CHROME_VERSION") or None)
+
 def get_session_file(url):
     domain = urlparse(url).netloc.replace(":", "_").replace(".", "_")
     return os.path.join(SESSION_DIR, f"session_{domain}.json")
@@ -31,10 +50,7 @@ def save_cookies(driver, session_file):
         "timestamp": datetime.now().isoformat()
     }
     
-    with open(session_file, 'w', encoding='utf-8') as f:
-        json.dump(session_data, f, indent=2, ensure_ascii=False)
-    
-    return session_data
+    return session_store.put(session_file, session_data)
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -42,7 +58,9 @@ def health_check():
         "status": "ok",
         "service": "Cloudflare Bypass Service (Manual Mode)",
         "version": "1.0.0",
-        "active_drivers": len(active_drivers)
+        "active_drivers": len(active_drivers),
+        "session_store": session_store.stats(),
+        "driver_cache": driver_cache.stats()
     })
 
 @app.route('/solve_manual', methods=['POST'])
@@ -54,12 +72,63 @@ def solve_challenge_manual():
     {
         "url": "https://m.iyf.tv/",
         "headless": false,
-        "manual_wait": 60  # 等待用户手动点击的时间（秒）
+        "manual_wait": 60,  # 等待用户手动点击的时间（秒）
+        "stream": "sse"     # 可选，"sse" / "ndjson" 流式返回进度事件（也可用 Accept: text/event-stream）
     }
+    
+    流式模式下依次推送 accepted、driver_launching、driver_acquired、navigation_started、navigation_done、
+    manual_wait、challenge_detected、cleared、cookies_saved，最后一条 result 为完整响应；客户端断开时关闭浏览器
+    """
+    data = request.get_json() or {}
+    
+    stream_format = progress.stream_format(data.get('stream'), request.headers.get('Accept'))
+    if stream_format:
+        cancel_event = threading.Event()
+        events = progress.stream(lambda: run_solve_manual(data, cancel_event), stream_format, cancel_event)
+        return Response(stream_with_context(events), mimetype=progress.CONTENT_TYPES[stream_format],
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    
+    payload, status_code = run_solve_manual(data)
+    return jsonify(payload), status_code
+
+def wait_for_manual(driver, manual_wait, cancel_event=None):
+    """
+    等待 manual_wait 秒让用户手动操作；有人订阅进度时每秒探测一次页面，推送挑战出现 / 通过事件
+    
+    被取消时返回 False
     """
+    deadline = time.monotonic() + manual_wait
+    challenge_seen = False
+    cleared = False
+    
+    while True:
+        if progress.active() and not cleared:
+            try:
+                state = probe_page(driver)
+            except Exception:
+                state = {}
+            if state.get('challenge') and not challenge_seen:
+                challenge_seen = True
+                progress.emit("challenge_detected", title=state.get('title'))
+            elif has_clearance_cookie(driver) or (challenge_seen and state and not state.get('challenge')):
+                cleared = True
+                progress.emit("cleared", challenge_seen=challenge_seen)
+        
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        
+        interval = min(1.0, remaining) if progress.active() else remaining
+        if cancel_event is not None:
+            if cancel_event.wait(interval):
+                return False
+        else:
+            time.sleep(interval)
+
+def run_solve_manual(data, cancel_event=None):
+    """启动浏览器并等待用户处理挑战，返回 (响应字典, HTTP 状态码)"""
     driver = None
     try:
-        data = request.get_json()
         url = data.get('url')
         headless = data.get('headless', False)
         manual_wait = data.get('manual_wait', 60)
@@ -81,9 +150,15 @@ def solve_challenge_manual():
         options.add_argument('--disable-gpu')
         
         print(f"[{datetime.now()}] 🔧 启动浏览器...")
-        driver = uc.Chrome(options=options, version_main=None)
+        progress.emit("driver_launching", headless=headless)
+        launch_started = time.perf_counter()
+        driver = uc.Chrome(options=options, **driver_cache.launch_options())
+        launch_seconds = time.perf_counter() - launch_started
+        driver_cache.record_launch(launch_seconds)
         
-        print(f"[{datetime.now()}] ✅ 浏览器启动成功")
+        print(f"[{datetime.now()}] ✅ 浏览器启动成功 ({launch_seconds * 1000:.0f}ms)")
+        progress.emit("driver_launched", launch_ms=round(launch_seconds * 1000, 1))
+        progress.emit("driver_acquired", pool_hit=False)
         
         # 设置移动设备模拟
         print(f"[{datetime.now()}] 📱 设置移动设备指标...")
@@ -116,7 +191,9 @@ def solve_challenge_manual():
         driver.set_page_load_timeout(120)
         
         print(f"[{datetime.now()}] 🌐 访问 URL: {url}")
+        progress.emit("navigation_started", url=url)
         driver.get(url)
+        progress.emit("navigation_done", url=driver.current_url)
         
         print(f"\n{'='*60}")
         print(f"⏳ 等待 {manual_wait} 秒")
@@ -125,7 +202,11 @@ def solve_challenge_manual():
         print(f"{'='*60}\n")
         
         # 等待用户手动操作或自动完成
-        time.sleep(manual_wait)
+        progress.emit("manual_wait", seconds=manual_wait)
+        if not wait_for_manual(driver, manual_wait, cancel_event):
+            print(f"[{datetime.now()}] 🛑 客户端已断开，关闭浏览器")
+            driver.quit()
+            return {"success": False, "cancelled": True, "error": "任务已取消"}, 409
         
         # 检查页面状态
         current_url = driver.current_url
@@ -141,6 +222,7 @@ def solve_challenge_manual():
         
         print(f"[{datetime.now()}] 💾 会话已保存: {session_file}")
         print(f"[{datetime.now()}] 📊 Cookies: {len(session_data['cookies'])} 个")
+        progress.emit("cookies_saved", cookies=len(session_data['cookies']))
         
         cookies_dict = {cookie['name']: cookie['value'] for cookie in session_data['cookies']}
         
@@ -150,7 +232,7 @@ def solve_challenge_manual():
         print(f"[{datetime.now()}] ✅ 完成!")
         print(f"{'='*60}\n")
         
-        return jsonify({
+        return {
             "success": True,
             "cookies": cookies_dict,
             "cookies_list": session_data['cookies'],
@@ -160,7 +242,7 @@ def solve_challenge_manual():
             "current_url": current_url,
             "page_title": page_title,
             "message": "挑战完成（可能需要手动操作）"
-        })
+        }, 200
         
     except Exception as e:
         print(f"[{datetime.now()}] ❌ 错误: {e}")
@@ -173,10 +255,10 @@ def solve_challenge_manual():
             except:
                 pass
         
-        return jsonify({
+        return {
             "success": False,
             "error": str(e)
-        }), 500
+        }, 500
 
 @app.route('/close_driver', methods=['POST'])
 def close_driver():
@@ -193,12 +275,25 @@ def close_driver():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+def start_background_workers():
+    """手动模式没有常驻后台线程（会话写入线程按需启动）"""
+
+def cleanup():
+    """关闭所有驱动并落盘会话"""
+    print("\n正在清理资源...")
+    for driver in active_drivers.values():
+        try:
+            driver.quit()
+        except:
+            pass
+    session_store.close()
+
 if __name__ == '__main__':
     print("\n" + "="*60)
     print("🚀 Cloudflare 绕过服务启动中（手动模式）...")
     print("="*60)
     print(f"📦 使用引擎: undetected-chromedriver")
-    print(f"📁 会话存储目录: {os.path.abspath(SESSION_DIR)}")
+    print(f"📁 会话存储目录: {os.path.abspath(SESSION_DIR)} (后端: {SESSION_BACKEND})")
     print(f"🌐 服务地址: http://localhost:5001")
     print(f"💡 支持手动干预 Cloudflare 验证")
     print("="*60)
@@ -206,14 +301,10 @@ if __name__ == '__main__':
     print("  GET  /health          - 健康检查")
     print("  POST /solve_manual    - 解决挑战（支持手动）")
     print("  POST /close_driver    - 关闭驱动")
+    print("\n💡 生产环境请使用: python serve.py manual")
     print("\n" + "="*60 + "\n")
     
     try:
         app.run(host='0.0.0.0', port=5001, debug=False)
     finally:
-        print("\n正在清理资源...")
-        for driver in active_drivers.values():
-            try:
-                driver.quit()
-            except:
-                pass
+        cleanup()
@@ -0,0 +1,652 @@
+"""
+集群模式
+多台服务节点共享会话库和任务队列：
+- SqliteBroker: 基于共享 SQLite 文件的本地替代实现（节点心跳、求解租约、任务队列），便于测试
+- ClusterNode: 节点心跳、按域名计算归属节点（亲和路由）、跨节点求解租约
+- ClusterJobQueue: 与 JobManager 接口相同的分布式任务队列，任务以租约方式被某个节点认领，
+  节点失联后租约过期，任务由其他节点重新认领
+
+同一个域名同一时间只有一个节点在求解，其余节点等待租约释放后直接使用共享会话库中的结果
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlparse
+
+from job_queue import (CANCELLED, FAILED, FINISHED_STATES, QUEUED, RUNNING, SUCCEEDED,
+                       CancelToken, DeadlineExceeded, JobCancelled, JobQueueFull, raise_if_cancelled)
+from session_backends import SQLITE_POOL_SIZE, SqliteConnectionPool
+
+logger = logging.getLogger(__name__)
+
+
+def rendezvous_pick(key, slots):
+    """最高随机权重（HRW）哈希：slots 变化时只有落在变化 slot 上的 key 会迁移"""
+    best, best_score = None, None
+    for slot in slots:
+        digest = hashlib.blake2b(f"{slot}:{key}".encode("utf-8"), digest_size=8).digest()
+        score = int.from_bytes(digest, "big")
+        if best_score is None or score > best_score:
+            best, best_score = slot, score
+    return best
+
+
+class SqliteBroker:
+    """
+    集群协调用的 SQLite 仓库（WAL 模式），可以和会话库共用同一个文件
+
+    连接取自有界连接池（与 SqliteBackend 相同）；认领任务、获取租约等读-改-写操作在 BEGIN IMMEDIATE 事务中完成
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS cluster_nodes (
+        node_id TEXT PRIMARY KEY,
+        url TEXT,
+        started_at REAL,
+        heartbeat REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS cluster_leases (
+        lease_key TEXT PRIMARY KEY,
+        owner TEXT NOT NULL,
+        expires_at REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS cluster_jobs (
+        job_id TEXT PRIMARY KEY,
+        kind TEXT NOT NULL,
+        domain TEXT,
+        url TEXT,
+        params TEXT NOT NULL,
+        status TEXT NOT NULL,
+        owner TEXT,
+        lease_expires REAL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        cancel_requested INTEGER NOT NULL DEFAULT 0,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        status_code INTEGER,
+        result TEXT,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_cluster_jobs_status ON cluster_jobs(status, created_at);
+    CREATE INDEX IF NOT EXISTS idx_cluster_jobs_owner ON cluster_jobs(owner);
+    """
+
+    def __init__(self, db_path, pool_size=SQLITE_POOL_SIZE):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        # 自动提交模式，需要原子性的地方显式 BEGIN IMMEDIATE
+        self._pool = SqliteConnectionPool(db_path, pool_size, isolation_level=None, row_factory=sqlite3.Row)
+
+        with self._pool.connection() as conn:
+            conn.executescript(self.SCHEMA)
+
+    @contextmanager
+    def _transaction(self):
+        with self._pool.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    # ---- 节点 ----
+
+    def heartbeat(self, node_id, url, started_at):
+        with self._pool.connection() as conn:
+            conn.execute("""
+                INSERT INTO cluster_nodes (node_id, url, started_at, heartbeat) VALUES (?, ?, ?, ?)
+                ON CONFLICT(node_id) DO UPDATE SET url = excluded.url, heartbeat = excluded.heartbeat
+            """, (node_id, url, started_at, time.time()))
+
+    def remove_node(self, node_id):
+        with self._pool.connection() as conn:
+            conn.execute("DELETE FROM cluster_nodes WHERE node_id = ?", (node_id,))
+
+    def live_nodes(self, ttl):
+        with self._pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT node_id, url, started_at, heartbeat FROM cluster_nodes WHERE heartbeat >= ? ORDER BY node_id",
+                (time.time() - ttl,)
+            )
+            return [dict(row) for row in rows]
+
+    # ---- 租约 ----
+
+    def acquire_lease(self, key, owner, ttl):
+        """获取租约，成功返回 owner，被其他节点持有时返回持有者"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT owner, expires_at FROM cluster_leases WHERE lease_key = ?", (key,)
+            ).fetchone()
+            if row is not None and row["owner"] != owner and row["expires_at"] > now:
+                return row["owner"]
+            conn.execute("""
+                INSERT INTO cluster_leases (lease_key, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT(lease_key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+            """, (key, owner, now + ttl))
+            return owner
+
+    def renew_leases(self, keys, owner, ttl):
+        if not keys:
+            return
+        expires_at = time.time() + ttl
+        with self._pool.connection() as conn:
+            conn.executemany(
+                "UPDATE cluster_leases SET expires_at = ? WHERE lease_key = ? AND owner = ?",
+                [(expires_at, key, owner) for key in keys]
+            )
+
+    def release_lease(self, key, owner):
+        with self._pool.connection() as conn:
+            conn.execute("DELETE FROM cluster_leases WHERE lease_key = ? AND owner = ?", (key, owner))
+
+    def lease_holder(self, key):
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT owner FROM cluster_leases WHERE lease_key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row["owner"] if row else None
+
+    # ---- 任务 ----
+
+    def submit_job(self, job_id, kind, domain, params, max_queue):
+        """写入排队任务，队列已满时返回当前排队数，否则返回 None"""
+        with self._transaction() as conn:
+            queued = conn.execute("SELECT COUNT(*) FROM cluster_jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+            if queued >= max_queue:
+                return queued
+            conn.execute("""
+                INSERT INTO cluster_jobs (job_id, kind, domain, url, params, status, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (job_id, kind, domain, params.get("url"), json.dumps(params, ensure_ascii=False), QUEUED, time.time()))
+            return None
+
+    def claim_jobs(self, owner, limit, lease_ttl, accept, max_attempts):
+        """
+        认领最多 limit 个任务：排队中的，或租约已过期（原节点失联）的执行中任务
+
+        accept(domain, age) 决定本节点是否认领（域名亲和）；返回 [(job_id, kind, params)]
+        """
+        now = time.time()
+        claimed = []
+        with self._transaction() as conn:
+            rows = conn.execute("""
+                SELECT job_id, kind, domain, params, status, attempts, created_at FROM cluster_jobs
+                WHERE status = ? OR (status = ? AND lease_expires < ?)
+                ORDER BY created_at LIMIT ?
+            """, (QUEUED, RUNNING, now, max(limit * 10, 50))).fetchall()
+
+            for row in rows:
+                if len(claimed) >= limit:
+                    break
+                if not accept(row["domain"], now - row["created_at"]):
+                    continue
+                if row["attempts"] >= max_attempts:
+                    conn.execute("""
+                        UPDATE cluster_jobs SET status = ?, finished_at = ?, status_code = 500, error = ?, result = ?
+                        WHERE job_id = ?
+                    """, (FAILED, now, "执行节点多次失联", json.dumps({"success": False, "error": "执行节点多次失联"}),
+                          row["job_id"]))
+                    continue
+                conn.execute("""
+                    UPDATE cluster_jobs SET status = ?, owner = ?, lease_expires = ?, attempts = attempts + 1,
+                        started_at = COALESCE(started_at, ?)
+                    WHERE job_id = ?
+                """, (RUNNING, owner, now + lease_ttl, now, row["job_id"]))
+                claimed.append((row["job_id"], row["kind"], json.loads(row["params"])))
+        return claimed
+
+    def renew_jobs(self, job_ids, owner, ttl):
+        """续约本节点执行中的任务，返回其中被请求取消的任务 id"""
+        if not job_ids:
+            return set()
+        expires_at = time.time() + ttl
+        placeholders = ",".join("?" * len(job_ids))
+        with self._pool.connection() as conn:
+            conn.executemany(
+                "UPDATE cluster_jobs SET lease_expires = ? WHERE job_id = ? AND owner = ? AND status = ?",
+                [(expires_at, job_id, owner, RUNNING) for job_id in job_ids]
+            )
+            rows = conn.execute(
+                f"SELECT job_id FROM cluster_jobs WHERE cancel_requested = 1 AND job_id IN ({placeholders})",
+                list(job_ids)
+            )
+            return {row["job_id"] for row in rows}
+
+    def finish_job(self, job_id, owner, status, payload, status_code, error=None):
+        with self._pool.connection() as conn:
+            conn.execute("""
+                UPDATE cluster_jobs SET status = ?, finished_at = ?, status_code = ?, result = ?, error = ?
+                WHERE job_id = ? AND owner = ? AND status = ?
+            """, (status, time.time(), status_code, json.dumps(payload, ensure_ascii=False), error,
+                  job_id, owner, RUNNING))
+
+    def requeue_job(self, job_id, owner):
+        """节点退出时把未完成的任务放回队列"""
+        with self._pool.connection() as conn:
+            conn.execute("""
+                UPDATE cluster_jobs SET status = ?, owner = NULL, lease_expires = NULL, attempts = MAX(attempts - 1, 0)
+                WHERE job_id = ? AND owner = ? AND status = ? AND cancel_requested = 0
+            """, (QUEUED, job_id, owner, RUNNING))
+
+    def cancel_job(self, job_id):
+        """排队中的直接取消，执行中的设置取消标记，由执行节点在下次续约时中止"""
+        with self._transaction() as conn:
+            conn.execute("""
+                UPDATE cluster_jobs SET status = ?, finished_at = ?, status_code = 409, result = ?, cancel_requested = 1
+                WHERE job_id = ? AND status = ?
+            """, (CANCELLED, time.time(), json.dumps({"success": False, "cancelled": True, "error": "任务已取消"},
+                                                     ensure_ascii=False), job_id, QUEUED))
+            conn.execute(
+                "UPDATE cluster_jobs SET cancel_requested = 1 WHERE job_id = ? AND status = ?", (job_id, RUNNING)
+            )
+
+    def get_job(self, job_id):
+        with self._pool.connection() as conn:
+            row = conn.execute("SELECT * FROM cluster_jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list_jobs(self, limit=200):
+        with self._pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT job_id, kind, domain, url, params, status, owner, lease_expires, attempts, cancel_requested,
+                       created_at, started_at, finished_at, status_code, NULL AS result, error
+                FROM cluster_jobs ORDER BY created_at DESC LIMIT ?
+            """, (limit,))
+            return [dict(row) for row in rows]
+
+    def job_counts(self):
+        with self._pool.connection() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM cluster_jobs GROUP BY status")
+            return {row["status"]: row["n"] for row in rows}
+
+    def purge(self, retention, node_ttl):
+        """清理过期的已完成任务、租约和失联节点"""
+        now = time.time()
+        placeholders = ",".join("?" * len(FINISHED_STATES))
+        with self._pool.connection() as conn:
+            conn.execute(
+                f"DELETE FROM cluster_jobs WHERE status IN ({placeholders}) AND finished_at < ?",
+                (*FINISHED_STATES, now - retention)
+            )
+            conn.execute("DELETE FROM cluster_leases WHERE expires_at < ?", (now,))
+            conn.execute("DELETE FROM cluster_nodes WHERE heartbeat < ?", (now - node_ttl * 20,))
+
+    def close(self):
+        self._pool.close()
+
+class ClusterNode:
+    """
+    本节点在集群中的身份
+
+    - node_id: 节点唯一标识
+    - url: 其他节点转发请求用的地址（如 http://10.0.0.5:5000），为空时不参与请求转发
+    - heartbeat_interval / node_ttl: 心跳间隔，超过 node_ttl 未心跳的节点视为失联
+    - lease_ttl: 求解租约的有效期，持有期间由心跳线程续约
+    """
+
+    def __init__(self, broker, node_id, url="", heartbeat_interval=5, node_ttl=15, lease_ttl=30, retention=600):
+        self.broker = broker
+        self.node_id = node_id
+        self.url = url.rstrip("/")
+        self.heartbeat_interval = heartbeat_interval
+        self.node_ttl = node_ttl
+        self.lease_ttl = lease_ttl
+        self.retention = retention
+        self.started_at = time.time()
+
+        self._held = {}
+        self._nodes = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {"leases_acquired": 0, "leases_waited": 0, "forwarded": 0, "heartbeat_errors": 0}
+
+    def start(self):
+        if self._thread is None:
+            self._beat()
+            self._thread = threading.Thread(target=self._loop, name="cluster-heartbeat", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        with self._lock:
+            held, self._held = list(self._held), {}
+        try:
+            for key in held:
+                self.broker.release_lease(key, self.node_id)
+            self.broker.remove_node(self.node_id)
+        except sqlite3.Error as e:
+            logger.warning("⚠️  退出集群失败: %s", e)
+
+    def live_nodes(self):
+        with self._lock:
+            return list(self._nodes)
+
+    def owner_of(self, domain):
+        """按域名计算归属节点，返回节点信息（没有存活节点时返回 None）"""
+        nodes = {node["node_id"]: node for node in self.live_nodes()}
+        if not nodes:
+            return None
+        return nodes[rendezvous_pick(domain, nodes)]
+
+    def is_owner(self, domain):
+        owner = self.owner_of(domain)
+        return owner is None or owner["node_id"] == self.node_id
+
+    def try_lease(self, key):
+        """尝试获取求解租约：成功返回 None，否则返回持有租约的节点 id"""
+        holder = self.broker.acquire_lease(key, self.node_id, self.lease_ttl)
+        if holder != self.node_id:
+            return holder
+        with self._lock:
+            self._held[key] = self._held.get(key, 0) + 1
+            self._stats["leases_acquired"] += 1
+        return None
+
+    def release_lease(self, key):
+        with self._lock:
+            count = self._held.get(key, 0) - 1
+            if count > 0:
+                self._held[key] = count
+                return
+            self._held.pop(key, None)
+        self.broker.release_lease(key, self.node_id)
+
+    def wait_lease(self, key, timeout, cancel_event=None, poll_interval=0.5):
+        """等待其他节点释放租约，返回是否已释放"""
+        with self._lock:
+            self._stats["leases_waited"] += 1
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.broker.lease_holder(key) is None:
+                return True
+            if cancel_event is not None:
+                if cancel_event.wait(poll_interval):
+                    raise_if_cancelled(cancel_event)
+            else:
+                time.sleep(poll_interval)
+        return False
+
+    def count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["leases_held"] = len(self._held)
+            nodes = list(self._nodes)
+        stats.update({
+            "node_id": self.node_id,
+            "url": self.url or None,
+            "nodes": [
+                {"node_id": node["node_id"], "url": node["url"],
+                 "last_heartbeat": round(time.time() - node["heartbeat"], 1)}
+                for node in nodes
+            ],
+        })
+        return stats
+
+    def _beat(self):
+        self.broker.heartbeat(self.node_id, self.url, self.started_at)
+        with self._lock:
+            held = list(self._held)
+        self.broker.renew_leases(held, self.node_id, self.lease_ttl)
+        nodes = self.broker.live_nodes(self.node_ttl)
+        with self._lock:
+            self._nodes = nodes
+
+    def _loop(self):
+        beats = 0
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self._beat()
+                beats += 1
+                if beats % 60 == 0:
+                    self.broker.purge(self.retention, self.node_ttl)
+            except sqlite3.Error as e:
+                self.count("heartbeat_errors")
+                logger.warning("⚠️  集群心跳失败: %s", e)
+
+
+class _BrokerJob:
+    """broker 中的一条任务记录，提供与 job_queue.Job 相同的 id / status / to_dict()"""
+
+    def __init__(self, row):
+        self.id = row["job_id"]
+        self.kind = row["kind"]
+        self.status = row["status"]
+        self.row = row
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def timings(self):
+        now = time.time()
+        created, started, finished = self.row["created_at"], self.row["started_at"], self.row["finished_at"]
+        return {
+            "queue_wait": round((started or finished or now) - created, 3),
+            "run_time": round((finished or now) - started, 3) if started else None,
+            "total": round((finished or now) - created, 3),
+        }
+
+    def to_dict(self, include_result=True):
+        row = self.row
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "url": row["url"],
+            "created_at": datetime.fromtimestamp(row["created_at"]).isoformat(),
+            "cancel_requested": bool(row["cancel_requested"]),
+            "timings": self.timings(),
+            "node": row["owner"],
+            "attempts": row["attempts"],
+        }
+        if row["error"]:
+            data["error"] = row["error"]
+        if include_result and self.finished:
+            data["status_code"] = row["status_code"]
+            data["result"] = json.loads(row["result"]) if row["result"] else None
+        return data
+
+
+class ClusterJobQueue:
+    """
+    跨节点任务队列，接口与 JobManager 相同（submit / get / wait / cancel / list / stats / shutdown）
+
+    - handlers: {kind: fn(params, cancel_event)}，所有节点需注册相同的处理函数
+    - affinity_grace: 任务优先由域名归属节点认领，排队超过这么多秒后任何节点都可认领
+    - max_attempts: 执行节点失联后最多重新认领的次数
+    """
+
+    def __init__(self, node, handlers, max_workers=4, max_queue=100, retention=600, poll_interval=1.0,
+                 affinity_grace=5.0, max_attempts=3):
+        self.node = node
+        self.broker = node.broker
+        self.handlers = dict(handlers)
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self.poll_interval = poll_interval
+        self.affinity_grace = affinity_grace
+        self.max_attempts = max_attempts
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="cluster-job")
+        self._running = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._dispatcher = None
+        self._counters = {SUCCEEDED: 0, FAILED: 0, CANCELLED: 0, "rejected": 0, "claimed": 0, "requeued": 0}
+
+    def start(self):
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="cluster-dispatcher", daemon=True)
+            self._dispatcher.start()
+
+    def submit(self, fn, params, kind="solve"):
+        """写入共享队列，由域名归属节点（或空闲节点）认领执行"""
+        self.handlers.setdefault(kind, fn)
+        job_id = uuid.uuid4().hex
+        domain = urlparse(params.get("url") or "").netloc.lower() or None
+        queued = self.broker.submit_job(job_id, kind, domain, params, self.max_queue)
+        if queued is not None:
+            with self._lock:
+                self._counters["rejected"] += 1
+            raise JobQueueFull(f"队列已满 ({queued}/{self.max_queue})")
+        # 立即尝试认领，避免本节点空闲时多等一个轮询周期
+        self._wakeup()
+        return self.get(job_id)
+
+    def get(self, job_id):
+        row = self.broker.get_job(job_id)
+        return _BrokerJob(row) if row else None
+
+    def wait(self, job_id, timeout):
+        """长轮询共享队列中的任务"""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and not job.finished and time.monotonic() < deadline:
+            time.sleep(min(0.25, max(deadline - time.monotonic(), 0)))
+            job = self.get(job_id)
+        return job
+
+    def cancel(self, job_id):
+        self.broker.cancel_job(job_id)
+        with self._lock:
+            cancel_event = self._running.get(job_id)
+        if cancel_event is not None:
+            cancel_event.set()
+        return self.get(job_id)
+
+    def list(self):
+        return [_BrokerJob(row).to_dict(include_result=False) for row in self.broker.list_jobs()]
+
+    def stats(self):
+        counts = self.broker.job_counts()
+        with self._lock:
+            counters = dict(self._counters)
+            running_here = len(self._running)
+        return {
+            "backend": "cluster",
+            "node_id": self.node.node_id,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_depth": counts.get(QUEUED, 0),
+            "running": counts.get(RUNNING, 0),
+            "running_here": running_here,
+            "tracked": sum(counts.values()),
+            "completed": counters,
+        }
+
+    def shutdown(self):
+        """停止认领；本节点执行中的任务放回队列，由其他节点继续"""
+        self._stop.set()
+        with self._lock:
+            running = list(self._running.items())
+        for job_id, cancel_event in running:
+            self.broker.requeue_job(job_id, self.node.node_id)
+            cancel_event.set()
+        self._executor.shutdown(wait=False)
+
+    def _wakeup(self):
+        try:
+            self._claim()
+        except sqlite3.Error as e:
+            logger.warning("⚠️  认领任务失败: %s", e)
+
+    def _accept(self, domain, age):
+        return domain is None or age >= self.affinity_grace or self.node.is_owner(domain)
+
+    def _claim(self):
+        if self._stop.is_set():
+            return
+        with self._lock:
+            free = self.max_workers - len(self._running)
+        if free <= 0:
+            return
+
+        claimed = self.broker.claim_jobs(self.node.node_id, free, self.node.lease_ttl, self._accept,
+                                         self.max_attempts)
+        for job_id, kind, params in claimed:
+            cancel_event = CancelToken()
+            with self._lock:
+                self._running[job_id] = cancel_event
+                self._counters["claimed"] += 1
+            self._executor.submit(self._execute, job_id, kind, params, cancel_event)
+
+    def _renew(self):
+        with self._lock:
+            job_ids = list(self._running)
+        for job_id in self.broker.renew_jobs(job_ids, self.node.node_id, self.node.lease_ttl):
+            with self._lock:
+                cancel_event = self._running.get(job_id)
+            if cancel_event is not None:
+                cancel_event.set()
+
+    def _dispatch_loop(self):
+        last_renew = 0.0
+        while not self._stop.wait(self.poll_interval):
+            try:
+                if time.monotonic() - last_renew >= self.node.lease_ttl / 3:
+                    self._renew()
+                    last_renew = time.monotonic()
+                self._claim()
+            except sqlite3.Error as e:
+                logger.warning("⚠️  集群任务调度失败: %s", e)
+
+    def _execute(self, job_id, kind, params, cancel_event):
+        owner = self.node.node_id
+        error = None
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise ValueError(f"未注册的任务类型: {kind}")
+            payload, status_code = handler(params, cancel_event)
+        except DeadlineExceeded:
+            payload, status_code = {"success": False, "deadline_exceeded": True, "error": "超过截止时间"}, 504
+        except JobCancelled:
+            payload, status_code = {"success": False, "cancelled": True, "error": "任务已取消"}, 409
+        except Exception as e:
+            error = str(e)
+            payload, status_code = {"success": False, "error": error}, 500
+
+        with self._lock:
+            self._running.pop(job_id, None)
+
+        if self._stop.is_set() and payload.get("cancelled"):
+            # 节点退出导致的中止，任务已放回队列
+            with self._lock:
+                self._counters["requeued"] += 1
+            return
+
+        if payload.get("cancelled"):
+            status = CANCELLED
+        elif payload.get("success"):
+            status = SUCCEEDED
+        else:
+            status = FAILED
+
+        try:
+            self.broker.finish_job(job_id, owner, status, payload, status_code, error)
+        except sqlite3.Error as e:
+            logger.warning("⚠️  任务结果写入失败 %s: %s", job_id, e)
+        with self._lock:
+            self._counters[status] += 1
+        self._wakeup()
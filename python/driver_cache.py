@@ -0,0 +1,238 @@
+"""
+chromedriver 补丁缓存
+uc.Chrome(version_main=None) 每次启动都会重新查询 Chrome 版本、下载并打补丁 chromedriver，
+同时启动多个浏览器时还会争抢同一个文件。这里按 Chrome 主版本号把打好补丁的 chromedriver 缓存到磁盘：
+
+- 每个进程只解析一次（线程锁），每台机器只下载 / 打补丁一次（文件锁，多进程 / 多节点共享）
+- 之后的启动直接传入 driver_executable_path / version_main，跳过版本探测和下载
+- Chrome 升级后主版本号变化，自动生成新的缓存文件
+"""
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 版本号 "120.0.6099.109"
+VERSION_PATTERN = re.compile(r"(\d+)\.(\d+)\.(\d+)\.(\d+)")
+
+# uc 打补丁后写入 chromedriver 的标记
+PATCHED_MARKER = b"undetected chromedriver"
+
+IS_WINDOWS = sys.platform.startswith("win")
+
+
+class FileLock:
+    """跨进程文件锁（Windows 用 msvcrt，其他平台用 fcntl）"""
+
+    def __init__(self, path, timeout=300, poll_interval=0.2):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, "a+b")
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                self._lock()
+                return self
+            except OSError:
+                if time.monotonic() >= deadline:
+                    self._fh.close()
+                    raise TimeoutError(f"等待文件锁超时: {self.path}")
+                time.sleep(self.poll_interval)
+
+    def __exit__(self, *exc_info):
+        try:
+            self._unlock()
+        finally:
+            self._fh.close()
+
+    def _lock(self):
+        if IS_WINDOWS:
+            import msvcrt
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _unlock(self):
+        if IS_WINDOWS:
+            import msvcrt
+            self._fh.seek(0)
+            msvcrt.locking(self._fh.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+
+
+def find_chrome():
+    """Chrome 可执行文件路径"""
+    import undetected_chromedriver as uc
+    return uc.find_chrome_executable()
+
+
+def chrome_version(browser_path):
+    """Chrome 完整版本号，如 "120.0.6099.109"；无法获取时返回 None"""
+    if IS_WINDOWS:
+        # Windows 上 chrome.exe --version 不输出任何内容，从注册表 / 文件版本信息读取
+        try:
+            import winreg
+            for root in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+                try:
+                    with winreg.OpenKey(root, r"Software\Google\Chrome\BLBeacon") as key:
+                        return winreg.QueryValueEx(key, "version")[0]
+                except OSError:
+                    continue
+        except ImportError:
+            pass
+        command = ["powershell", "-NoProfile", "-Command", f"(Get-Item '{browser_path}').VersionInfo.ProductVersion"]
+    else:
+        command = [browser_path, "--version"]
+
+    try:
+        output = subprocess.run(command, capture_output=True, text=True, timeout=15).stdout
+    except (OSError, subprocess.SubprocessError):
+        return None
+    match = VERSION_PATTERN.search(output or "")
+    return match.group(0) if match else None
+
+
+def is_patched(path):
+    try:
+        with open(path, "rb") as fh:
+            return fh.read().find(PATCHED_MARKER) != -1
+    except OSError:
+        return False
+
+
+class DriverCache:
+    """
+    按 Chrome 主版本号缓存打好补丁的 chromedriver
+
+        options = driver_cache.launch_options()   # {"driver_executable_path": ..., "version_main": ...}
+        driver = uc.Chrome(options=chrome_options, **options)
+    """
+
+    def __init__(self, cache_dir, enabled=True, chrome_version_override=None):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.chrome_version_override = chrome_version_override
+
+        self._resolved = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "resolve_seconds": None,
+            "downloaded": False,
+            "error": None,
+            "launches": 0,
+            "launch_total_ms": 0.0,
+            "launch_max_ms": 0.0,
+            "last_launch_ms": None,
+        }
+
+    def resolve(self):
+        """返回 {"browser_path", "version", "version_main", "driver_path"}，失败时返回 None（回退到 uc 默认行为）"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            if self._resolved is None and self._stats["error"] is None:
+                started = time.perf_counter()
+                try:
+                    self._resolved = self._resolve()
+                except Exception as e:
+                    self._stats["error"] = str(e)
+                    logger.warning("⚠️  chromedriver 缓存不可用，回退到每次自动下载: %s", e)
+                self._stats["resolve_seconds"] = round(time.perf_counter() - started, 3)
+            return self._resolved
+
+    def launch_options(self):
+        """传给 uc.Chrome 的参数"""
+        resolved = self.resolve()
+        if resolved is None:
+            return {"version_main": None}
+        return {
+            "driver_executable_path": resolved["driver_path"],
+            "browser_executable_path": resolved["browser_path"],
+            "version_main": resolved["version_main"],
+        }
+
+    def record_launch(self, seconds):
+        elapsed_ms = seconds * 1000
+        with self._lock:
+            self._stats["launches"] += 1
+            self._stats["launch_total_ms"] += elapsed_ms
+            self._stats["launch_max_ms"] = max(self._stats["launch_max_ms"], elapsed_ms)
+            self._stats["last_launch_ms"] = round(elapsed_ms, 1)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            resolved = dict(self._resolved) if self._resolved else None
+        launches = stats.pop("launches")
+        total_ms = stats.pop("launch_total_ms")
+        return {
+            "enabled": self.enabled,
+            "cache_dir": self.cache_dir,
+            "chrome_version": resolved["version"] if resolved else None,
+            "driver_path": resolved["driver_path"] if resolved else None,
+            **stats,
+            "launch_max_ms": round(stats["launch_max_ms"], 1),
+            "launches": launches,
+            "avg_launch_ms": round(total_ms / launches, 1) if launches else None,
+        }
+
+    def _resolve(self):
+        browser_path = find_chrome()
+        if not browser_path:
+            raise RuntimeError("未找到 Chrome")
+
+        version = self.chrome_version_override or chrome_version(browser_path)
+        if not version:
+            raise RuntimeError(f"无法获取 Chrome 版本: {browser_path}")
+        version_main = int(version.split(".")[0])
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        exe_name = f"chromedriver-{version_main}" + (".exe" if IS_WINDOWS else "")
+        driver_path = os.path.join(self.cache_dir, exe_name)
+
+        if not is_patched(driver_path):
+            # 多个进程同时冷启动时只有一个负责下载，其余等待后直接复用
+            with FileLock(driver_path + ".lock"):
+                if not is_patched(driver_path):
+                    self._download(driver_path, version_main)
+                    self._stats["downloaded"] = True
+
+        logger.info("🧩 chromedriver 缓存: Chrome %s -> %s", version, driver_path)
+        return {
+            "browser_path": browser_path,
+            "version": version,
+            "version_main": version_main,
+            "driver_path": driver_path,
+        }
+
+    @staticmethod
+    def _download(driver_path, version_main):
+        """用 uc 的 Patcher 下载并打补丁，再原子地放到缓存位置"""
+        import undetected_chromedriver as uc
+
+        logger.info("⬇️  下载并修补 chromedriver %s ...", version_main)
+        patcher = uc.Patcher(version_main=version_main)
+        patcher.auto()
+
+        temp_path = f"{driver_path}.{os.getpid()}.tmp"
+        shutil.copyfile(patcher.executable_path, temp_path)
+        os.chmod(temp_path, 0o755)
+        if not is_patched(temp_path):
+            os.remove(temp_path)
+            raise RuntimeError("chromedriver 补丁失败")
+        os.replace(temp_path, driver_path)
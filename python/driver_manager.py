@@ -0,0 +1,283 @@
+"""
+已求解驱动的生命周期管理
+/solve 成功后驱动会保留下来供后续使用，这里负责：
+- 记录最后使用时间、导航次数、内存占用（RSS）
+- 空闲超过 idle_ttl 的驱动自动回收
+- 导航次数达到 max_uses 的驱动直接关闭
+- 驱动总数 / 总内存超过上限时按最近最少使用淘汰
+"""
+
+import logging
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def driver_rss(driver):
+    """浏览器进程树（含子进程）的 RSS 字节数，无法获取时返回 None"""
+    if psutil is None:
+        return None
+
+    pid = getattr(driver, "browser_pid", None)
+    if pid is None:
+        service = getattr(driver, "service", None)
+        process = getattr(service, "process", None)
+        pid = getattr(process, "pid", None)
+    if pid is None:
+        return None
+
+    try:
+        root = psutil.Process(pid)
+        total = root.memory_info().rss
+        for child in root.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    except psutil.Error:
+        return None
+
+
+class _ManagedDriver:
+    __slots__ = ("driver", "domain", "created_at", "last_used", "uses", "in_use", "rss")
+
+    def __init__(self, driver, domain, uses):
+        now = time.monotonic()
+        self.driver = driver
+        self.domain = domain
+        self.created_at = now
+        self.last_used = now
+        self.uses = uses
+        self.in_use = False
+        self.rss = None
+
+
+class DriverManager:
+    """
+    - release_fn(driver): 正常回收（如归还预热池）
+    - discard_fn(driver): 用坏 / 用满的驱动直接关闭
+    - idle_ttl: 空闲多少秒后回收
+    - max_uses: 单个浏览器最多导航多少次
+    - max_drivers / max_rss_bytes: 驱动数量 / 总内存上限
+    """
+
+    def __init__(self, release_fn, discard_fn, idle_ttl=300, max_uses=50, max_drivers=20,
+                 max_rss_bytes=4 * 1024 ** 3, reap_interval=15):
+        self.release_fn = release_fn
+        self.discard_fn = discard_fn
+        self.idle_ttl = idle_ttl
+        self.max_uses = max_uses
+        self.max_drivers = max_drivers
+        self.max_rss_bytes = max_rss_bytes
+        self.reap_interval = reap_interval
+
+        self._drivers = {}
+        self._lifetime_uses = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._reaper = None
+        self._stats = {
+            "parked": 0,
+            "reaped_idle": 0,
+            "recycled_max_uses": 0,
+            "evicted_count": 0,
+            "evicted_memory": 0,
+            "closed": 0,
+        }
+
+    def __len__(self):
+        with self._lock:
+            return len(self._drivers)
+
+    def __contains__(self, driver_id):
+        with self._lock:
+            return driver_id in self._drivers
+
+    def park(self, driver_id, driver, domain=None):
+        """登记一个刚完成求解的驱动（记一次导航）"""
+        with self._lock:
+            uses = self._lifetime_uses.get(driver, 0) + 1
+            self._lifetime_uses[driver] = uses
+            self._drivers[driver_id] = _ManagedDriver(driver, domain, uses)
+            self._stats["parked"] += 1
+        self._enforce_limits()
+
+    def checkout(self, driver_id):
+        """独占取出驱动使用（不移出管理），不存在或正在被使用时返回 None"""
+        with self._lock:
+            managed = self._drivers.get(driver_id)
+            if managed is None or managed.in_use:
+                return None
+            managed.in_use = True
+            managed.last_used = time.monotonic()
+            return managed.driver
+
+    def checkout_for_domain(self, domain):
+        """取出该域名下最近使用过的空闲驱动，返回 (driver_id, driver)，没有时返回 (None, None)"""
+        with self._lock:
+            candidates = [
+                (driver_id, managed) for driver_id, managed in self._drivers.items()
+                if managed.domain == domain and not managed.in_use
+            ]
+            if not candidates:
+                return None, None
+            driver_id, managed = max(candidates, key=lambda item: item[1].last_used)
+            managed.in_use = True
+            managed.last_used = time.monotonic()
+            return driver_id, managed.driver
+
+    def checkin(self, driver_id, navigations=1):
+        """使用完毕，累计导航次数；达到 max_uses 时关闭"""
+        with self._lock:
+            managed = self._drivers.get(driver_id)
+            if managed is None:
+                return
+            managed.in_use = False
+            managed.last_used = time.monotonic()
+            managed.uses += navigations
+            self._lifetime_uses[managed.driver] = managed.uses
+            worn_out = managed.uses >= self.max_uses
+            if worn_out:
+                del self._drivers[driver_id]
+                self._stats["recycled_max_uses"] += 1
+
+        if worn_out:
+            logger.info("♻️  驱动 %s 已使用 %s 次，关闭", driver_id, managed.uses)
+            self.discard_fn(managed.driver)
+
+    def pop(self, driver_id):
+        """移出管理并返回驱动（由调用方负责关闭 / 回收），不存在时返回 None"""
+        with self._lock:
+            managed = self._drivers.pop(driver_id, None)
+            if managed is not None:
+                self._stats["closed"] += 1
+        return managed.driver if managed is not None else None
+
+    def close(self, driver_id):
+        """移出管理并回收驱动，返回是否归还到了预热池（不存在时返回 None）"""
+        with self._lock:
+            managed = self._drivers.pop(driver_id, None)
+            if managed is None:
+                return None
+            self._stats["closed"] += 1
+        return self._retire(managed)
+
+    def ids(self):
+        with self._lock:
+            return list(self._drivers.keys())
+
+    def drivers(self):
+        with self._lock:
+            return [managed.driver for managed in self._drivers.values()]
+
+    def start(self):
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name="driver-reaper", daemon=True)
+            self._reaper.start()
+
+    def shutdown(self):
+        """停止回收线程并关闭所有驱动"""
+        self._stop.set()
+        with self._lock:
+            entries = list(self._drivers.values())
+            self._drivers.clear()
+        for managed in entries:
+            self.discard_fn(managed.driver)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            entries = list(self._drivers.items())
+
+        now = time.monotonic()
+        rss_values = [managed.rss for _, managed in entries if managed.rss is not None]
+        stats.update({
+            "active": len(entries),
+            "in_use": sum(1 for _, managed in entries if managed.in_use),
+            "total_rss_mb": round(sum(rss_values) / 1024 ** 2, 1) if rss_values else None,
+            "rss_available": psutil is not None,
+            "idle_ttl": self.idle_ttl,
+            "max_uses": self.max_uses,
+            "max_drivers": self.max_drivers,
+            "max_rss_mb": round(self.max_rss_bytes / 1024 ** 2),
+            "drivers": [
+                {
+                    "driver_id": driver_id,
+                    "domain": managed.domain,
+                    "uses": managed.uses,
+                    "in_use": managed.in_use,
+                    "idle_seconds": round(now - managed.last_used, 1),
+                    "age_seconds": round(now - managed.created_at, 1),
+                    "rss_mb": round(managed.rss / 1024 ** 2, 1) if managed.rss is not None else None,
+                }
+                for driver_id, managed in entries
+            ],
+        })
+        return stats
+
+    def reap(self):
+        """回收空闲驱动、更新内存占用并执行上限"""
+        now = time.monotonic()
+        idle = []
+        with self._lock:
+            for driver_id, managed in list(self._drivers.items()):
+                if not managed.in_use and now - managed.last_used > self.idle_ttl:
+                    del self._drivers[driver_id]
+                    idle.append((driver_id, managed))
+            self._stats["reaped_idle"] += len(idle)
+            entries = list(self._drivers.values())
+
+        for driver_id, managed in idle:
+            logger.info("🧹 回收空闲驱动: %s", driver_id)
+            self._retire(managed)
+
+        # RSS 采样放在锁外进行
+        for managed in entries:
+            managed.rss = driver_rss(managed.driver)
+
+        self._enforce_limits()
+
+    def _enforce_limits(self):
+        evicted = []
+        with self._lock:
+            idle_lru = sorted(
+                (item for item in self._drivers.items() if not item[1].in_use),
+                key=lambda item: item[1].last_used
+            )
+            total_rss = sum(managed.rss or 0 for managed in self._drivers.values())
+
+            for driver_id, managed in idle_lru:
+                over_count = len(self._drivers) > self.max_drivers
+                over_memory = total_rss > self.max_rss_bytes
+                if not over_count and not over_memory:
+                    break
+                del self._drivers[driver_id]
+                total_rss -= managed.rss or 0
+                self._stats["evicted_count" if over_count else "evicted_memory"] += 1
+                evicted.append((driver_id, managed))
+
+        for driver_id, managed in evicted:
+            logger.info("🧹 超出上限，淘汰驱动: %s", driver_id)
+            self._retire(managed)
+
+    def _retire(self, managed):
+        """用满次数的直接关闭，其余交给 release_fn（通常是归还预热池）"""
+        if managed.uses >= self.max_uses:
+            self.discard_fn(managed.driver)
+            return False
+        return self.release_fn(managed.driver)
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.warning("⚠️  驱动回收失败: %s", e)
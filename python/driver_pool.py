@@ -0,0 +1,307 @@
+"""
+浏览器驱动预热池
+预先启动若干 Chrome 实例（已应用移动设备模拟），/solve 时直接取用，
+避免每次请求都冷启动 undetected-chromedriver
+"""
+
+import logging
+import os
+import signal
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+def is_driver_alive(driver):
+    """浏览器窗口是否仍可访问"""
+    try:
+        driver.current_window_handle
+        return True
+    except Exception:
+        return False
+
+
+def kill_driver(driver):
+    """
+    强制结束浏览器和 chromedriver 进程（含子进程），用于 quit() 本身会卡住的驱动
+
+    正在该驱动上阻塞的 WebDriver 调用会因连接断开而立即抛出异常
+    """
+    pids = [getattr(driver, "browser_pid", None)]
+    process = getattr(getattr(driver, "service", None), "process", None)
+    pids.append(getattr(process, "pid", None))
+
+    for pid in filter(None, pids):
+        try:
+            if psutil is not None:
+                root = psutil.Process(pid)
+                for child in root.children(recursive=True):
+                    child.kill()
+                root.kill()
+            else:
+                os.kill(pid, getattr(signal, "SIGKILL", signal.SIGTERM))
+        except Exception:
+            pass
+
+
+class DriverWatchdog:
+    """
+    监视一段会阻塞在驱动上的代码（driver.get、execute_script 等）：
+    取消标记触发后 grace 秒内代码仍未退出，则强杀浏览器让阻塞调用返回
+
+        with DriverWatchdog(driver, cancel_token, grace=3) as watchdog:
+            driver.get(url)
+        if watchdog.killed: ...   # 驱动已不可用，只能丢弃
+    """
+
+    def __init__(self, driver, cancel_event, grace=3.0):
+        self.driver = driver
+        self.cancel_event = cancel_event
+        self.grace = grace
+        self.killed = False
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.cancel_event is not None and self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name="driver-watchdog", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._done.set()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _watch(self):
+        while not self._done.is_set():
+            if self.cancel_event.wait(0.5):
+                break
+        if self._done.wait(self.grace):
+            return
+        logger.warning("🔪 驱动在取消后 %ss 内仍未响应，强制结束浏览器进程", self.grace)
+        self.killed = True
+        kill_driver(self.driver)
+
+
+class DriverPool:
+    """
+    按无头/有头模式分桶的驱动池
+
+    - factory(headless) 负责创建一个可用的驱动（含 CDP 设置）
+    - refill_factory(headless): 后台补充时使用的创建函数（默认同 factory，可用于区分统计）
+    - min_sizes: {headless: 最少空闲数}，后台线程会自动补齐
+    - max_size: 每个桶最多保留的空闲驱动数，超出的归还驱动直接关闭
+    - on_quit(driver): 驱动关闭后的回调（如归还其持久化 profile）
+    """
+
+    def __init__(self, factory, min_sizes=None, max_size=4, refill_interval=5.0, on_quit=None, refill_factory=None):
+        self.factory = factory
+        self.refill_factory = refill_factory or factory
+        self.on_quit = on_quit
+        self.min_sizes = dict(min_sizes or {})
+        self.max_size = max_size
+        self.refill_interval = refill_interval
+
+        self._idle = {True: [], False: []}
+        self._launching = {True: 0, False: 0}
+        self._checked_out = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._refiller = None
+
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "launch_failures": 0,
+            "recycled": 0,
+            "discarded": 0,
+            "checkout_count": 0,
+            "checkout_total_ms": 0.0,
+            "checkout_max_ms": 0.0,
+            "last_checkout_ms": None,
+        }
+
+    def start(self):
+        """启动后台补充线程"""
+        if self._refiller is None:
+            self._refiller = threading.Thread(target=self._refill_loop, name="driver-pool-refiller", daemon=True)
+            self._refiller.start()
+        self._wakeup.set()
+
+    def acquire(self, headless):
+        """
+        取出一个驱动；池为空时同步创建（记为未命中）
+
+        返回 (driver, hit)
+        """
+        headless = bool(headless)
+        started = time.perf_counter()
+        driver = None
+
+        while True:
+            with self._lock:
+                if not self._idle[headless]:
+                    break
+                candidate = self._idle[headless].pop()
+            if is_driver_alive(candidate):
+                driver = candidate
+                break
+            self._quit(candidate)
+
+        hit = driver is not None
+        if not hit:
+            driver = self.factory(headless)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self._checked_out[id(driver)] = headless
+            self._stats["hits" if hit else "misses"] += 1
+            self._stats["checkout_count"] += 1
+            self._stats["checkout_total_ms"] += elapsed_ms
+            self._stats["checkout_max_ms"] = max(self._stats["checkout_max_ms"], elapsed_ms)
+            self._stats["last_checkout_ms"] = round(elapsed_ms, 1)
+
+        self._wakeup.set()
+        return driver, hit
+
+    def release(self, driver):
+        """
+        归还驱动：清理 cookies/缓存后放回池中，池已满或清理失败则关闭
+        """
+        with self._lock:
+            headless = self._checked_out.pop(id(driver), None)
+            has_room = (
+                not self._closed
+                and headless is not None
+                and len(self._idle[headless]) < self.max_size
+            )
+
+        if has_room and self._reset(driver):
+            with self._lock:
+                if not self._closed and len(self._idle[headless]) < self.max_size:
+                    self._idle[headless].append(driver)
+                    self._stats["recycled"] += 1
+                    return True
+
+        self.discard(driver)
+        return False
+
+    def discard(self, driver):
+        """直接关闭驱动（出错或已损坏时使用），由后台线程补充新实例"""
+        with self._lock:
+            self._checked_out.pop(id(driver), None)
+            self._stats["discarded"] += 1
+        self._quit(driver)
+        self._wakeup.set()
+
+    def shutdown(self):
+        """停止补充线程并关闭所有空闲驱动"""
+        with self._lock:
+            self._closed = True
+            drivers = self._idle[True] + self._idle[False]
+            self._idle = {True: [], False: []}
+        self._wakeup.set()
+        for driver in drivers:
+            self._quit(driver)
+
+    def stats(self):
+        """池状态，供 /health 输出"""
+        with self._lock:
+            stats = dict(self._stats)
+            idle = {"headless": len(self._idle[True]), "headed": len(self._idle[False])}
+            launching = self._launching[True] + self._launching[False]
+            checked_out = len(self._checked_out)
+
+        lookups = stats["hits"] + stats["misses"]
+        count = stats.pop("checkout_count")
+        total_ms = stats.pop("checkout_total_ms")
+        stats.update({
+            "idle": idle,
+            "launching": launching,
+            "checked_out": checked_out,
+            "min_size": {
+                "headless": self.min_sizes.get(True, 0),
+                "headed": self.min_sizes.get(False, 0),
+            },
+            "max_size": self.max_size,
+            "hit_ratio": round(stats["hits"] / lookups, 3) if lookups else None,
+            "avg_checkout_ms": round(total_ms / count, 1) if count else None,
+            "checkout_max_ms": round(stats["checkout_max_ms"], 1),
+        })
+        return stats
+
+    def _refill_loop(self):
+        while True:
+            self._wakeup.wait(self.refill_interval)
+            self._wakeup.clear()
+            if self._closed:
+                return
+
+            for headless in (True, False):
+                while self._refill_one(headless):
+                    pass
+
+    def _refill_one(self, headless):
+        """补充一个驱动；无需补充或启动失败时返回 False"""
+        with self._lock:
+            target = min(self.min_sizes.get(headless, 0), self.max_size)
+            if self._closed or len(self._idle[headless]) + self._launching[headless] >= target:
+                return False
+            self._launching[headless] += 1
+
+        driver = None
+        try:
+            driver = self.refill_factory(headless)
+        except Exception as e:
+            logger.warning("⚠️  预热驱动启动失败: %s", e)
+
+        with self._lock:
+            self._launching[headless] -= 1
+            if driver is None:
+                self._stats["launch_failures"] += 1
+                return False
+            if not self._closed:
+                self._idle[headless].append(driver)
+                return True
+
+        # 池已关闭
+        self._quit(driver)
+        return False
+
+    @staticmethod
+    def _reset(driver):
+        try:
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+            driver.get("about:blank")
+        except Exception:
+            return False
+        try:
+            # 丢弃 performance 日志（驱动以 goog:loggingPrefs 创建时），避免在池中空闲时一直占用内存
+            driver.get_log("performance")
+        except Exception:
+            pass
+        return True
+
+    def _quit(self, driver):
+        try:
+            driver.quit()
+        except Exception:
+            pass
+        if self.on_quit is not None:
+            try:
+                self.on_quit(driver)
+            except Exception as e:
+                logger.warning("⚠️  驱动关闭回调失败: %s", e)
@@ -0,0 +1,247 @@
+"""
+无浏览器的 HTTP 快速通道
+用已保存会话的 cookies + User-Agent 通过连接池直接发 HTTP 请求（约 100ms），只有响应看起来是
+Cloudflare 挑战页时才由调用方升级为浏览器求解：
+
+- keep-alive 连接池；安装了 httpx + h2 时使用 HTTP/2，否则使用 requests
+- 每个主机的并发请求数上限（超过时排队等待）
+- cookie 由调用方按主机提供并写入 Cookie 头，客户端本身不保存任何响应 cookie（避免不同会话串用）
+- 重定向逐跳处理，每跳按目标主机重新取 cookie，不会把会话 cookie 带到其他主机
+"""
+
+import re
+import threading
+import time
+from contextlib import contextmanager
+from http import cookiejar
+from urllib.parse import urljoin, urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    import httpx
+except ImportError:
+    httpx = None
+
+# 挑战页的状态码（Cloudflare 的托管质询 / JS 质询返回 403 / 503，限流页为 429）
+CHALLENGE_STATUSES = (403, 429, 503)
+
+# 挑战页特征，只在响应体开头查找
+CHALLENGE_PATTERN = re.compile(
+    (
+        r"<title>\s*(?:just a moment|attention required|请稍候)"
+        r"|/cdn-cgi/challenge-platform/"
+        r"|_cf_chl_opt"
+        r"|cf-browser-verification"
+    ).encode("utf-8"),
+    re.IGNORECASE
+)
+SNIFF_BYTES = 32 * 1024
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+CHARSET_PATTERN = re.compile(r"charset=([\w-]+)", re.IGNORECASE)
+
+# 按文本返回响应体的 Content-Type，其余类型以 base64 返回
+TEXT_TYPES = ("text/", "json", "xml", "javascript", "x-www-form-urlencoded")
+
+
+class HostBusy(Exception):
+    """等待主机并发名额超时"""
+
+
+class _RejectCookies(cookiejar.DefaultCookiePolicy):
+    """连接池客户端不保存任何响应 cookie"""
+
+    def set_ok(self, cookie, request):
+        return False
+
+
+def looks_challenged(status, headers, body):
+    """响应是否为 Cloudflare 挑战页（headers 的键为小写）"""
+    if headers.get("cf-mitigated", "").lower() == "challenge":
+        return True
+    if status not in CHALLENGE_STATUSES:
+        return False
+    return CHALLENGE_PATTERN.search(body[:SNIFF_BYTES]) is not None
+
+
+def response_charset(headers, default="utf-8"):
+    match = CHARSET_PATTERN.search(headers.get("content-type", ""))
+    return match.group(1) if match else default
+
+
+def is_text(headers):
+    content_type = headers.get("content-type", "").lower()
+    return not content_type or any(marker in content_type for marker in TEXT_TYPES)
+
+
+class HttpFastPath:
+    """
+    连接池 HTTP 客户端
+
+        response = fast_path.fetch("GET", url, headers={"User-Agent": ua}, cookie_header_for=lookup)
+        # {"status", "headers", "body", "url", "http_version", "truncated", "redirects", "elapsed"}
+
+    - max_hosts: 连接池保留连接的主机数
+    - per_host: 每个主机的最大并发请求数（同时也是每个主机保留的连接数）
+    - http2: httpx + h2 可用时是否使用 HTTP/2
+    """
+
+    def __init__(self, max_hosts=32, per_host=8, http2=True, host_wait=10.0):
+        self.per_host = per_host
+        self.host_wait = host_wait
+        self.backend = "httpx" if http2 and httpx is not None else "requests"
+
+        self._hosts = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "errors": 0, "redirects": 0, "bytes": 0, "host_waits": 0, "http2": 0}
+
+        if self.backend == "httpx":
+            self._limits = httpx.Limits(max_connections=max_hosts * per_host,
+                                        max_keepalive_connections=max_hosts * per_host)
+            self._clients = {}
+            self._client_for(None)
+        else:
+            self.http = requests.Session()
+            self.http.cookies.set_policy(_RejectCookies())
+            adapter = HTTPAdapter(pool_connections=max_hosts, pool_maxsize=per_host)
+            self.http.mount("http://", adapter)
+            self.http.mount("https://", adapter)
+
+    def fetch(self, method, url, headers=None, body=None, cookie_header_for=None, proxy=None, timeout=15,
+              max_bytes=10 * 1024 * 1024, max_redirects=5):
+        """
+        发送请求并逐跳处理重定向；cookie_header_for(url) 返回该 URL 应携带的 Cookie 头（没有时返回 None）
+
+        HostBusy / 网络错误直接抛出，由调用方转换为响应
+        """
+        started = time.monotonic()
+        for hop in range(max_redirects + 1):
+            request_headers = dict(headers or {})
+            cookie_header = cookie_header_for(url) if cookie_header_for else None
+            if cookie_header:
+                request_headers["Cookie"] = cookie_header
+
+            with self._host_slot(urlparse(url).netloc.lower()):
+                try:
+                    response = self._send(method, url, request_headers, body, proxy, timeout, max_bytes)
+                except Exception:
+                    self._count("errors")
+                    raise
+
+            location = response["headers"].get("location")
+            if response["status"] in REDIRECT_STATUSES and location and hop < max_redirects:
+                self._count("redirects")
+                url = urljoin(url, location)
+                if response["status"] == 303 or (response["status"] in (301, 302) and method == "POST"):
+                    method, body = "GET", None
+                continue
+
+            response["redirects"] = hop
+            response["elapsed"] = round(time.monotonic() - started, 3)
+            return response
+
+    def close(self):
+        if self.backend == "httpx":
+            with self._lock:
+                clients = list(self._clients.values())
+                self._clients.clear()
+            for client in clients:
+                client.close()
+        else:
+            self.http.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            in_flight = {host: count for host, count in self._in_flight.items() if count}
+        stats.update({"backend": self.backend, "per_host": self.per_host, "in_flight": in_flight})
+        return stats
+
+    @contextmanager
+    def _host_slot(self, host):
+        with self._lock:
+            slot = self._hosts.get(host)
+            if slot is None:
+                slot = self._hosts[host] = threading.BoundedSemaphore(self.per_host)
+        if not slot.acquire(blocking=False):
+            self._count("host_waits")
+            if not slot.acquire(timeout=self.host_wait):
+                raise HostBusy(f"{host} 并发请求数已达上限 ({self.per_host})")
+        with self._lock:
+            self._in_flight[host] = self._in_flight.get(host, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight[host] -= 1
+            slot.release()
+
+    def _client_for(self, proxy):
+        """httpx 的代理按客户端设置，每个代理一个客户端"""
+        with self._lock:
+            client = self._clients.get(proxy)
+            if client is None:
+                client = self._clients[proxy] = httpx.Client(
+                    http2=True, limits=self._limits, follow_redirects=False, proxy=proxy
+                )
+                client.cookies.jar.set_policy(_RejectCookies())
+            return client
+
+    def _send(self, method, url, headers, body, proxy, timeout, max_bytes):
+        if self.backend == "httpx":
+            client = self._client_for(proxy)
+            with client.stream(method, url, headers=headers, content=body, timeout=timeout) as response:
+                content, truncated = _read_limited(response.iter_bytes(), max_bytes)
+                # 同名 cookie 出现在不同 domain / path 时 dict(response.cookies) 会抛出 CookieConflict
+                set_cookies = {cookie.name: cookie.value for cookie in response.cookies.jar}
+                result = _result(response.status_code, response.headers, content, truncated, str(response.url),
+                                 response.http_version, set_cookies)
+        else:
+            proxies = {"http": proxy, "https": proxy} if proxy else None
+            response = self.http.request(method, url, headers=headers, data=body, proxies=proxies, timeout=timeout,
+                                         allow_redirects=False, stream=True)
+            try:
+                content, truncated = _read_limited(response.iter_content(64 * 1024), max_bytes)
+            finally:
+                response.close()
+            http_version = {10: "HTTP/1.0", 11: "HTTP/1.1"}.get(response.raw.version, "HTTP/1.1")
+            result = _result(response.status_code, response.headers, content, truncated, response.url,
+                             http_version, response.cookies.get_dict())
+
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["bytes"] += len(content)
+            if result["http_version"] == "HTTP/2":
+                self._stats["http2"] += 1
+        return result
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+
+def _read_limited(chunks, max_bytes):
+    """读取最多 max_bytes 字节，返回 (内容, 是否被截断)"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        if len(buffer) > max_bytes:
+            return bytes(buffer[:max_bytes]), True
+    return bytes(buffer), False
+
+
+def _result(status, headers, content, truncated, url, http_version, set_cookies):
+    return {
+        "status": status,
+        "headers": {key.lower(): value for key, value in headers.items()},
+        "body": content,
+        "url": url,
+        "http_version": http_version,
+        "truncated": truncated,
+        "set_cookies": set_cookies,
+    }
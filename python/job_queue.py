@@ -0,0 +1,393 @@
+"""
+异步任务队列
+/solve 以 async 模式提交时放入有界线程池执行，调用方通过 /jobs/<id> 轮询或长轮询结果；
+SingleFlight 负责把同一域名的并发求解合并为一次；
+CancelToken / CancelRegistry 负责取消、截止时间和按关联 id 取消同步请求
+"""
+
+import contextvars
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """排队任务数已达上限"""
+
+
+class JobCancelled(Exception):
+    """任务在执行过程中被取消"""
+
+
+class DeadlineExceeded(JobCancelled):
+    """超过请求的截止时间"""
+
+
+def raise_if_cancelled(cancel_event):
+    """cancel_event（Event 或 CancelToken）已触发时抛出 JobCancelled / DeadlineExceeded"""
+    if cancel_event is not None and cancel_event.is_set():
+        if getattr(cancel_event, "reason", None) == "deadline":
+            raise DeadlineExceeded()
+        raise JobCancelled()
+
+
+class CancelToken(threading.Event):
+    """
+    取消标记，兼容 threading.Event（set / is_set / wait），另外支持：
+
+    - deadline: time.monotonic() 时间点，到达后自动视为已取消（reason 为 "deadline"）
+    - parents: 其他取消标记（如任务的取消事件、客户端断开探测），任一触发时本标记随之触发
+    - reason: "cancelled" / "deadline" / "disconnected" 等
+    """
+
+    # 有父标记时 wait 按此间隔分段检查
+    POLL_INTERVAL = 0.25
+
+    def __init__(self, deadline=None, parents=()):
+        super().__init__()
+        self.deadline = deadline
+        self.parents = [parent for parent in parents if parent is not None]
+        self.reason = None
+
+    def cancel(self, reason="cancelled"):
+        if self.reason is None:
+            self.reason = reason
+        super().set()
+
+    def set(self):
+        self.cancel()
+
+    def is_set(self):
+        if super().is_set():
+            return True
+        for parent in self.parents:
+            if parent.is_set():
+                self.cancel(getattr(parent, "reason", None) or "cancelled")
+                return True
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline")
+            return True
+        return False
+
+    def remaining(self):
+        """距截止时间的秒数，没有截止时间时返回 None"""
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def wait(self, timeout=None):
+        """等待取消，最多等到截止时间；返回是否已取消"""
+        end = None if timeout is None else time.monotonic() + timeout
+        if self.deadline is not None:
+            end = self.deadline if end is None else min(end, self.deadline)
+
+        while not self.is_set():
+            remaining = None if end is None else end - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                break
+            if self.parents:
+                remaining = self.POLL_INTERVAL if remaining is None else min(remaining, self.POLL_INTERVAL)
+            super().wait(remaining)
+        return self.is_set()
+
+
+class CancelRegistry:
+    """按关联 id 登记进行中的同步请求，供 /cancel 取消（同一 id 可对应多个请求）"""
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def register(self, key, token):
+        with self._lock:
+            self._tokens.setdefault(key, []).append(token)
+
+    def unregister(self, key, token):
+        with self._lock:
+            tokens = self._tokens.get(key)
+            if tokens and token in tokens:
+                tokens.remove(token)
+                if not tokens:
+                    del self._tokens[key]
+
+    def cancel(self, key, reason="cancelled"):
+        """取消该 id 下所有请求，返回取消的数量"""
+        with self._lock:
+            tokens = list(self._tokens.get(key, ()))
+        for token in tokens:
+            token.cancel(reason)
+        return len(tokens)
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(tokens) for tokens in self._tokens.values())
+
+
+class Job:
+    """单个异步任务及其耗时信息"""
+
+    def __init__(self, kind, params):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.status = QUEUED
+        self.result = None
+        self.status_code = None
+        self.error = None
+        self.created_at = datetime.now().isoformat()
+        self.cancel_event = CancelToken()
+        self.done_event = threading.Event()
+        self.future = None
+
+        self._queued_at = time.monotonic()
+        self._started_at = None
+        self._finished_at = None
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def timings(self):
+        """排队、执行耗时（秒）"""
+        now = time.monotonic()
+        started = self._started_at
+        finished = self._finished_at
+        return {
+            "queue_wait": round((started or finished or now) - self._queued_at, 3),
+            "run_time": round((finished or now) - started, 3) if started else None,
+            "total": round((finished or now) - self._queued_at, 3),
+        }
+
+    def to_dict(self, include_result=True):
+        data = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "url": self.params.get("url"),
+            "created_at": self.created_at,
+            "cancel_requested": self.cancel_event.is_set(),
+            "timings": self.timings(),
+        }
+        if self.error:
+            data["error"] = self.error
+        if include_result and self.finished:
+            data["status_code"] = self.status_code
+            data["result"] = self.result
+        return data
+
+
+class JobManager:
+    """
+    有界任务执行器
+
+    - max_workers: 同时执行的任务数（即同时占用的浏览器数）
+    - max_queue: 最多排队的任务数，超出时 submit 抛出 JobQueueFull
+    - retention: 已完成任务保留的秒数，过期后不再可查询
+    """
+
+    def __init__(self, max_workers=4, max_queue=100, retention=600):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention = retention
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="solve-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._counters = {SUCCEEDED: 0, FAILED: 0, CANCELLED: 0, "rejected": 0}
+
+    def submit(self, fn, params, kind="solve"):
+        """
+        提交任务，fn(params, cancel_event) 需返回 (payload, status_code)
+        """
+        job = Job(kind, params)
+        with self._lock:
+            self._purge_locked()
+            queued = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if queued >= self.max_queue:
+                self._counters["rejected"] += 1
+                raise JobQueueFull(f"队列已满 ({queued}/{self.max_queue})")
+            self._jobs[job.id] = job
+
+        # 在提交者的上下文中执行（保留请求关联 id 等 contextvars）
+        context = contextvars.copy_context()
+        job.future = self._executor.submit(context.run, self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout):
+        """长轮询：等待任务完成或超时，返回任务（不存在时返回 None）"""
+        job = self.get(job_id)
+        if job is not None and timeout > 0:
+            job.done_event.wait(timeout)
+        return job
+
+    def cancel(self, job_id):
+        """
+        取消任务：排队中的直接取消，执行中的设置取消标记由任务自行中止
+        """
+        job = self.get(job_id)
+        if job is None or job.finished:
+            return job
+
+        job.cancel_event.cancel()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, CANCELLED, {"success": False, "cancelled": True, "error": "任务已取消"}, 409)
+        return job
+
+    def list(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict(include_result=False) for job in jobs]
+
+    def stats(self):
+        """队列状态，供 /health 输出"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+            counters = dict(self._counters)
+
+        run_times = [j.timings()["run_time"] for j in jobs if j.finished and j.timings()["run_time"] is not None]
+        queue_waits = [j.timings()["queue_wait"] for j in jobs if j.status != QUEUED]
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "queue_depth": sum(1 for j in jobs if j.status == QUEUED),
+            "running": sum(1 for j in jobs if j.status == RUNNING),
+            "tracked": len(jobs),
+            "completed": counters,
+            "avg_queue_wait": round(sum(queue_waits) / len(queue_waits), 3) if queue_waits else None,
+            "avg_run_time": round(sum(run_times) / len(run_times), 3) if run_times else None,
+        }
+
+    def shutdown(self):
+        """取消排队任务，通知执行中的任务停止"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            if not job.finished:
+                self.cancel(job.id)
+        self._executor.shutdown(wait=False)
+
+    def _run(self, job, fn):
+        if job.cancel_event.is_set():
+            self._finish(job, CANCELLED, {"success": False, "cancelled": True, "error": "任务已取消"}, 409)
+            return
+
+        with self._lock:
+            job.status = RUNNING
+            job._started_at = time.monotonic()
+
+        try:
+            payload, status_code = fn(job.params, job.cancel_event)
+        except DeadlineExceeded:
+            self._finish(job, FAILED, {"success": False, "deadline_exceeded": True, "error": "超过截止时间"}, 504)
+            return
+        except JobCancelled:
+            self._finish(job, CANCELLED, {"success": False, "cancelled": True, "error": "任务已取消"}, 409)
+            return
+        except Exception as e:
+            job.error = str(e)
+            self._finish(job, FAILED, {"success": False, "error": str(e)}, 500)
+            return
+
+        if payload.get("cancelled"):
+            status = CANCELLED
+        elif payload.get("success"):
+            status = SUCCEEDED
+        else:
+            status = FAILED
+        self._finish(job, status, payload, status_code)
+
+    def _finish(self, job, status, payload, status_code):
+        with self._lock:
+            if job.finished:
+                return
+            job.status = status
+            job.result = payload
+            job.status_code = status_code
+            job._finished_at = time.monotonic()
+            self._counters[status] += 1
+        job.done_event.set()
+
+    def _purge_locked(self):
+        cutoff = time.monotonic() - self.retention
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished and job._finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+class SingleFlight:
+    """
+    同 key 请求合并：第一个调用者执行，其余并发调用者等待并共享同一结果
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.exception = None
+            self.waiters = 0
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {"leaders": 0, "coalesced": 0}
+
+    def do(self, key, fn, cancel_event=None):
+        """
+        执行 fn() 或等待同 key 正在执行的调用
+
+        返回 (result, shared)，shared 为 True 表示结果来自其他调用者；
+        等待期间 cancel_event 被设置时抛出 JobCancelled（超过截止时间时为 DeadlineExceeded）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+                self._counters["leaders"] += 1
+            else:
+                call.waiters += 1
+                self._counters["coalesced"] += 1
+
+        if not leader:
+            while not call.done.wait(0.2):
+                raise_if_cancelled(cancel_event)
+            if call.exception is not None:
+                raise call.exception
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._calls),
+                "waiting": sum(call.waiters for call in self._calls.values()),
+                **self._counters,
+            }
@@ -0,0 +1,182 @@
+"""
+求解时的页面加载优化
+求解只需要拿到 clearance cookie，图片、字体、视频和广告 / 统计脚本都是多余的流量和渲染时间：
+
+- 资源拦截：通过 CDP Network.setBlockedURLs 按拦截档位 + 按域名的 block / allow 规则屏蔽请求
+- 加载策略：eager / none 时 driver.get 不等待整页加载完成，由 wait_for_clearance 轮询判断验证结果
+- 流量统计：从 chromedriver 的 performance 日志汇总每次求解的传输字节数、请求数和被拦截数
+"""
+
+import fnmatch
+import json
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+PAGE_LOAD_STRATEGIES = ("normal", "eager", "none")
+
+# 拦截类别 -> Network.setBlockedURLs 模式（* 为通配符）
+CATEGORIES = {
+    "images": ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.avif", "*.bmp", "*.ico", "*.svg"],
+    "fonts": ["*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot"],
+    "media": ["*.mp4", "*.webm", "*.m3u8", "*.mp3", "*.m4a", "*.flv", "*.mpd"],
+    "trackers": [
+        "*doubleclick.net*",
+        "*googlesyndication.com*",
+        "*googleadservices.com*",
+        "*google-analytics.com*",
+        "*googletagmanager.com*",
+        "*googletagservices.com*",
+        "*connect.facebook.net*",
+        "*hm.baidu.com*",
+        "*cnzz.com*",
+        "*51.la/*",
+    ],
+}
+
+# 拦截档位 -> 类别
+PROFILES = {
+    "off": [],
+    "media": ["images", "fonts", "media"],
+    "aggressive": ["images", "fonts", "media", "trackers"],
+}
+
+# 验证流程必须能访问的地址，匹配到这些地址的拦截模式会被忽略
+PROTECTED_URLS = (
+    "https://challenges.cloudflare.com/cdn-cgi/challenge-platform/h/g/orchestrate/chl_page/v1",
+    "https://challenges.cloudflare.com/turnstile/v0/api.js",
+    "/cdn-cgi/challenge-platform/h/b/orchestrate/chl_page/v1",
+    "/cdn-cgi/challenge-platform/scripts/jsd/main.js",
+)
+
+# 标记当前文档，用于在 none 策略下判断新页面是否已经提交
+MARK_DOCUMENT_SCRIPT = "window.__cfNavigationMarker = true;"
+NEW_DOCUMENT_SCRIPT = "return !window.__cfNavigationMarker;"
+
+
+def load_rules(path):
+    """
+    读取按域名的拦截规则（JSON 文件），文件不存在时返回空规则
+
+    {
+        "*": {"block": ["*.m3u8"]},
+        "iyf.tv": {"block": ["*/ads/*"], "allow": ["images"]}
+    }
+
+    键为域名（同时匹配其子域名）或 "*"；allow 可以是类别名或与拦截模式完全相同的字符串
+    """
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def domain_rules(domain, rules):
+    """按 "*" -> 父域名 -> 子域名的顺序返回适用于 domain 的规则"""
+    domain = (domain or "").lower()
+    matched = [(0, rules["*"])] if "*" in rules else []
+    for key, rule in rules.items():
+        key = key.lower().lstrip(".")
+        if key != "*" and (domain == key or domain.endswith("." + key)):
+            matched.append((len(key), rule))
+    return [rule for _, rule in sorted(matched, key=lambda item: item[0])]
+
+
+def blocked_patterns(profile, domain=None, rules=None):
+    """拦截档位 + 域名规则 -> setBlockedURLs 模式列表（保持顺序、去重）"""
+    if profile not in PROFILES:
+        raise ValueError(f"未知的拦截档位: {profile}")
+
+    categories = list(PROFILES[profile])
+    extra = []
+    allowed = set()
+    for rule in domain_rules(domain, rules or {}):
+        for entry in rule.get("block", []):
+            if entry in CATEGORIES:
+                categories.append(entry)
+            else:
+                extra.append(entry)
+        allowed.update(rule.get("allow", []))
+
+    patterns = []
+    for category in categories:
+        if category not in allowed:
+            patterns.extend(CATEGORIES[category])
+    patterns.extend(extra)
+
+    result = []
+    for pattern in patterns:
+        if pattern in allowed or pattern in result:
+            continue
+        if any(fnmatch.fnmatchcase(url, pattern) for url in PROTECTED_URLS):
+            logger.warning("⚠️  忽略会拦截验证流程的模式: %s", pattern)
+            continue
+        result.append(pattern)
+    return result
+
+
+def apply_blocking(driver, patterns):
+    """设置当前驱动的拦截列表（空列表表示取消拦截，驱动复用时需要重置）"""
+    driver.execute_cdp_cmd("Network.enable", {})
+    driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(patterns)})
+
+
+def navigate(driver, url, strategy="normal", timeout=30, poll_interval=0.05):
+    """
+    按页面加载策略访问 URL
+
+    驱动以 eager / none 策略创建时 driver.get 会提前返回；none 策略下 get 返回时新页面可能尚未提交，
+    这里等到旧文档被替换为止，避免验证轮询把上一个页面误判为已通过
+    """
+    if strategy != "none":
+        driver.get(url)
+        return
+
+    try:
+        driver.execute_script(MARK_DOCUMENT_SCRIPT)
+    except Exception:
+        pass
+    driver.get(url)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if driver.execute_script(NEW_DOCUMENT_SCRIPT):
+                return
+        except Exception:
+            # 文档切换过程中脚本可能执行失败
+            pass
+        time.sleep(poll_interval)
+
+
+def network_usage(driver):
+    """
+    汇总并清空驱动的 performance 日志（驱动需以 goog:loggingPrefs performance=ALL 创建）
+
+    返回 {"bytes": 传输字节数, "requests": 请求数, "blocked": 被拦截数, "from_cache": 命中缓存数}，
+    日志不可用时返回 None
+    """
+    try:
+        entries = driver.get_log("performance")
+    except Exception:
+        return None
+
+    usage = {"bytes": 0, "requests": 0, "blocked": 0, "from_cache": 0}
+    for entry in entries:
+        try:
+            message = json.loads(entry["message"])["message"]
+        except (KeyError, TypeError, ValueError):
+            continue
+        method = message.get("method")
+        params = message.get("params", {})
+        if method == "Network.requestWillBeSent":
+            usage["requests"] += 1
+        elif method == "Network.loadingFinished":
+            usage["bytes"] += int(params.get("encodedDataLength") or 0)
+        elif method == "Network.loadingFailed" and params.get("blockedReason"):
+            usage["blocked"] += 1
+        elif method == "Network.requestServedFromCache":
+            usage["from_cache"] += 1
+    return usage
@@ -0,0 +1,283 @@
+"""
+持久化 Chrome 用户数据目录（profile）缓存
+默认每次求解都使用一次性的临时 profile，浏览器需要重新下载站点资源、重新走完整的验证页。
+这里按 域名（+ 代理）把求解绑定到固定的 user-data-dir，保留 HTTP 缓存、localStorage 和 cookies：
+
+- 独占：同一个 profile 同时只能被一个浏览器使用（进程内登记 + 文件锁，多进程 / 多节点共享目录时同样有效）
+- 大小：通过 --disk-cache-size 限制 HTTP 缓存，浏览器关闭后单个 profile 仍超限时清理其缓存目录
+- 淘汰：profile 数量或总大小超限时按最近使用时间淘汰（LRU），正在使用的不会被淘汰
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+from driver_cache import FileLock
+
+logger = logging.getLogger(__name__)
+
+# profile 元数据文件（放在 user-data-dir 内，随 profile 一起删除）
+META_FILE = "cf_profile.json"
+
+# 单个 profile 超限时清理的缓存目录（保留 cookies / localStorage / IndexedDB）
+CACHE_DIRS = (
+    os.path.join("Default", "Cache"),
+    os.path.join("Default", "Code Cache"),
+    os.path.join("Default", "GPUCache"),
+    os.path.join("Default", "Service Worker", "CacheStorage"),
+    "GrShaderCache",
+    "ShaderCache",
+    "GraphiteDawnCache",
+)
+
+
+def profile_name(domain, proxy=None):
+    """域名（+ 代理）对应的 profile 目录名"""
+    name = re.sub(r"[^A-Za-z0-9._-]", "_", (domain or "default").lower())
+    if proxy:
+        name += "-" + hashlib.sha1(proxy.encode("utf-8")).hexdigest()[:8]
+    return name
+
+
+def dir_size(path):
+    """目录总字节数（文件在遍历过程中被删除时忽略）"""
+    total = 0
+    for root, _dirs, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class ProfileLease:
+    """一次独占使用；release() 后 profile 可被其他浏览器使用或被淘汰"""
+
+    def __init__(self, cache, name, path, warm, lock):
+        self.cache = cache
+        self.name = name
+        self.path = path
+        self.warm = warm
+        self._lock = lock
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.cache._release(self)
+
+
+class ProfileCache:
+    """
+    按域名 / 代理管理持久化 user-data-dir
+
+        lease = profile_cache.acquire(domain, proxy)   # 已被占用时返回 None
+        driver = create_driver(headless, proxy, lease.path)
+        profile_cache.attach(lease, driver)            # 浏览器关闭后调用 release_driver(driver) 归还
+
+    - max_profiles: 最多保留的 profile 数量
+    - max_total_bytes: 所有 profile 的总大小上限
+    - max_profile_bytes: 单个 profile 的大小上限（同时作为 HTTP 缓存上限传给 Chrome）
+    """
+
+    def __init__(self, root, max_profiles=50, max_total_bytes=2048 * 1024 ** 2,
+                 max_profile_bytes=200 * 1024 ** 2):
+        self.root = root
+        self.max_profiles = max_profiles
+        self.max_total_bytes = max_total_bytes
+        self.max_profile_bytes = max_profile_bytes
+
+        self._leases = {}
+        self._drivers = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "warm": 0,
+            "cold": 0,
+            "busy": 0,
+            "trimmed": 0,
+            "evicted": 0,
+        }
+
+    def chrome_arguments(self):
+        """使用持久化 profile 时附加的 Chrome 参数"""
+        return [f"--disk-cache-size={self.max_profile_bytes // 2}"]
+
+    def acquire(self, domain, proxy=None):
+        """独占一个 profile，返回 ProfileLease；正被其他浏览器使用时返回 None"""
+        name = profile_name(domain, proxy)
+        path = os.path.join(self.root, name)
+
+        with self._lock:
+            if name in self._leases:
+                self._stats["busy"] += 1
+                return None
+            # 先占位，文件锁在锁外获取
+            self._leases[name] = None
+
+        os.makedirs(self.root, exist_ok=True)
+        lock = _lock_profile(path)
+        if lock is None:
+            with self._lock:
+                del self._leases[name]
+                self._stats["busy"] += 1
+            return None
+
+        warm = os.path.isfile(os.path.join(path, META_FILE))
+        os.makedirs(path, exist_ok=True)
+        lease = ProfileLease(self, name, path, warm, lock)
+        with self._lock:
+            self._leases[name] = lease
+            self._stats["warm" if warm else "cold"] += 1
+
+        if not warm:
+            self._write_meta(path, 0)
+            self.enforce_limits()
+        return lease
+
+    def attach(self, lease, driver):
+        """登记使用该 profile 的驱动，驱动关闭时由 release_driver 归还"""
+        with self._lock:
+            self._drivers[id(driver)] = lease
+
+    def release_driver(self, driver):
+        """驱动已关闭：归还其 profile（非 profile 驱动时什么也不做）"""
+        with self._lock:
+            lease = self._drivers.pop(id(driver), None)
+        if lease is not None:
+            lease.release()
+
+    def enforce_limits(self):
+        """按最近使用时间淘汰超出数量 / 总大小上限的空闲 profile"""
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            meta = self._read_meta(os.path.join(self.root, name))
+            if meta is not None:
+                entries.append((meta.get("last_used", 0), name, meta.get("size_bytes", 0)))
+
+        entries.sort()
+        count = len(entries)
+        total = sum(size for _, _, size in entries)
+        for _, name, size in entries:
+            if count <= self.max_profiles and total <= self.max_total_bytes:
+                break
+            if self._evict(name):
+                count -= 1
+                total -= size
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            leased = [name for name, lease in self._leases.items() if lease is not None]
+        metas = []
+        if os.path.isdir(self.root):
+            for name in os.listdir(self.root):
+                meta = self._read_meta(os.path.join(self.root, name))
+                if meta is not None:
+                    metas.append(meta)
+        lookups = stats["warm"] + stats["cold"]
+        stats.update({
+            "root": self.root,
+            "profiles": len(metas),
+            "total_mb": round(sum(meta.get("size_bytes", 0) for meta in metas) / 1024 ** 2, 1),
+            "leased": leased,
+            "warm_ratio": round(stats["warm"] / lookups, 3) if lookups else None,
+            "max_profiles": self.max_profiles,
+            "max_total_mb": round(self.max_total_bytes / 1024 ** 2),
+            "max_profile_mb": round(self.max_profile_bytes / 1024 ** 2),
+        })
+        return stats
+
+    def _release(self, lease):
+        """浏览器已关闭：记录大小和使用时间，超限时清理缓存，最后释放锁并执行总量上限"""
+        try:
+            size = dir_size(lease.path)
+            if size > self.max_profile_bytes:
+                for cache_dir in CACHE_DIRS:
+                    shutil.rmtree(os.path.join(lease.path, cache_dir), ignore_errors=True)
+                trimmed = dir_size(lease.path)
+                logger.info("🧹 profile %s 超出大小上限 (%.0fMB)，已清理缓存 -> %.0fMB",
+                            lease.name, size / 1024 ** 2, trimmed / 1024 ** 2)
+                size = trimmed
+                with self._lock:
+                    self._stats["trimmed"] += 1
+            self._write_meta(lease.path, size)
+        except Exception as e:
+            logger.warning("⚠️  profile %s 元数据更新失败: %s", lease.name, e)
+        finally:
+            try:
+                lease._lock.__exit__(None, None, None)
+            finally:
+                with self._lock:
+                    self._leases.pop(lease.name, None)
+
+        self.enforce_limits()
+
+    def _evict(self, name):
+        """删除一个空闲 profile；正被本进程或其他进程使用时跳过"""
+        with self._lock:
+            if name in self._leases:
+                return False
+            self._leases[name] = None
+        try:
+            path = os.path.join(self.root, name)
+            lock = _lock_profile(path)
+            if lock is None:
+                return False
+            try:
+                shutil.rmtree(path, ignore_errors=True)
+                # 锁文件在持有锁时删除，之后拿到旧锁文件的进程会在 _lock_profile 中发现并放弃
+                try:
+                    os.remove(lock.path)
+                except OSError:
+                    pass
+            finally:
+                lock.__exit__(None, None, None)
+            logger.info("🧹 淘汰 profile: %s", name)
+            with self._lock:
+                self._stats["evicted"] += 1
+            return True
+        finally:
+            with self._lock:
+                self._leases.pop(name, None)
+
+    @staticmethod
+    def _read_meta(path):
+        try:
+            with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    @staticmethod
+    def _write_meta(path, size):
+        with open(os.path.join(path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"last_used": time.time(), "size_bytes": size}, f)
+
+
+def _lock_profile(path):
+    """
+    获取 profile 的文件锁（不等待），已被占用时返回 None
+
+    淘汰时会删除锁文件：如果拿到的是已被删除（或已被新文件替换）的锁文件，说明 profile 刚被淘汰，同样视为占用
+    """
+    lock = FileLock(path + ".lock", timeout=0)
+    try:
+        lock.__enter__()
+    except (TimeoutError, OSError):
+        return None
+    try:
+        current = os.stat(lock.path).st_ino == os.fstat(lock._fh.fileno()).st_ino
+    except OSError:
+        current = False
+    if not current:
+        lock.__exit__(None, None, None)
+        return None
+    return lock
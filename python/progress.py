@@ -0,0 +1,134 @@
+"""
+求解进度事件
+求解代码在各阶段调用 emit()，事件写入当前上下文绑定的 ProgressChannel（未绑定时为空操作），
+/solve、/solve_manual 的流式模式把事件以 SSE 或 NDJSON 逐条推给客户端
+
+    event: driver_acquired
+    data: {"event": "driver_acquired", "elapsed": 0.012, "ts": "...", "pool_hit": true}
+
+最后一条事件为 result，带完整的响应体和 HTTP 状态码
+"""
+
+import contextvars
+import json
+import queue
+import threading
+import time
+from datetime import datetime
+
+# 流式模式 -> Content-Type
+CONTENT_TYPES = {
+    "sse": "text/event-stream",
+    "ndjson": "application/x-ndjson",
+}
+
+# 长时间没有事件时发送心跳，避免代理 / 客户端按空闲超时断开
+HEARTBEAT_INTERVAL = 15
+
+_channel = contextvars.ContextVar("progress_channel", default=None)
+
+_END = object()
+
+
+class ProgressChannel:
+    """一次求解的事件队列（生产者为求解线程，消费者为响应生成器）"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self._queue = queue.Queue()
+
+    def emit(self, event, **values):
+        self._queue.put({
+            "event": event,
+            "elapsed": round(time.monotonic() - self.started, 3),
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            **values,
+        })
+
+    def finish(self, payload, status_code):
+        self.emit("result", status_code=status_code, result=payload)
+        self._queue.put(_END)
+
+    def events(self, heartbeat=HEARTBEAT_INTERVAL):
+        """依次产出事件；超过 heartbeat 秒没有事件时产出 None（心跳）"""
+        while True:
+            try:
+                event = self._queue.get(timeout=heartbeat)
+            except queue.Empty:
+                yield None
+                continue
+            if event is _END:
+                return
+            yield event
+
+
+def emit(event, **values):
+    """向当前上下文的进度通道发送事件，没有订阅者时什么也不做"""
+    channel = _channel.get()
+    if channel is not None:
+        channel.emit(event, **values)
+
+
+def active():
+    """当前上下文是否有人订阅进度（用于跳过只为事件服务的额外探测）"""
+    return _channel.get() is not None
+
+
+def stream_format(value, accept=""):
+    """
+    根据请求体中的 stream 字段或 Accept 头决定流式格式，返回 "sse" / "ndjson" / None
+
+    stream: true 或 "sse" -> SSE，"ndjson" -> NDJSON；未指定时 Accept: text/event-stream 也视为 SSE
+    """
+    if value in CONTENT_TYPES:
+        return value
+    if value is True:
+        return "sse"
+    if value is None and "text/event-stream" in (accept or ""):
+        return "sse"
+    return None
+
+
+def format_event(event, fmt):
+    if event is None:
+        # SSE 注释行 / NDJSON 空行，客户端应忽略
+        return ": keepalive\n\n" if fmt == "sse" else "\n"
+    data = json.dumps(event, ensure_ascii=False, default=str)
+    if fmt == "sse":
+        return f"event: {event['event']}\ndata: {data}\n\n"
+    return data + "\n"
+
+
+def stream(fn, fmt, cancel_event=None, heartbeat=HEARTBEAT_INTERVAL):
+    """
+    在后台线程中执行 fn()（返回 (响应字典, 状态码)），同时产出格式化后的进度事件
+
+    - fn 在调用者的 contextvars 副本中执行，日志关联 id 保持不变
+    - 生成器被提前关闭（客户端断开）时设置 cancel_event，让求解尽快放弃
+    """
+    channel = ProgressChannel()
+
+    def run():
+        _channel.set(channel)
+        try:
+            payload, status_code = fn()
+        except Exception as e:
+            payload, status_code = {"success": False, "error": str(e)}, 500
+        channel.finish(payload, status_code)
+
+    context = contextvars.copy_context()
+    threading.Thread(target=context.run, args=(run,), name="solve-progress", daemon=True).start()
+
+    finished = False
+    try:
+        yield format_event({"event": "accepted", "elapsed": 0.0,
+                            "ts": datetime.now().isoformat(timespec="milliseconds")}, fmt)
+        for event in channel.events(heartbeat):
+            yield format_event(event, fmt)
+        finished = True
+    finally:
+        if not finished and cancel_event is not None:
+            if hasattr(cancel_event, "cancel"):
+                cancel_event.cancel("disconnected")
+            else:
+                cancel_event.set()
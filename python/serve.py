@@ -0,0 +1,254 @@
+"""
+生产环境启动入口
+用 waitress（纯 Python，支持 Windows）代替 Flask 开发服务器运行各个服务
+
+用法:
+    python serve.py bypass                  # cloudflare_bypass_service，默认端口 5000
+    python serve.py manual --port 5001      # cloudflare_bypass_service_manual
+    python serve.py ares --threads 32       # cf_ares_service
+    python serve.py sharded                 # 多进程分片（CF_WORKERS 个 bypass 工作进程）
+
+/solve、/fetch 请求体没有 deadline 字段时补上默认截止时间（--solve-deadline / --fetch-deadline），
+超过后服务中止处理并返回 504
+
+停止（Ctrl+C / SIGTERM）时先拒绝新请求，等待进行中的请求完成（最多 --drain-timeout 秒），
+再关闭驱动、落盘会话；再次按 Ctrl+C 立即退出
+"""
+
+import _thread
+import argparse
+import importlib
+import io
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from datetime import datetime
+
+SERVICES = {
+    "bypass": ("cloudflare_bypass_service", 5000),
+    "manual": ("cloudflare_bypass_service_manual", 5001),
+    "ares": ("cf_ares_service", 5000),
+    # 多进程分片：前端按域名把请求转发给多个 bypass 工作进程
+    "sharded": ("supervisor", 5000),
+}
+
+# 请求级截止时间（秒）：请求体没有 deadline 时由 DeadlineMiddleware 补上，0 表示不设置
+SOLVE_REQUEST_DEADLINE = float(os.environ.get("CF_SOLVE_REQUEST_DEADLINE", "120"))
+FETCH_REQUEST_DEADLINE = float(os.environ.get("CF_FETCH_REQUEST_DEADLINE", "120"))
+
+
+class DeadlineMiddleware:
+    """
+    给指定路径的 JSON 请求体补上默认的 deadline 字段（秒），服务按它中止求解 / 页面访问并返回 504
+
+    waitress 无法中断正在执行的工作线程，截止时间必须由服务自己执行；请求体已带 deadline 时保持不变
+    """
+
+    def __init__(self, app, deadlines):
+        self.app = app
+        self.deadlines = {path: seconds for path, seconds in deadlines.items() if seconds and seconds > 0}
+
+    def __call__(self, environ, start_response):
+        seconds = self.deadlines.get(environ.get('PATH_INFO'))
+        if seconds and environ.get('REQUEST_METHOD') == 'POST':
+            self._set_default_deadline(environ, seconds)
+        return self.app(environ, start_response)
+
+    @staticmethod
+    def _set_default_deadline(environ, seconds):
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return
+        if length <= 0:
+            return
+
+        body = environ['wsgi.input'].read(length)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and data.get('deadline') is None:
+            data['deadline'] = seconds
+            body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+        # 请求体已被读出，换成内存中的副本交给下游
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+
+
+class InFlightMiddleware:
+    """统计进行中的请求；进入排空状态后新请求返回 503（/health 除外）"""
+
+    def __init__(self, app):
+        self.app = app
+        self.draining = False
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def __call__(self, environ, start_response):
+        if self.draining and environ.get('PATH_INFO') != '/health':
+            body = json.dumps({"success": False, "error": "服务正在关闭"}, ensure_ascii=False).encode('utf-8')
+            start_response('503 Service Unavailable', [
+                ('Content-Type', 'application/json'),
+                ('Content-Length', str(len(body))),
+                ('Connection', 'close'),
+            ])
+            return [body]
+
+        with self._lock:
+            self._in_flight += 1
+        try:
+            result = self.app(environ, start_response)
+        except BaseException:
+            self._done()
+            raise
+        # 流式响应在响应体发送完毕（close）时才算结束
+        return _ClosingIterator(result, self._done)
+
+    def _done(self):
+        with self._lock:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self._idle.notify_all()
+
+    @property
+    def in_flight(self):
+        with self._lock:
+            return self._in_flight
+
+    def drain(self, timeout):
+        """进入排空状态并等待进行中的请求结束，返回剩余请求数"""
+        self.draining = True
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._in_flight and time.monotonic() < deadline:
+                self._idle.wait(deadline - time.monotonic())
+            return self._in_flight
+
+
+class _ClosingIterator:
+    def __init__(self, iterable, on_close):
+        self._iterable = iterable
+        self._iterator = iter(iterable)
+        self._on_close = on_close
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return next(self._iterator)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._on_close()
+
+
+def create_app(service, solve_deadline=SOLVE_REQUEST_DEADLINE, fetch_deadline=FETCH_REQUEST_DEADLINE):
+    """导入服务模块，启动其后台线程，返回 (模块, 包装后的 WSGI 应用)"""
+    module_name, _ = SERVICES[service]
+    module = importlib.import_module(module_name)
+    module.start_background_workers()
+    app = DeadlineMiddleware(module.app, {"/solve": solve_deadline, "/fetch": fetch_deadline})
+    return module, InFlightMiddleware(app)
+
+
+def serve(service, host="0.0.0.0", port=None, threads=16, connection_limit=200,
+          channel_timeout=120, drain_timeout=60, solve_deadline=SOLVE_REQUEST_DEADLINE,
+          fetch_deadline=FETCH_REQUEST_DEADLINE):
+    try:
+        from waitress import create_server
+    except ImportError:
+        print("❌ 未安装 waitress，请先运行: pip install waitress")
+        sys.exit(1)
+
+    port = port or SERVICES[service][1]
+    module, app = create_app(service, solve_deadline, fetch_deadline)
+
+    # channel_timeout: keep-alive 连接空闲多久后关闭
+    # channel_request_lookahead > 0 时 waitress 会继续读取连接，请求处理中客户端断开可被检测到
+    # （environ["waitress.client_disconnected"]），用于中止已无人等待的求解
+    server = create_server(
+        app,
+        host=host,
+        port=port,
+        threads=threads,
+        connection_limit=connection_limit,
+        channel_timeout=channel_timeout,
+        channel_request_lookahead=5,
+        ident="cf-bypass",
+    )
+
+    state = {"stopping": False}
+
+    def drain_and_stop():
+        print(f"\n[{datetime.now()}] ⏳ 停止接收新请求，等待 {app.in_flight} 个进行中的请求完成...")
+        remaining = app.drain(drain_timeout)
+        if remaining:
+            print(f"[{datetime.now()}] ⚠️  排空超时，仍有 {remaining} 个请求未完成")
+        _thread.interrupt_main()
+
+    def handle_signal(signum, frame):
+        if state["stopping"]:
+            raise KeyboardInterrupt
+        state["stopping"] = True
+        threading.Thread(target=drain_and_stop, name="drain", daemon=True).start()
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+    if hasattr(signal, "SIGBREAK"):
+        signal.signal(signal.SIGBREAK, handle_signal)
+
+    print("=" * 60)
+    print(f"🚀 {SERVICES[service][0]} (waitress)")
+    print(f"🌐 服务地址: http://{host}:{port}")
+    print(f"🧵 工作线程: {threads}  连接上限: {connection_limit}  空闲超时: {channel_timeout}s")
+    print(f"⏰ 默认截止时间: /solve {solve_deadline or '无'}s  /fetch {fetch_deadline or '无'}s")
+    print("=" * 60)
+
+    try:
+        server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        module.cleanup()
+        print(f"[{datetime.now()}] 👋 服务已停止")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="以生产模式运行 Cloudflare 绕过服务")
+    parser.add_argument("service", choices=sorted(SERVICES.keys()))
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=None)
+    parser.add_argument("--threads", type=int, default=int(os.environ.get("CF_SERVE_THREADS", "16")),
+                        help="工作线程数（同时处理的请求数）")
+    parser.add_argument("--connection-limit", type=int, default=200)
+    parser.add_argument("--channel-timeout", type=int, default=120,
+                        help="keep-alive 连接空闲超时（秒）")
+    parser.add_argument("--drain-timeout", type=int, default=60,
+                        help="关闭时等待进行中请求的最长时间（秒）")
+    parser.add_argument("--solve-deadline", type=float, default=SOLVE_REQUEST_DEADLINE,
+                        help="/solve 请求没有 deadline 字段时的默认截止时间（秒，0 为不设置）")
+    parser.add_argument("--fetch-deadline", type=float, default=FETCH_REQUEST_DEADLINE,
+                        help="/fetch 请求没有 deadline 字段时的默认截止时间（秒，0 为不设置）")
+    args = parser.parse_args()
+
+    serve(
+        args.service,
+        host=args.host,
+        port=args.port,
+        threads=args.threads,
+        connection_limit=args.connection_limit,
+        channel_timeout=args.channel_timeout,
+        drain_timeout=args.drain_timeout,
+        solve_deadline=args.solve_deadline,
+        fetch_deadline=args.fetch_deadline,
+    )
@@ -0,0 +1,376 @@
+"""
+会话持久化后端
+- JsonFileBackend: 每个域名一个 cf_sessions/session_<domain>.json（原有格式）
+- SqliteBackend: 单个 SQLite 数据库（WAL 模式），按域名 / 代理 / UA / 过期时间建索引
+
+会话以 key 区分（即 get_session_file() 返回的路径），两种后端可以互相导入
+
+一次性导入已有 JSON 文件:
+    python session_backends.py import --session-dir cf_sessions --db cf_sessions/sessions.db
+"""
+
+import argparse
+import glob
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+# SqliteBackend 默认连接池大小
+SQLITE_POOL_SIZE = int(os.environ.get("CF_SQLITE_POOL_SIZE", "4"))
+
+
+def load_json(session_file):
+    """读取 JSON 会话文件"""
+    with open(session_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json_atomic(session_file, session_data):
+    """先写临时文件再替换，避免读到写了一半的文件"""
+    tmp_file = f"{session_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(session_data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_file, session_file)
+
+
+def domain_from_key(key):
+    """cf_sessions/session_m_iyf_tv.json -> m_iyf_tv"""
+    name = os.path.splitext(os.path.basename(key))[0]
+    return name[len("session_"):] if name.startswith("session_") else name
+
+
+def earliest_expiry(session_data):
+    """最早过期的 cookie 的 expiry（epoch 秒），没有时返回 None"""
+    cookies = session_data.get("cookies") or []
+    if isinstance(cookies, dict):
+        return None
+    expiries = [
+        cookie["expiry"] for cookie in cookies
+        if isinstance(cookie.get("expiry"), (int, float))
+    ]
+    return min(expiries) if expiries else None
+
+
+class JsonFileBackend:
+    """每个会话一个 JSON 文件，版本号为文件 mtime"""
+
+    name = "json"
+
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        os.makedirs(session_dir, exist_ok=True)
+
+    def version(self, key):
+        try:
+            return os.stat(key).st_mtime
+        except OSError:
+            return None
+
+    def load(self, key):
+        """返回 (数据, 版本, 字节数)，不存在时返回 None"""
+        try:
+            stat = os.stat(key)
+            return load_json(key), stat.st_mtime, stat.st_size
+        except (OSError, ValueError):
+            return None
+
+    def write_many(self, items):
+        """写入 [(key, data)]，返回 {key: 版本}"""
+        versions = {}
+        for key, session_data in items:
+            write_json_atomic(key, session_data)
+            versions[key] = os.stat(key).st_mtime
+        return versions
+
+    def delete(self, key):
+        try:
+            os.remove(key)
+        except OSError:
+            pass
+
+    def keys(self):
+        return glob.glob(os.path.join(self.session_dir, "session_*.json"))
+
+    def expiring_within(self, seconds):
+        """返回 [(key, expiry)]，按过期时间升序；需要逐个读取文件"""
+        cutoff = time.time() + seconds
+        result = []
+        for key in self.keys():
+            loaded = self.load(key)
+            if loaded is None:
+                continue
+            expiry = earliest_expiry(loaded[0])
+            if expiry is not None and expiry <= cutoff:
+                result.append((key, expiry))
+        return sorted(result, key=lambda item: item[1])
+
+    def count(self):
+        return len(self.keys())
+
+    def close(self):
+        pass
+
+
+class SqliteConnectionPool:
+    """
+    有界 SQLite 连接池（WAL 模式）
+
+    waitress / Flask 开发服务器的请求线程不断更替，按线程建连接会随请求数无限增长（每个连接还占用 WAL 文件句柄）。
+    这里最多建立 size 个连接，取不到空闲连接时等待其他线程归还
+
+        with pool.connection() as conn:
+            conn.execute(...)
+    """
+
+    def __init__(self, db_path, size=SQLITE_POOL_SIZE, timeout=30, isolation_level="", row_factory=None):
+        self.db_path = db_path
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.isolation_level = isolation_level
+        self.row_factory = row_factory
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, check_same_thread=False,
+                               isolation_level=self.isolation_level)
+        if self.row_factory is not None:
+            conn.row_factory = self.row_factory
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("连接池已关闭")
+            create = self._created < self.size
+            if create:
+                self._created += 1
+
+        if create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"等待数据库连接超时（连接池大小 {self.size}）")
+
+    def _release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            closed = self._closed
+            if closed:
+                self._created -= 1
+        if closed:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "created": self._created, "idle": self._idle.qsize()}
+
+    def close(self):
+        """关闭空闲连接；使用中的连接在归还时关闭"""
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+
+class SqliteBackend:
+    """
+    SQLite 会话仓库（WAL 模式）
+
+    连接取自有界连接池（用完归还）；按 key 查询走主键索引，批量写入在一个事务中完成
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_key TEXT PRIMARY KEY,
+        domain TEXT NOT NULL,
+        proxy TEXT,
+        user_agent TEXT,
+        saved_at TEXT,
+        expires_at REAL,
+        updated_at INTEGER NOT NULL,
+        data TEXT NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_sessions_domain ON sessions(domain);
+    CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+    CREATE INDEX IF NOT EXISTS idx_sessions_saved_at ON sessions(saved_at);
+    CREATE INDEX IF NOT EXISTS idx_sessions_proxy_ua ON sessions(proxy, user_agent);
+    """
+
+    def __init__(self, db_path, pool_size=SQLITE_POOL_SIZE):
+        self.db_path = db_path
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._pool = SqliteConnectionPool(db_path, pool_size)
+
+        with self._pool.connection() as conn:
+            conn.executescript(self.SCHEMA)
+            conn.commit()
+
+    def version(self, key):
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT updated_at FROM sessions WHERE session_key = ?", (key,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def load(self, key):
+        with self._pool.connection() as conn:
+            row = conn.execute(
+                "SELECT data, updated_at FROM sessions WHERE session_key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0]), row[1], len(row[0])
+        except ValueError:
+            return None
+
+    def write_many(self, items):
+        versions = {}
+        rows = []
+        for key, session_data in items:
+            version = time.time_ns()
+            versions[key] = version
+            rows.append((
+                key,
+                session_data.get("domain") or domain_from_key(key),
+                session_data.get("proxy"),
+                session_data.get("user_agent"),
+                session_data.get("timestamp"),
+                earliest_expiry(session_data),
+                version,
+                json.dumps(session_data, ensure_ascii=False, separators=(',', ':')),
+            ))
+
+        with self._pool.connection() as conn, conn:
+            conn.executemany("""
+                INSERT INTO sessions (session_key, domain, proxy, user_agent, saved_at, expires_at, updated_at, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(session_key) DO UPDATE SET
+                    domain = excluded.domain,
+                    proxy = excluded.proxy,
+                    user_agent = excluded.user_agent,
+                    saved_at = excluded.saved_at,
+                    expires_at = excluded.expires_at,
+                    updated_at = excluded.updated_at,
+                    data = excluded.data
+            """, rows)
+        return versions
+
+    def delete(self, key):
+        with self._pool.connection() as conn, conn:
+            conn.execute("DELETE FROM sessions WHERE session_key = ?", (key,))
+
+    def keys(self):
+        with self._pool.connection() as conn:
+            return [row[0] for row in conn.execute("SELECT session_key FROM sessions")]
+
+    def expiring_within(self, seconds):
+        cutoff = time.time() + seconds
+        with self._pool.connection() as conn:
+            return list(conn.execute(
+                "SELECT session_key, expires_at FROM sessions "
+                "WHERE expires_at IS NOT NULL AND expires_at <= ? ORDER BY expires_at",
+                (cutoff,)
+            ))
+
+    def count(self):
+        with self._pool.connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        self._pool.close()
+
+
+def create_backend(kind, session_dir, db_path=None):
+    """按名称创建后端: "json"（默认）或 "sqlite" """
+    if kind == "sqlite":
+        return SqliteBackend(db_path or os.path.join(session_dir, "sessions.db"))
+    if kind in (None, "", "json"):
+        return JsonFileBackend(session_dir)
+    raise ValueError(f"未知的会话后端: {kind}")
+
+
+def import_json_sessions(backend, session_dir, batch_size=500):
+    """把 session_dir 中的 JSON 会话文件批量导入到 backend，返回导入数量"""
+    source = JsonFileBackend(session_dir)
+    batch = []
+    imported = 0
+
+    for key in source.keys():
+        loaded = source.load(key)
+        if loaded is None:
+            print(f"⚠️  跳过无法解析的文件: {key}")
+            continue
+        batch.append((key, loaded[0]))
+        if len(batch) >= batch_size:
+            backend.write_many(batch)
+            imported += len(batch)
+            batch = []
+
+    if batch:
+        backend.write_many(batch)
+        imported += len(batch)
+    return imported
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="会话后端工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="把 JSON 会话文件导入 SQLite")
+    import_parser.add_argument("--session-dir", default="cf_sessions")
+    import_parser.add_argument("--db", default=None, help="默认 <session-dir>/sessions.db")
+    import_parser.add_argument("--batch-size", type=int, default=500)
+
+    args = parser.parse_args()
+
+    if args.command == "import":
+        backend = SqliteBackend(args.db or os.path.join(args.session_dir, "sessions.db"))
+        started = time.time()
+        count = import_json_sessions(backend, args.session_dir, args.batch_size)
+        print(f"✅ 已导入 {count} 个会话到 {backend.db_path}（耗时 {time.time() - started:.2f}s）")
+        backend.close()
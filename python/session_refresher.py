@@ -0,0 +1,154 @@
+"""
+会话后台刷新
+在 cookie 过期前 lead_time 秒重新求解，调用方通过 /get_session 拿到的会话几乎不会过期
+
+只刷新最近被访问过的会话，避免不再使用的域名被无限续期
+"""
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class SessionRefresher:
+    """
+    - refresh_fn(session_file, session_data) 执行一次刷新，成功返回 True
+    - lead_time: 提前多少秒刷新
+    - jitter: 在 [0, jitter] 秒内随机提前，避免同时过期的会话一起刷新
+    - max_concurrent: 同时进行的刷新数
+    - idle_cutoff: 超过这么多秒没被访问的会话不再刷新
+    - retry_after: 同一会话两次刷新的最短间隔（失败或 cookie 寿命短于 lead_time 时防止反复刷新）
+    - missing_grace: 存储中不存在的会话的访问记录保留多久（/solve 开始时就会 touch，求解完成前会话还没保存）
+
+    每次扫描时清理访问记录：超过 idle_cutoff 未访问的，以及存储中已不存在且超过 missing_grace 的
+    """
+
+    def __init__(self, store, refresh_fn, lead_time=300, jitter=60, max_concurrent=2,
+                 scan_interval=15, idle_cutoff=3600, retry_after=120, missing_grace=300):
+        self.store = store
+        self.refresh_fn = refresh_fn
+        self.lead_time = lead_time
+        self.jitter = jitter
+        self.max_concurrent = max_concurrent
+        self.scan_interval = scan_interval
+        self.idle_cutoff = idle_cutoff
+        self.retry_after = retry_after
+        self.missing_grace = missing_grace
+
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="session-refresh")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_access = {}
+        self._jitters = {}
+        self._cooldown = {}
+        self._in_flight = set()
+        self._next_due = None
+        self._stats = {"scans": 0, "refreshed": 0, "failed": 0, "skipped_idle": 0, "pruned": 0}
+
+    def touch(self, session_file):
+        """记录会话被访问（/solve、/get_session 调用）"""
+        with self._lock:
+            self._last_access[session_file] = time.time()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="session-refresher", daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "in_flight": len(self._in_flight),
+                "tracked": len(self._last_access),
+                "cooling_down": len(self._cooldown),
+                "next_due_in": round(self._next_due - time.time(), 1) if self._next_due else None,
+            })
+        stats.update({
+            "lead_time": self.lead_time,
+            "jitter": self.jitter,
+            "max_concurrent": self.max_concurrent,
+        })
+        return stats
+
+    def _loop(self):
+        while not self._stop.wait(self.scan_interval):
+            try:
+                self.scan()
+            except Exception as e:
+                logger.warning("⚠️  会话刷新扫描失败: %s", e)
+
+    def scan(self):
+        """检查即将过期的会话，把到期的提交刷新"""
+        now = time.time()
+        candidates = self.store.expiring_within(self.lead_time + self.jitter + self.scan_interval)
+        live_keys = set(self.store.keys())
+
+        next_due = None
+        with self._lock:
+            self._stats["scans"] += 1
+            self._cooldown = {k: t for k, t in self._cooldown.items() if t > now}
+            self._prune_locked(live_keys, now)
+
+            for session_file, expiry in candidates:
+                last_access = self._last_access.get(session_file)
+                if last_access is None or now - last_access > self.idle_cutoff:
+                    self._stats["skipped_idle"] += 1
+                    continue
+                if session_file in self._in_flight or session_file in self._cooldown:
+                    continue
+
+                jitter_key = (session_file, expiry)
+                if jitter_key not in self._jitters:
+                    self._jitters[jitter_key] = random.uniform(0, self.jitter)
+                due = expiry - self.lead_time - self._jitters[jitter_key]
+
+                if due > now:
+                    next_due = due if next_due is None else min(next_due, due)
+                    continue
+                if len(self._in_flight) >= self.max_concurrent:
+                    next_due = now
+                    break
+
+                self._in_flight.add(session_file)
+                self._executor.submit(self._refresh, session_file)
+
+            self._next_due = next_due
+            # 清理已不在候选列表中的抖动记录
+            live = {(k, e) for k, e in candidates}
+            self._jitters = {k: v for k, v in self._jitters.items() if k in live}
+
+    def _prune_locked(self, live_keys, now):
+        """清理不会再被刷新的访问记录，避免 touch() 过的 key 无限累积"""
+        stale = [
+            session_file for session_file, last_access in self._last_access.items()
+            if now - last_access > self.idle_cutoff
+            or (session_file not in live_keys and now - last_access > self.missing_grace)
+        ]
+        for session_file in stale:
+            del self._last_access[session_file]
+        self._stats["pruned"] += len(stale)
+
+    def _refresh(self, session_file):
+        ok = False
+        try:
+            session_data = self.store.get(session_file)
+            if session_data is not None:
+                logger.info("🔄 后台刷新会话: %s", session_file)
+                ok = self.refresh_fn(session_file, session_data)
+        except Exception as e:
+            logger.warning("⚠️  后台刷新失败 %s: %s", session_file, e)
+        finally:
+            with self._lock:
+                self._in_flight.discard(session_file)
+                self._stats["refreshed" if ok else "failed"] += 1
+                self._cooldown[session_file] = time.time() + self.retry_after
@@ -0,0 +1,326 @@
+"""
+会话存储
+在会话持久化后端（cf_sessions JSON 文件或 SQLite）前加一层进程内缓存：
+- TTL 由 cookie 的 expiry 推导，过期会话不再常驻内存
+- 按条目数 / 字节数做 LRU 淘汰
+- 写入先进内存，由后台线程合并后批量落盘（write-behind）
+
+三个服务（cloudflare_bypass_service / cloudflare_bypass_service_manual / cf_ares_service）共用
+"""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from session_backends import JsonFileBackend, earliest_expiry
+
+logger = logging.getLogger(__name__)
+
+# cookie 过期前预留的安全时间（秒），快过期的会话视为失效
+EXPIRY_MARGIN = 30
+
+
+def parse_timestamp(value):
+    """解析会话中的 ISO 时间戳，返回 epoch 秒（无法解析时返回 None）"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def check_freshness(session_data, max_age, now=None):
+    """
+    判断会话是否仍可直接使用
+
+    返回 (是否有效, 原因)，原因为 "fresh" / "too_old" / "cookie_expired" / "no_timestamp"
+    """
+    now = time.time() if now is None else now
+
+    saved_at = parse_timestamp(session_data.get("timestamp"))
+    if saved_at is None:
+        return False, "no_timestamp"
+    if now - saved_at > max_age:
+        return False, "too_old"
+
+    expiry = earliest_expiry(session_data)
+    if expiry is not None and expiry - EXPIRY_MARGIN <= now:
+        return False, "cookie_expired"
+
+    return True, "fresh"
+
+
+class _Entry:
+    __slots__ = ("data", "size", "version", "expires_at", "dirty")
+
+    def __init__(self, data, size, version, expires_at, dirty):
+        self.data = data
+        self.size = size
+        self.version = version
+        self.expires_at = expires_at
+        self.dirty = dirty
+
+
+class SessionStore:
+    """
+    进程内会话存储，以会话文件路径（get_session_file() 的返回值）为 key
+
+    - backend: 持久化后端，默认 JsonFileBackend("cf_sessions")
+    - max_entries / max_bytes: LRU 上限
+    - default_ttl: 会话没有带 expiry 的 cookie 时在内存中保留的秒数
+    - flush_delay: 写入后延迟多久落盘，期间对同一文件的多次写入只落盘一次
+    """
+
+    def __init__(self, backend=None, max_entries=1000, max_bytes=16 * 1024 * 1024, default_ttl=1800, flush_delay=0.5):
+        self.backend = backend or JsonFileBackend("cf_sessions")
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.flush_delay = flush_delay
+
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._writer = None
+        self._writer_stop = False
+        self._stats = {
+            "lookups": 0,
+            "hits": 0,
+            "misses": 0,
+            "stale": 0,
+            "memory_hits": 0,
+            "disk_loads": 0,
+            "writes": 0,
+            "flushes": 0,
+            "write_errors": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def get(self, session_file, loader=None):
+        """
+        读取会话：内存命中且后端中的版本未被其他进程修改时直接返回，否则从后端加载
+
+        传入 loader(session_file) 时绕过后端，直接按文件 mtime 校验并用 loader 读取
+        （如 cf_ares 自行保存的会话文件）
+        """
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(session_file)
+            if entry is not None and entry.expires_at <= now and not entry.dirty:
+                self._remove_locked(session_file)
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is not None and entry.dirty:
+                self._entries.move_to_end(session_file)
+                self._stats["memory_hits"] += 1
+                return entry.data
+
+        if loader is None:
+            version = self.backend.version(session_file)
+        else:
+            version = self._file_version(session_file)
+
+        if entry is not None and (version is None or version == entry.version):
+            with self._lock:
+                if session_file in self._entries:
+                    self._entries.move_to_end(session_file)
+                self._stats["memory_hits"] += 1
+            return entry.data
+
+        if version is None:
+            return None
+
+        if loader is None:
+            loaded = self.backend.load(session_file)
+        else:
+            try:
+                loaded = loader(session_file), version, os.path.getsize(session_file)
+            except (OSError, ValueError):
+                loaded = None
+
+        if loaded is None:
+            return None
+
+        session_data, version, size = loaded
+        with self._lock:
+            self._stats["disk_loads"] += 1
+            self._insert_locked(session_file, session_data, size, version, False)
+        return session_data
+
+    def put(self, session_file, session_data, persist=True):
+        """
+        写入会话；persist 为 True 时由后台线程写入后端，
+        为 False 时只缓存（文件由调用方自行保存）
+        """
+        size = len(json.dumps(session_data, ensure_ascii=False))
+        version = None if persist else self._file_version(session_file)
+
+        with self._lock:
+            self._stats["writes"] += 1
+            self._insert_locked(session_file, session_data, size, version, persist, force=persist)
+
+        if persist:
+            self._ensure_writer()
+            self._wakeup.set()
+        return session_data
+
+    def delete(self, session_file):
+        """删除会话（内存和后端）"""
+        with self._lock:
+            self._remove_locked(session_file)
+        self.backend.delete(session_file)
+
+    def expiring_within(self, seconds):
+        """返回后端中 seconds 秒内过期的会话 [(key, expiry)]"""
+        self.flush()
+        return self.backend.expiring_within(seconds)
+
+    def keys(self):
+        """返回后端中所有会话的 key"""
+        self.flush()
+        return self.backend.keys()
+
+    def get_fresh(self, session_file, max_age):
+        """
+        返回仍然有效的会话，无效或不存在时返回 (None, 原因)
+        """
+        session_data = self.get(session_file)
+
+        if session_data is None:
+            fresh, reason = False, "missing"
+        else:
+            fresh, reason = check_freshness(session_data, max_age)
+
+        with self._lock:
+            self._stats["lookups"] += 1
+            if session_data is None:
+                self._stats["misses"] += 1
+            elif not fresh:
+                self._stats["stale"] += 1
+            else:
+                self._stats["hits"] += 1
+
+        if not fresh:
+            return None, reason
+        return session_data, reason
+
+    def flush(self):
+        """把所有待写入的会话立即落盘"""
+        with self._flush_lock:
+            with self._lock:
+                pending = [
+                    (session_file, entry, entry.data) for session_file, entry in self._entries.items()
+                    if entry.dirty
+                ]
+
+            if not pending:
+                return
+
+            # 写入期间条目保持 dirty，读取方继续使用内存中的最新数据；整批在一个事务 / 一轮中写入
+            try:
+                versions = self.backend.write_many([(key, data) for key, _, data in pending])
+            except Exception as e:
+                logger.warning("⚠️  会话写入失败 (%s 个): %s", len(pending), e)
+                with self._lock:
+                    self._stats["write_errors"] += 1
+                return
+
+            with self._lock:
+                for session_file, entry, session_data in pending:
+                    entry.version = versions.get(session_file)
+                    if entry.data is session_data:
+                        entry.dirty = False
+                self._stats["flushes"] += 1
+                # 落盘后的条目可以参与 LRU 淘汰了
+                self._evict_locked()
+
+    def close(self):
+        """停止后台写入线程、落盘并关闭后端"""
+        self._writer_stop = True
+        self._wakeup.set()
+        self.flush()
+        self.backend.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["pending_writes"] = sum(1 for entry in self._entries.values() if entry.dirty)
+
+        stats["backend"] = self.backend.name
+        stats["max_entries"] = self.max_entries
+        stats["max_bytes"] = self.max_bytes
+        stats["hit_ratio"] = round(stats["hits"] / stats["lookups"], 3) if stats["lookups"] else None
+        # /solve 每次缓存命中都省去一次浏览器启动
+        stats["avoided_launches"] = stats["hits"]
+        return stats
+
+    def _insert_locked(self, session_file, session_data, size, version, dirty, force=False):
+        expiry = earliest_expiry(session_data)
+        expires_at = expiry if expiry is not None else time.time() + self.default_ttl
+
+        self._remove_locked(session_file)
+        if expires_at <= time.time() and not force:
+            # 已过期的会话不常驻内存
+            return
+
+        self._entries[session_file] = _Entry(session_data, size, version, expires_at, dirty)
+        self._bytes += size
+        self._evict_locked()
+
+    def _remove_locked(self, session_file):
+        entry = self._entries.pop(session_file, None)
+        if entry is not None:
+            self._bytes -= entry.size
+        return entry
+
+    def _evict_locked(self):
+        now = time.time()
+        for session_file in [k for k, e in self._entries.items() if e.expires_at <= now and not e.dirty]:
+            self._remove_locked(session_file)
+            self._stats["expirations"] += 1
+
+        # 按最近最少使用淘汰；未落盘的条目保留到写入完成
+        for session_file in list(self._entries.keys()):
+            if len(self._entries) <= self.max_entries and self._bytes <= self.max_bytes:
+                break
+            if self._entries[session_file].dirty:
+                continue
+            self._remove_locked(session_file)
+            self._stats["evictions"] += 1
+
+    @staticmethod
+    def _file_version(session_file):
+        try:
+            return os.stat(session_file).st_mtime
+        except OSError:
+            return None
+
+    def _ensure_writer(self):
+        if self._writer is not None:
+            return
+        with self._flush_lock:
+            if self._writer is None:
+                self._writer_stop = False
+                self._writer = threading.Thread(target=self._writer_loop, name="session-writer", daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+
+    def _writer_loop(self):
+        while not self._writer_stop:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            # 合并短时间内的多次写入
+            time.sleep(self.flush_delay)
+            self.flush()
@@ -0,0 +1,220 @@
+"""
+会话有效性验证
+用带会话 cookies / User-Agent 的轻量请求判断 Cloudflare 是否仍然放行：
+
+- 客户端按域名复用（keep-alive），同一域名的验证串行使用同一个客户端
+- 先发 HEAD（挑战时 Cloudflare 返回 cf-mitigated: challenge），无法判断时再用 Range 请求读取少量正文
+- 挑战特征使用预编译的匹配（http_fast_path.looks_challenged），只检查正文开头
+- 相同 URL + cookies + UA 的结论缓存 ttl 秒，短时间内的重复验证不再发请求
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from http_fast_path import looks_challenged
+
+
+class VerdictCache:
+    """验证结论的短 TTL 缓存（超过 max_entries 时淘汰最早写入的）"""
+
+    def __init__(self, ttl=10.0, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(url, cookies, user_agent):
+        digest = hashlib.sha1(json.dumps([cookies, user_agent], sort_keys=True).encode("utf-8")).hexdigest()
+        return url, digest
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, verdict):
+        if self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, verdict)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class SessionVerifier:
+    """
+    按域名复用客户端的会话验证器
+
+        verifier = SessionVerifier(lambda: AresClient(timeout=15), expired_errors=(CloudflareSessionExpired,))
+        verdict = verifier.verify(url, cookies, user_agent)
+        # {"valid": true, "status_code": 200, "probe": "head", "cached": false, "elapsed": 0.09}
+
+    - factory(): 创建一个 requests 风格的客户端（.cookies / .head / .get）
+    - expired_errors: 客户端在会话失效时抛出的异常类型，视为无效而不是出错
+    - max_clients: 最多保留的域名客户端数，超出时关闭最久未用的
+    """
+
+    def __init__(self, factory, expired_errors=(), max_bytes=32 * 1024, use_head=True, cache_ttl=10.0,
+                 cache_max_entries=1000, max_clients=64):
+        self.factory = factory
+        self.expired_errors = tuple(expired_errors)
+        self.max_bytes = max_bytes
+        self.use_head = use_head
+        self.max_clients = max_clients
+        self.cache = VerdictCache(cache_ttl, cache_max_entries)
+
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"verifications": 0, "head_probes": 0, "get_probes": 0, "clients_created": 0}
+
+    def verify(self, url, cookies, user_agent=None):
+        """返回验证结论；网络错误等异常直接抛出"""
+        cookies = dict(cookies or {})
+        key = VerdictCache.key(url, cookies, user_agent)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        started = time.monotonic()
+        domain = urlparse(url).netloc.lower()
+        client, client_lock = self._client_for(domain)
+        with client_lock:
+            try:
+                verdict = self._probe(client, url, cookies, user_agent)
+            except self.expired_errors:
+                verdict = {"valid": False, "status_code": None, "probe": "expired"}
+        verdict["elapsed"] = round(time.monotonic() - started, 3)
+
+        with self._lock:
+            self._stats["verifications"] += 1
+        self.cache.put(key, verdict)
+        return {**verdict, "cached": False}
+
+    def verify_many(self, items, concurrency=8):
+        """
+        并发验证多个会话，items 为 [{"url", "cookies", "user_agent"}]，结果顺序与 items 一致
+
+        同一域名的验证共用一个客户端，会依次执行
+        """
+        def one(item):
+            try:
+                return {"url": item["url"], **self.verify(item["url"], item.get("cookies"), item.get("user_agent"))}
+            except Exception as e:
+                return {"url": item.get("url"), "valid": False, "error": str(e)}
+
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items)))) as executor:
+            return list(executor.map(one, items))
+
+    def close(self):
+        with self._lock:
+            clients = [client for client, _ in self._clients.values()]
+            self._clients.clear()
+        for client in clients:
+            _close(client)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            clients = len(self._clients)
+        lookups = self.cache.hits + self.cache.misses
+        stats.update({
+            "clients": clients,
+            "max_clients": self.max_clients,
+            "cache_entries": len(self.cache),
+            "cache_ttl": self.cache.ttl,
+            "cache_hits": self.cache.hits,
+            "cache_hit_ratio": round(self.cache.hits / lookups, 3) if lookups else None,
+        })
+        return stats
+
+    def _client_for(self, domain):
+        evicted = []
+        with self._lock:
+            entry = self._clients.get(domain)
+            if entry is None:
+                entry = self._clients[domain] = (self.factory(), threading.Lock())
+                self._stats["clients_created"] += 1
+                while len(self._clients) > self.max_clients:
+                    evicted.append(self._clients.popitem(last=False)[1])
+            else:
+                self._clients.move_to_end(domain)
+        # 被淘汰的客户端可能正在验证，等它用完再关闭
+        for client, client_lock in evicted:
+            with client_lock:
+                _close(client)
+        return entry
+
+    def _probe(self, client, url, cookies, user_agent):
+        # 客户端按域名复用，先清掉上一次验证留下的 cookies
+        client.cookies.clear()
+        for name, value in cookies.items():
+            client.cookies[name] = value
+        headers = {"User-Agent": user_agent} if user_agent else {}
+
+        if self.use_head and hasattr(client, "head"):
+            with self._lock:
+                self._stats["head_probes"] += 1
+            response = client.head(url, headers=headers)
+            response_headers = _lower_headers(response)
+            if response_headers.get("cf-mitigated", "").lower() == "challenge":
+                return {"valid": False, "status_code": response.status_code, "probe": "head"}
+            if response.status_code < 300:
+                return {"valid": True, "status_code": response.status_code, "probe": "head"}
+            # 3xx（可能是跳到挑战页 / 登录页的重定向）以及 405 / 403 / 503 等：HEAD 无法判断，读取少量正文再判断
+
+        with self._lock:
+            self._stats["get_probes"] += 1
+        headers["Range"] = f"bytes=0-{self.max_bytes - 1}"
+        try:
+            response = client.get(url, headers=headers, stream=True)
+        except TypeError:
+            # 客户端不支持流式读取
+            response = client.get(url, headers=headers)
+        try:
+            body = _read_prefix(response, self.max_bytes)
+        finally:
+            _close(response)
+
+        challenged = looks_challenged(response.status_code, _lower_headers(response), body)
+        return {"valid": not challenged and response.status_code < 400, "status_code": response.status_code,
+                "probe": "get", "challenged": challenged}
+
+
+def _lower_headers(response):
+    return {key.lower(): value for key, value in response.headers.items()}
+
+
+def _read_prefix(response, max_bytes):
+    """最多读取 max_bytes 字节正文（服务器忽略 Range 时也不会下载整页）"""
+    if not hasattr(response, "iter_content"):
+        return (response.content or b"")[:max_bytes]
+    buffer = bytearray()
+    for chunk in response.iter_content(8192):
+        buffer.extend(chunk)
+        if len(buffer) >= max_bytes:
+            break
+    return bytes(buffer[:max_bytes])
+
+
+def _close(resource):
+    try:
+        resource.close()
+    except Exception:
+        pass
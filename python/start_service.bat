@@ -24,7 +24,7 @@ echo 📦 检查依赖...
 pip show undetected-chromedriver >nul 2>&1
 if errorlevel 1 (
     echo ⚠️  依赖未安装，正在安装...
-    pip install undetected-chromedriver flask requests selenium
+    pip install undetected-chromedriver flask requests selenium psutil waitress httpx[http2]
     if errorlevel 1 (
         echo ❌ 安装失败
         pause
@@ -47,6 +47,6 @@ echo ============================================================
 echo.
 
 REM 启动服务
-python cloudflare_bypass_service.py
+python serve.py bypass
 
 pause
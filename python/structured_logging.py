@@ -0,0 +1,192 @@
+"""
+结构化日志
+- 日志先进入内存队列，由后台线程统一写出，请求线程不会阻塞在 stdout / 控制台编码上
+- CF_LOG_FORMAT=json 时每行一个 JSON 对象（便于采集），默认 text 保持原来的 "[时间] 消息" 格式
+- 每个请求带有关联 id（X-Request-ID），同一请求的所有日志、异步任务的日志都带同一个 id
+- 求解过程中的逐步日志（step）可按 CF_LOG_SAMPLE_RATE 采样，同一请求要么全部保留要么全部丢弃
+
+    logger = logging.getLogger(__name__)
+    step(logger, "🌐 访问 URL: %s", url)
+    logger.info("✅ 挑战完成", extra=fields(url=url, time_to_clear=1.8))
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import uuid
+import zlib
+from datetime import datetime
+
+LOG_FORMAT = os.environ.get("CF_LOG_FORMAT", "text")
+LOG_LEVEL = os.environ.get("CF_LOG_LEVEL", "INFO")
+LOG_SAMPLE_RATE = float(os.environ.get("CF_LOG_SAMPLE_RATE", "1.0"))
+LOG_QUEUE_SIZE = int(os.environ.get("CF_LOG_QUEUE_SIZE", "10000"))
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+_listener = None
+_handler = None
+_config = {}
+_lock = threading.Lock()
+
+
+def new_request_id():
+    return uuid.uuid4().hex[:12]
+
+
+def bind_request_id(request_id):
+    """设置当前上下文的关联 id，返回用于 reset_request_id 的 token"""
+    return _request_id.set(request_id)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def fields(**values):
+    """附加到 JSON 日志中的结构化字段：logger.info(msg, extra=fields(url=url))"""
+    return {"fields": values}
+
+
+def step(logger, msg, *args, **values):
+    """求解过程中的逐步日志，受采样率控制"""
+    extra = {"step": True}
+    if values:
+        extra["fields"] = values
+    logger.info(msg, *args, extra=extra)
+
+
+class _ContextFilter(logging.Filter):
+    """在调用线程中补上关联 id，并按请求对逐步日志采样"""
+
+    def __init__(self, sample_rate):
+        super().__init__()
+        self.sample_rate = sample_rate
+
+    def filter(self, record):
+        request_id = _request_id.get()
+        record.request_id = request_id
+
+        if getattr(record, "step", False) and self.sample_rate < 1.0:
+            if request_id is None:
+                return random.random() < self.sample_rate
+            # 按 id 哈希决定，同一请求的逐步日志要么全部保留要么全部丢弃
+            return zlib.crc32(request_id.encode("utf-8")) / 2 ** 32 < self.sample_rate
+        return True
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """队列满时丢弃日志而不是阻塞请求线程"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # 在调用线程中完成参数格式化，保留 exc_info 以外的结构化属性
+        record = logging.makeLogRecord(record.__dict__)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class TextFormatter(logging.Formatter):
+    """[时间] [关联 id] 消息 —— 与原来的 print 输出一致"""
+
+    def format(self, record):
+        timestamp = datetime.fromtimestamp(record.created)
+        prefix = f"[{timestamp}] "
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            prefix += f"[{request_id}] "
+        text = prefix + record.getMessage()
+        if record.exc_text:
+            text += "\n" + record.exc_text
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志一行 JSON"""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "thread": record.threadName,
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        if getattr(record, "step", False):
+            entry["step"] = True
+        extra_fields = getattr(record, "fields", None)
+        if extra_fields:
+            entry.update(extra_fields)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def configure(fmt=LOG_FORMAT, level=LOG_LEVEL, sample_rate=LOG_SAMPLE_RATE, stream=None):
+    """配置根日志：队列 + 后台写出线程（重复调用无副作用）"""
+    global _listener, _handler
+
+    with _lock:
+        if _listener is not None:
+            return
+
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+        _handler = _QueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+        _handler.addFilter(_ContextFilter(sample_rate))
+
+        root = logging.getLogger()
+        root.setLevel(str(level).upper())
+        root.addHandler(_handler)
+
+        _config.update({"format": fmt, "level": str(level).upper(), "sample_rate": sample_rate})
+        _listener = logging.handlers.QueueListener(_handler.queue, output)
+        _listener.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    """写出队列中剩余的日志并停止后台线程"""
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        logging.getLogger().removeHandler(_handler)
+        listener.stop()
+
+
+def stats():
+    return {
+        **_config,
+        "queued": _handler.queue.qsize() if _handler else 0,
+        "dropped": _handler.dropped if _handler else 0,
+    }
@@ -0,0 +1,648 @@
+"""
+多进程分片模式
+一个 Python 进程内的 Selenium 调用、page_source 序列化都受 GIL 限制，这里把求解分摊到多个工作进程：
+- 监督进程启动 N 个 cloudflare_bypass_service 工作进程（各自拥有独立的预热池和驱动）
+- 前端按域名做 rendezvous 哈希路由，同一域名的请求总是落到同一个工作进程，会话和已求解驱动留在本地
+- /solve_batch 按每个 URL 的域名拆分，分别交给负责该域名的进程，各进程的 NDJSON 流合并后返回
+- 工作进程退出后其域名自动分摊到其余进程，并按退避间隔重启；恢复后域名迁回
+
+用法:
+    python serve.py sharded                     # 工作进程数默认等于 CPU 核数
+    CF_WORKERS=8 python serve.py sharded --port 5000
+"""
+
+import json
+import os
+import queue
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, jsonify, request
+
+from cluster import rendezvous_pick
+from structured_logging import new_request_id
+
+# 工作进程数量、端口、每个进程的线程数
+WORKER_COUNT = int(os.environ.get("CF_WORKERS", str(os.cpu_count() or 2)))
+WORKER_BASE_PORT = int(os.environ.get("CF_WORKER_BASE_PORT", "5100"))
+WORKER_THREADS = int(os.environ.get("CF_WORKER_THREADS", "8"))
+
+# 健康检查间隔、重启退避上限、转发超时
+HEALTH_INTERVAL = float(os.environ.get("CF_WORKER_HEALTH_INTERVAL", "2"))
+RESTART_BACKOFF_MAX = float(os.environ.get("CF_WORKER_RESTART_BACKOFF_MAX", "60"))
+FORWARD_TIMEOUT = int(os.environ.get("CF_WORKER_FORWARD_TIMEOUT", "600"))
+
+# 不转发给工作进程的逐跳头
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "content-length", "content-encoding", "host",
+}
+
+
+def routing_key(body):
+    """
+    从请求中取出路由用的域名，无法确定时返回 None（由调用方广播或任选一个进程）
+
+    driver_id 的格式为 "<域名>_<时间戳>_<随机串>"，按其中的域名路由回创建它的进程
+    """
+    if isinstance(body, dict):
+        if body.get("domain"):
+            return str(body["domain"]).lower()
+        url = body.get("url")
+        if url:
+            return urlparse(str(url)).netloc.lower() or None
+        driver_id = body.get("driver_id")
+        if driver_id and str(driver_id).count("_") >= 2:
+            return str(driver_id).rsplit("_", 2)[0].lower()
+    return None
+
+
+class WorkerProcess:
+    """一个工作进程槽位（重启后序号和端口不变）"""
+
+    def __init__(self, index, port, threads):
+        self.index = index
+        self.port = port
+        self.threads = threads
+        self.process = None
+        self.ready = False
+        self.started_at = None
+        self.restarts = 0
+        self.next_restart = 0.0
+        self.routed = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        env = dict(os.environ, CF_WORKER_INDEX=str(self.index))
+        command = [
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py"), "bypass",
+            "--host", "127.0.0.1",
+            "--port", str(self.port),
+            "--threads", str(self.threads),
+        ]
+        kwargs = {}
+        if os.name == "nt":
+            # 独立进程组，关闭时可以发送 CTRL_BREAK 让其优雅退出
+            kwargs["creationflags"] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # 终端的 Ctrl+C 只发给监督进程，由它按顺序通知工作进程
+            kwargs["start_new_session"] = True
+
+        self.process = subprocess.Popen(command, env=env, **kwargs)
+        self.ready = False
+        self.started_at = time.time()
+        print(f"[{datetime.now()}] 🧩 工作进程 #{self.index} 已启动 (pid={self.process.pid}, 端口 {self.port})")
+
+    def stop(self):
+        """请求优雅退出（进程内会排空请求、关闭驱动）"""
+        if not self.alive:
+            return
+        try:
+            if os.name == "nt":
+                self.process.send_signal(signal.CTRL_BREAK_EVENT)
+            else:
+                self.process.terminate()
+        except OSError:
+            pass
+
+    def to_dict(self):
+        return {
+            "index": self.index,
+            "port": self.port,
+            "pid": self.process.pid if self.process is not None else None,
+            "alive": self.alive,
+            "ready": self.ready,
+            "restarts": self.restarts,
+            "uptime": round(time.time() - self.started_at, 1) if self.started_at and self.alive else None,
+            "routed": self.routed,
+        }
+
+
+class Supervisor:
+    """
+    启动并监控工作进程，负责按域名选择进程
+
+    - count: 工作进程数
+    - base_port: 第 i 个进程监听 base_port + i
+    - threads: 每个工作进程的 waitress 线程数
+    """
+
+    def __init__(self, count, base_port, threads, health_interval=2.0, restart_backoff_max=60.0):
+        self.workers = [WorkerProcess(i, base_port + i, threads) for i in range(count)]
+        self.health_interval = health_interval
+        self.restart_backoff_max = restart_backoff_max
+
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=count, pool_maxsize=max(threads * 2, 10))
+        self.http.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._monitor = None
+        self._stats = {"forwarded": 0, "rerouted": 0, "no_worker": 0, "restarts": 0}
+
+    def start(self):
+        if self._monitor is not None:
+            return
+        for worker in self.workers:
+            worker.start()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="worker-monitor", daemon=True)
+        self._monitor.start()
+
+    def shutdown(self, timeout=90):
+        """通知所有工作进程优雅退出，超时后强制结束"""
+        self._stop.set()
+        for worker in self.workers:
+            worker.stop()
+
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.process.wait(max(deadline - time.monotonic(), 0.1))
+            except subprocess.TimeoutExpired:
+                print(f"[{datetime.now()}] ⚠️  工作进程 #{worker.index} 未能按时退出，强制结束")
+                worker.process.kill()
+        self.http.close()
+
+    def ready_workers(self):
+        with self._lock:
+            return [worker for worker in self.workers if worker.ready]
+
+    def pick(self, key, exclude=()):
+        """按域名选择就绪的工作进程；key 为 None 时选择路由最少的进程"""
+        candidates = [worker for worker in self.ready_workers() if worker.index not in exclude]
+        if not candidates:
+            return None
+        if key is None:
+            return min(candidates, key=lambda worker: worker.routed)
+        slots = {worker.index: worker for worker in candidates}
+        return slots[rendezvous_pick(key, slots)]
+
+    def worker(self, index):
+        if 0 <= index < len(self.workers):
+            return self.workers[index]
+        return None
+
+    def mark_down(self, worker):
+        with self._lock:
+            if worker.ready:
+                worker.ready = False
+                print(f"[{datetime.now()}] ⚠️  工作进程 #{worker.index} 无响应，域名转移到其他进程")
+
+    def count(self, name, worker=None):
+        with self._lock:
+            self._stats[name] += 1
+            if worker is not None:
+                worker.routed += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["workers"] = [worker.to_dict() for worker in self.workers]
+        stats["ready"] = sum(1 for worker in stats["workers"] if worker["ready"])
+        stats["total"] = len(self.workers)
+        return stats
+
+    def _monitor_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for worker in self.workers:
+                try:
+                    self._check(worker)
+                except Exception as e:
+                    print(f"[{datetime.now()}] ⚠️  检查工作进程 #{worker.index} 失败: {e}")
+
+    def _check(self, worker):
+        if not worker.alive:
+            with self._lock:
+                was_ready, worker.ready = worker.ready, False
+            if was_ready or worker.next_restart == 0.0:
+                code = worker.process.returncode if worker.process is not None else None
+                print(f"[{datetime.now()}] 💥 工作进程 #{worker.index} 已退出 (code={code})，域名已转移")
+                # 连续崩溃时指数退避
+                backoff = min(2 ** min(worker.restarts, 10), self.restart_backoff_max)
+                worker.next_restart = time.monotonic() + backoff
+            if time.monotonic() >= worker.next_restart and not self._stop.is_set():
+                worker.restarts += 1
+                worker.next_restart = 0.0
+                self.count("restarts")
+                worker.start()
+            return
+
+        try:
+            ok = self.http.get(f"{worker.base_url}/health", timeout=2).status_code == 200
+        except requests.RequestException:
+            ok = False
+
+        with self._lock:
+            if ok and not worker.ready:
+                print(f"[{datetime.now()}] ✅ 工作进程 #{worker.index} 就绪")
+            worker.ready = ok
+
+
+supervisor = Supervisor(
+    WORKER_COUNT,
+    WORKER_BASE_PORT,
+    WORKER_THREADS,
+    health_interval=HEALTH_INTERVAL,
+    restart_backoff_max=RESTART_BACKOFF_MAX
+)
+
+app = Flask(__name__)
+
+
+def split_job_id(job_id):
+    """前端返回的 job_id 为 "<进程序号>-<任务 id>" """
+    index, _, inner = job_id.partition("-")
+    if not inner or not index.isdigit():
+        return None, None
+    return supervisor.worker(int(index)), inner
+
+
+def forward(worker, method, path, body):
+    """把请求转发给工作进程，返回流式 Flask 响应"""
+    headers = {
+        name: value for name, value in request.headers.items()
+        if name.lower() not in HOP_BY_HOP_HEADERS
+    }
+    upstream = supervisor.http.request(
+        method,
+        f"{worker.base_url}{path}",
+        params=request.args,
+        data=body,
+        headers=headers,
+        stream=True,
+        timeout=(3, FORWARD_TIMEOUT)
+    )
+
+    response_headers = [
+        (name, value) for name, value in upstream.headers.items()
+        if name.lower() not in HOP_BY_HOP_HEADERS
+    ]
+    response_headers.append(("X-CF-Worker", str(worker.index)))
+
+    content_type = upstream.headers.get("Content-Type", "")
+    if path == "/solve" and upstream.status_code == 202 and content_type.startswith("application/json"):
+        # 异步任务 id 加上进程序号，后续 /jobs/<id> 据此路由
+        payload = upstream.json()
+        upstream.close()
+        if payload.get("job_id"):
+            payload["job_id"] = f"{worker.index}-{payload['job_id']}"
+            payload["status_url"] = f"/jobs/{payload['job_id']}"
+        return Response(json.dumps(payload, ensure_ascii=False), status=202,
+                        headers=response_headers, content_type="application/json")
+
+    def stream():
+        try:
+            for chunk in upstream.iter_content(chunk_size=None):
+                yield chunk
+        finally:
+            upstream.close()
+
+    return Response(stream(), status=upstream.status_code, headers=response_headers)
+
+
+def broadcast(method, path, body=None):
+    """向所有就绪进程发送同一请求，返回 [(worker, 响应 JSON)]"""
+    results = []
+    for worker in supervisor.ready_workers():
+        try:
+            response = supervisor.http.request(method, f"{worker.base_url}{path}", data=body,
+                                               headers={"Content-Type": "application/json"}, timeout=30)
+            results.append((worker, response.json()))
+        except (requests.RequestException, ValueError) as e:
+            results.append((worker, {"success": False, "error": str(e)}))
+    return results
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """汇总所有工作进程的健康状态"""
+    workers = {str(worker.index): data for worker, data in broadcast("GET", "/health")}
+    stats = supervisor.stats()
+    return jsonify({
+        "status": "ok" if stats["ready"] else "starting",
+        "service": "Cloudflare Bypass Service (sharded)",
+        "version": "1.0.0",
+        "timestamp": datetime.now().isoformat(),
+        "active_drivers": sum(data.get("active_drivers", 0) for data in workers.values()),
+        "supervisor": stats,
+        "workers": workers
+    }), 200 if stats["ready"] else 503
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    """合并所有工作进程的任务列表"""
+    jobs = []
+    for worker, data in broadcast("GET", "/jobs"):
+        for job in data.get("jobs", []):
+            jobs.append({**job, "job_id": f"{worker.index}-{job['job_id']}"})
+    return jsonify({"success": True, "jobs": jobs})
+
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE'])
+def job_detail(job_id):
+    """查询 / 取消异步任务，按 job_id 中的进程序号路由"""
+    worker, inner_id = split_job_id(job_id)
+    if worker is None or not worker.ready:
+        return jsonify({"success": False, "error": "任务不存在"}), 404
+
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), 60)
+    except ValueError:
+        return jsonify({"success": False, "error": "wait must be a number"}), 400
+
+    try:
+        response = supervisor.http.request(request.method, f"{worker.base_url}/jobs/{inner_id}",
+                                           params=request.args, timeout=wait + 30)
+        payload = response.json()
+    except (requests.RequestException, ValueError) as e:
+        return jsonify({"success": False, "error": str(e)}), 502
+
+    if payload.get("job_id"):
+        payload["job_id"] = job_id
+    return jsonify(payload), response.status_code
+
+
+@app.route('/cancel', methods=['POST'])
+def cancel_request():
+    """按 job_id 路由到对应进程取消任务；按 request_id 取消时广播给所有进程"""
+    data = request.get_json(silent=True) or {}
+
+    if data.get('job_id'):
+        worker, inner_id = split_job_id(str(data['job_id']))
+        if worker is None or not worker.ready:
+            return jsonify({"success": False, "error": "任务不存在"}), 404
+        try:
+            response = supervisor.http.delete(f"{worker.base_url}/jobs/{inner_id}", timeout=30)
+            payload = response.json()
+        except (requests.RequestException, ValueError) as e:
+            return jsonify({"success": False, "error": str(e)}), 502
+        if payload.get("job_id"):
+            payload["job_id"] = data['job_id']
+        return jsonify(payload), response.status_code
+
+    if not data.get('request_id'):
+        return jsonify({"success": False, "error": "request_id or job_id is required"}), 400
+
+    results = broadcast("POST", "/cancel", json.dumps({"request_id": data['request_id']}).encode("utf-8"))
+    cancelled = sum(result.get("cancelled", 0) for _, result in results)
+    if not cancelled:
+        return jsonify({"success": False, "error": "请求不存在或已完成"}), 404
+    return jsonify({"success": True, "request_id": data['request_id'], "cancelled": cancelled})
+
+
+@app.route('/close_all', methods=['POST'])
+def close_all():
+    """所有工作进程都关闭各自的驱动"""
+    results = broadcast("POST", "/close_all", b"{}")
+    return jsonify({
+        "success": all(data.get("success") for _, data in results),
+        "message": "; ".join(f"#{worker.index}: {data.get('message') or data.get('error')}" for worker, data in results)
+    })
+
+
+@app.route('/solve_batch', methods=['POST'])
+def solve_batch():
+    """
+    按每个 URL 的域名把批量请求拆给负责的工作进程，合并各进程的结果
+
+    各进程收到的是原请求的子集（其余字段不变），结果中的 index / duplicate_of 换算回原请求中的下标；
+    同一域名总在同一进程内，按域名去重照常生效。所有子请求使用同一个 X-Request-ID，/cancel 广播时一起取消
+    """
+    data = request.get_json(silent=True)
+    urls = data.get('urls') if isinstance(data, dict) else None
+    if not urls or not isinstance(urls, list):
+        # 交给工作进程校验并返回错误
+        return route_request("solve_batch")
+
+    request_id = request.headers.get('X-Request-ID') or new_request_id()
+    parts, error = open_batch_parts(data, urls, request_id)
+    if error is not None:
+        return error
+
+    batch = MergedBatch(urls, parts)
+    response_headers = {"X-Request-ID": request_id, "X-CF-Worker": ",".join(str(worker.index) for worker, _, _ in parts)}
+
+    if not data.get('stream', True):
+        results = [result for result in batch.results() if 'index' in result]
+        results.sort(key=lambda result: result['index'])
+        return jsonify({
+            "success": all(result.get('success') for result in results),
+            "results": results,
+            "summary": batch.summary()
+        }), 200, response_headers
+
+    def generate():
+        for result in batch.results():
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson", headers=response_headers)
+
+
+def open_batch_parts(data, urls, request_id):
+    """
+    按域名分组并向各工作进程发起流式 /solve_batch，返回 ([(worker, 原下标列表, 上游响应)], None)
+
+    连不上的进程标记为下线，其 URL 重新分组；任一进程拒绝请求（参数错误等）时关闭已发起的请求，返回 (None, 错误响应)
+    """
+    headers = {
+        name: value for name, value in request.headers.items()
+        if name.lower() not in HOP_BY_HOP_HEADERS
+    }
+    headers.update({"Content-Type": "application/json", "X-Request-ID": request_id})
+    keys = [routing_key(entry if isinstance(entry, dict) else {"url": entry}) for entry in urls]
+
+    parts = []
+    pending = list(range(len(urls)))
+    tried = set()
+    while pending:
+        groups = {}
+        for index in pending:
+            worker = supervisor.pick(keys[index], exclude=tried)
+            if worker is None:
+                supervisor.count("no_worker")
+                close_batch_parts(parts)
+                return None, (jsonify({"success": False, "error": "没有可用的工作进程"}), 503)
+            groups.setdefault(worker.index, (worker, []))[1].append(index)
+
+        pending = []
+        for worker, indexes in groups.values():
+            body = {**data, "urls": [urls[index] for index in indexes], "stream": True}
+            try:
+                upstream = supervisor.http.post(
+                    f"{worker.base_url}/solve_batch",
+                    data=json.dumps(body, ensure_ascii=False).encode("utf-8"),
+                    headers=headers,
+                    stream=True,
+                    timeout=(3, FORWARD_TIMEOUT)
+                )
+            except requests.ConnectionError:
+                supervisor.mark_down(worker)
+                supervisor.count("rerouted")
+                tried.add(worker.index)
+                pending.extend(indexes)
+                continue
+
+            supervisor.count("forwarded", worker)
+            parts.append((worker, indexes, upstream))
+            if upstream.status_code != 200:
+                try:
+                    payload = upstream.json()
+                except ValueError:
+                    payload = {"success": False, "error": f"工作进程 #{worker.index} 返回 {upstream.status_code}"}
+                close_batch_parts(parts)
+                if isinstance(payload.get("error"), str):
+                    # 子请求中的 urls[i] 换算回原请求的下标
+                    payload["error"] = re.sub(r"^urls\[(\d+)\]",
+                                              lambda match: f"urls[{indexes[int(match.group(1))]}]", payload["error"])
+                return None, (jsonify(payload), upstream.status_code)
+    return parts, None
+
+
+def close_batch_parts(parts):
+    """关闭上游连接，工作进程检测到断开后取消剩余求解"""
+    for _, _, upstream in parts:
+        upstream.close()
+
+
+class MergedBatch:
+    """读取各工作进程的 NDJSON 流，按完成顺序合并，最后产出合并后的汇总"""
+
+    def __init__(self, urls, parts):
+        self.urls = urls
+        self.parts = parts
+        self._results = queue.Queue()
+        self._summaries = {}
+        self._counts = {"succeeded": 0, "failed": 0}
+        self._closed = threading.Event()
+        self._started = time.monotonic()
+
+        for worker, indexes, upstream in parts:
+            threading.Thread(target=self._read, args=(worker, indexes, upstream),
+                             name=f"batch-worker-{worker.index}", daemon=True).start()
+
+    def _read(self, worker, indexes, upstream):
+        reported = set()
+        try:
+            for line in upstream.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                if result.get("done"):
+                    self._summaries[worker.index] = result.get("summary") or {}
+                    continue
+                result["index"] = indexes[result["index"]]
+                if "duplicate_of" in result:
+                    result["duplicate_of"] = indexes[result["duplicate_of"]]
+                reported.add(result["index"])
+                self._results.put(result)
+        except (requests.RequestException, ValueError, IndexError) as e:
+            if not self._closed.is_set():
+                print(f"[{datetime.now()}] ⚠️  工作进程 #{worker.index} 的批量结果中断: {e}")
+        finally:
+            upstream.close()
+            # 进程中途退出时，未返回的 URL 记为失败
+            for index in indexes:
+                if index not in reported:
+                    entry = self.urls[index]
+                    self._results.put({
+                        "index": index,
+                        "url": entry.get("url") if isinstance(entry, dict) else entry,
+                        "status_code": 502,
+                        "success": False,
+                        "error": f"工作进程 #{worker.index} 未返回结果"
+                    })
+            self._results.put(None)
+
+    def results(self):
+        """按完成顺序产出每个 URL 的结果，最后产出汇总；生成器被提前关闭时断开所有上游"""
+        remaining = len(self.parts)
+        try:
+            while remaining:
+                result = self._results.get()
+                if result is None:
+                    remaining -= 1
+                    continue
+                self._counts["succeeded" if result.get("success") else "failed"] += 1
+                yield result
+            yield {"done": True, "summary": self.summary()}
+        finally:
+            self._closed.set()
+            close_batch_parts(self.parts)
+
+    def summary(self):
+        elapsed = time.monotonic() - self._started
+        summaries = [self._summaries.get(worker.index) for worker, _, _ in self.parts]
+        unique = sum(summary["unique"] if summary else len(indexes)
+                     for summary, (_, indexes, _) in zip(summaries, self.parts))
+        return {
+            "total": len(self.urls),
+            "unique": unique,
+            "parallelism": sum(summary.get("parallelism", 0) for summary in summaries if summary),
+            **self._counts,
+            "elapsed": round(elapsed, 3),
+            "throughput": round(unique / elapsed, 3) if elapsed else None,
+            "workers": {str(worker.index): len(indexes) for worker, indexes, _ in self.parts}
+        }
+
+
+@app.route('/<path:path>', methods=['GET', 'POST'])
+def route_request(path):
+    """其余接口按域名路由到工作进程"""
+    body = request.get_data()
+    try:
+        key = routing_key(json.loads(body) if body else None)
+    except ValueError:
+        key = None
+
+    tried = set()
+    while True:
+        worker = supervisor.pick(key, exclude=tried)
+        if worker is None:
+            supervisor.count("no_worker")
+            return jsonify({"success": False, "error": "没有可用的工作进程"}), 503
+
+        try:
+            response = forward(worker, request.method, f"/{path}", body)
+        except requests.ConnectionError:
+            # 连接不上说明请求尚未被处理，换下一个进程重试
+            supervisor.mark_down(worker)
+            supervisor.count("rerouted")
+            tried.add(worker.index)
+            continue
+
+        supervisor.count("forwarded", worker)
+        return response
+
+
+def start_background_workers():
+    """启动所有工作进程和监控线程"""
+    supervisor.start()
+
+
+def cleanup():
+    """通知工作进程排空请求并退出"""
+    print("\n正在停止工作进程...")
+    supervisor.shutdown()
+
+
+if __name__ == '__main__':
+    print("💡 请使用: python serve.py sharded")
@@ -0,0 +1,11 @@
+"""
+自动测试（不需要浏览器 / 网络）
+
+    cd python && python -m pytest -q
+"""
+
+import os
+import sys
+
+# 服务模块都是 python/ 下的平铺模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,189 @@
+"""
+集群协调：节点心跳、求解租约、任务认领、按域名分片
+"""
+
+import threading
+import time
+
+import pytest
+
+from cluster import ClusterNode, SqliteBroker, rendezvous_pick
+from job_queue import FAILED, QUEUED, RUNNING
+
+
+@pytest.fixture
+def broker(tmp_path):
+    broker = SqliteBroker(str(tmp_path / "cluster.db"))
+    yield broker
+    broker.close()
+
+
+def accept_all(domain, age):
+    return True
+
+
+# ---- 租约 ----
+
+def test_lease_is_exclusive_until_expiry(broker):
+    """租约有效期内其他节点拿不到，过期后可以被接管"""
+    assert broker.acquire_lease("solve:a.com", "node-1", ttl=0.3) == "node-1"
+    assert broker.acquire_lease("solve:a.com", "node-2", ttl=0.3) == "node-1"
+    assert broker.lease_holder("solve:a.com") == "node-1"
+
+    time.sleep(0.4)
+
+    assert broker.lease_holder("solve:a.com") is None
+    assert broker.acquire_lease("solve:a.com", "node-2", ttl=0.3) == "node-2"
+
+
+def test_renewed_lease_outlives_original_ttl(broker):
+    broker.acquire_lease("solve:a.com", "node-1", ttl=0.3)
+    time.sleep(0.2)
+    broker.renew_leases(["solve:a.com"], "node-1", ttl=0.5)
+    time.sleep(0.2)
+    assert broker.lease_holder("solve:a.com") == "node-1"
+
+
+def test_only_owner_can_release_lease(broker):
+    broker.acquire_lease("solve:a.com", "node-1", ttl=30)
+    broker.release_lease("solve:a.com", "node-2")
+    assert broker.lease_holder("solve:a.com") == "node-1"
+    broker.release_lease("solve:a.com", "node-1")
+    assert broker.lease_holder("solve:a.com") is None
+
+
+def test_node_waits_for_expired_lease_of_lost_node(broker):
+    """持有租约的节点失联（不再续约）后，等待的节点在租约过期时接手"""
+    lost = ClusterNode(broker, "node-1", lease_ttl=0.3)
+    waiting = ClusterNode(broker, "node-2", lease_ttl=0.3)
+
+    assert lost.try_lease("solve:a.com") is None
+    assert waiting.try_lease("solve:a.com") == "node-1"
+
+    started = time.monotonic()
+    assert waiting.wait_lease("solve:a.com", timeout=5, poll_interval=0.05)
+    assert time.monotonic() - started < 2
+    assert waiting.try_lease("solve:a.com") is None
+
+
+def test_wait_lease_times_out_while_lease_is_held(broker):
+    holder = ClusterNode(broker, "node-1", lease_ttl=30)
+    waiting = ClusterNode(broker, "node-2", lease_ttl=30)
+    holder.try_lease("solve:a.com")
+    assert not waiting.wait_lease("solve:a.com", timeout=0.2, poll_interval=0.05)
+
+
+def test_reentrant_lease_released_after_last_holder(broker):
+    """同一节点内多次获取同一租约，最后一次释放时才真正释放"""
+    node = ClusterNode(broker, "node-1", lease_ttl=30)
+    assert node.try_lease("solve:a.com") is None
+    assert node.try_lease("solve:a.com") is None
+    node.release_lease("solve:a.com")
+    assert broker.lease_holder("solve:a.com") == "node-1"
+    node.release_lease("solve:a.com")
+    assert broker.lease_holder("solve:a.com") is None
+
+
+# ---- 节点 ----
+
+def test_nodes_drop_out_after_heartbeat_ttl(broker):
+    broker.heartbeat("node-1", "http://10.0.0.1:5000", time.time())
+    broker.heartbeat("node-2", "http://10.0.0.2:5000", time.time())
+    assert {node["node_id"] for node in broker.live_nodes(ttl=0.3)} == {"node-1", "node-2"}
+
+    time.sleep(0.4)
+    broker.heartbeat("node-2", "http://10.0.0.2:5000", time.time())
+    assert [node["node_id"] for node in broker.live_nodes(ttl=0.3)] == ["node-2"]
+
+
+# ---- 任务 ----
+
+def test_job_reclaimed_after_owner_lease_expires(broker):
+    """认领任务的节点失联后任务租约过期，由其他节点重新认领"""
+    assert broker.submit_job("job-1", "solve", "a.com", {"url": "https://a.com/"}, max_queue=10) is None
+
+    claimed = broker.claim_jobs("node-1", limit=5, lease_ttl=0.3, accept=accept_all, max_attempts=3)
+    assert [job_id for job_id, _, _ in claimed] == ["job-1"]
+    assert broker.claim_jobs("node-2", limit=5, lease_ttl=0.3, accept=accept_all, max_attempts=3) == []
+
+    time.sleep(0.4)
+
+    claimed = broker.claim_jobs("node-2", limit=5, lease_ttl=30, accept=accept_all, max_attempts=3)
+    assert claimed == [("job-1", "solve", {"url": "https://a.com/"})]
+    job = broker.get_job("job-1")
+    assert job["status"] == RUNNING
+    assert job["owner"] == "node-2"
+    assert job["attempts"] == 2
+
+    # 原节点恢复后不能再提交结果
+    broker.finish_job("job-1", "node-1", "succeeded", {"success": True}, 200)
+    assert broker.get_job("job-1")["status"] == RUNNING
+
+
+def test_job_fails_after_max_attempts(broker):
+    broker.submit_job("job-1", "solve", "a.com", {"url": "https://a.com/"}, max_queue=10)
+    for node in ("node-1", "node-2"):
+        assert broker.claim_jobs(node, limit=1, lease_ttl=0.1, accept=accept_all, max_attempts=2)
+        time.sleep(0.15)
+
+    assert broker.claim_jobs("node-3", limit=1, lease_ttl=0.1, accept=accept_all, max_attempts=2) == []
+    assert broker.get_job("job-1")["status"] == FAILED
+
+
+def test_cancel_queued_and_running_jobs(broker):
+    broker.submit_job("queued", "solve", "a.com", {"url": "https://a.com/"}, max_queue=10)
+    broker.submit_job("running", "solve", "b.com", {"url": "https://b.com/"}, max_queue=10)
+    broker.claim_jobs("node-1", limit=1, lease_ttl=30, accept=lambda domain, age: domain == "b.com", max_attempts=3)
+
+    broker.cancel_job("queued")
+    broker.cancel_job("running")
+
+    assert broker.get_job("queued")["status"] == "cancelled"
+    assert broker.get_job("running")["status"] == RUNNING
+    assert broker.renew_jobs(["running"], "node-1", ttl=30) == {"running"}
+
+
+def test_submit_rejected_when_queue_full(broker):
+    broker.submit_job("job-1", "solve", "a.com", {"url": "https://a.com/"}, max_queue=1)
+    assert broker.submit_job("job-2", "solve", "b.com", {"url": "https://b.com/"}, max_queue=1) == 1
+    assert broker.job_counts() == {QUEUED: 1}
+
+
+
+def test_failed_claim_rolls_back_and_releases_connection(tmp_path):
+    """事务中出错时回滚并归还连接，请求线程不再各自占用连接"""
+    broker = SqliteBroker(str(tmp_path / "cluster.db"), pool_size=2)
+    broker.submit_job("job-1", "solve", "a.com", {"url": "https://a.com/"}, max_queue=10)
+
+    def reject(domain, age):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        broker.claim_jobs("node-1", limit=1, lease_ttl=30, accept=reject, max_attempts=3)
+    assert broker.get_job("job-1")["status"] == QUEUED
+
+    threads = [threading.Thread(target=broker.lease_holder, args=(f"solve:{i}.com",)) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert broker._pool.stats()["created"] <= 2
+    broker.close()
+
+# ---- 分片 ----
+
+def test_rendezvous_pick_only_moves_keys_of_removed_slot():
+    """去掉一个槽位时只有原本落在该槽位的 key 改变归属"""
+    keys = [f"d{i}.example.com" for i in range(500)]
+    before = {key: rendezvous_pick(key, ["n1", "n2", "n3"]) for key in keys}
+    after = {key: rendezvous_pick(key, ["n1", "n3"]) for key in keys}
+
+    assert set(before.values()) == {"n1", "n2", "n3"}
+    for key in keys:
+        if before[key] != "n2":
+            assert after[key] == before[key]
+
+
+def test_rendezvous_pick_is_stable_and_ignores_slot_order():
+    assert rendezvous_pick("a.com", ["n1", "n2", "n3"]) == rendezvous_pick("a.com", ["n3", "n1", "n2"])
+    assert rendezvous_pick("a.com", ["n1"]) == "n1"
@@ -0,0 +1,189 @@
+"""
+异步任务队列、取消标记和同 key 合并
+"""
+
+import threading
+import time
+
+import pytest
+
+from job_queue import (CANCELLED, FAILED, RUNNING, SUCCEEDED, CancelRegistry, CancelToken, DeadlineExceeded,
+                       JobCancelled, JobManager, JobQueueFull, SingleFlight, raise_if_cancelled)
+
+
+@pytest.fixture
+def manager():
+    manager = JobManager(max_workers=1, max_queue=2)
+    yield manager
+    manager.shutdown()
+
+
+def wait_until(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() >= deadline:
+            raise AssertionError("等待超时")
+        time.sleep(0.01)
+
+
+def blocking_job(started, release):
+    """执行后等待 release，期间被取消时抛出 JobCancelled"""
+    def run(params, cancel_event):
+        started.set()
+        while not release.is_set():
+            if cancel_event.wait(0.01):
+                raise_if_cancelled(cancel_event)
+        return {"success": True, "url": params["url"]}, 200
+    return run
+
+
+def test_job_succeeds(manager):
+    job = manager.submit(lambda params, cancel_event: ({"success": True}, 200), {"url": "https://a.com/"})
+    assert manager.wait(job.id, timeout=5).status == SUCCEEDED
+    assert job.result == {"success": True}
+    assert job.status_code == 200
+    assert job.to_dict()["timings"]["run_time"] is not None
+
+
+def test_job_failure_is_reported(manager):
+    def fail(params, cancel_event):
+        raise RuntimeError("boom")
+
+    job = manager.wait(manager.submit(fail, {"url": "https://a.com/"}).id, timeout=5)
+    assert job.status == FAILED
+    assert job.status_code == 500
+    assert job.error == "boom"
+
+
+def test_cancel_running_job(manager):
+    """执行中的任务收到取消标记后自行中止，状态为 cancelled（409）"""
+    started, release = threading.Event(), threading.Event()
+    job = manager.submit(blocking_job(started, release), {"url": "https://a.com/"})
+    assert started.wait(5)
+    assert job.status == RUNNING
+
+    manager.cancel(job.id)
+
+    assert manager.wait(job.id, timeout=5).status == CANCELLED
+    assert job.status_code == 409
+    assert job.result["cancelled"] is True
+    assert manager.stats()["completed"][CANCELLED] == 1
+
+
+def test_cancel_queued_job_never_runs(manager):
+    """排队中的任务取消后立即结束，不再执行"""
+    started, release = threading.Event(), threading.Event()
+    ran = threading.Event()
+    first = manager.submit(blocking_job(started, release), {"url": "https://a.com/"})
+    assert started.wait(5)
+
+    def second_fn(params, cancel_event):
+        ran.set()
+        return {"success": True}, 200
+
+    second = manager.submit(second_fn, {"url": "https://b.com/"})
+    manager.cancel(second.id)
+    assert second.status == CANCELLED
+    assert second.done_event.is_set()
+
+    release.set()
+    assert manager.wait(first.id, timeout=5).status == SUCCEEDED
+    time.sleep(0.05)
+    assert not ran.is_set()
+
+
+def test_deadline_marks_job_failed(manager):
+    def slow(params, cancel_event):
+        token = CancelToken(deadline=time.monotonic() + 0.05, parents=[cancel_event])
+        token.wait(5)
+        raise_if_cancelled(token)
+        return {"success": True}, 200
+
+    job = manager.wait(manager.submit(slow, {"url": "https://a.com/"}).id, timeout=5)
+    assert job.status == FAILED
+    assert job.status_code == 504
+
+
+def test_queue_full_rejects_submit(manager):
+    started, release = threading.Event(), threading.Event()
+    manager.submit(blocking_job(started, release), {"url": "https://a.com/"})
+    assert started.wait(5)
+    manager.submit(blocking_job(threading.Event(), release), {"url": "https://b.com/"})
+    manager.submit(blocking_job(threading.Event(), release), {"url": "https://c.com/"})
+
+    with pytest.raises(JobQueueFull):
+        manager.submit(blocking_job(threading.Event(), release), {"url": "https://d.com/"})
+    assert manager.stats()["completed"]["rejected"] == 1
+    release.set()
+
+
+# ---- 取消标记 ----
+
+def test_cancel_token_deadline_and_parents():
+    parent = CancelToken()
+    child = CancelToken(parents=[parent])
+    assert not child.is_set()
+    parent.cancel("disconnected")
+    assert child.is_set()
+    assert child.reason == "disconnected"
+    with pytest.raises(JobCancelled):
+        raise_if_cancelled(child)
+
+    expired = CancelToken(deadline=time.monotonic() - 1)
+    assert expired.remaining() == 0
+    with pytest.raises(DeadlineExceeded):
+        raise_if_cancelled(expired)
+
+
+def test_cancel_registry_cancels_all_tokens_of_request_id():
+    registry = CancelRegistry()
+    first, second, other = CancelToken(), CancelToken(), CancelToken()
+    registry.register("req-1", first)
+    registry.register("req-1", second)
+    registry.register("req-2", other)
+
+    assert registry.cancel("req-1") == 2
+    assert first.is_set() and second.is_set() and not other.is_set()
+
+    registry.unregister("req-1", first)
+    registry.unregister("req-1", second)
+    assert len(registry) == 1
+
+
+# ---- 同 key 合并 ----
+
+def test_single_flight_shares_result_of_concurrent_calls():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def solve():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("a.com", solve))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: flight.stats()["waiting"] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(results) == [("result", False)] + [("result", True)] * 3
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_single_flight_waiter_can_be_cancelled():
+    flight = SingleFlight()
+    release = threading.Event()
+    leader = threading.Thread(target=lambda: flight.do("a.com", lambda: release.wait(5)))
+    leader.start()
+    wait_until(lambda: flight.stats()["in_flight"] == 1)
+
+    with pytest.raises(DeadlineExceeded):
+        flight.do("a.com", lambda: None, cancel_event=CancelToken(deadline=time.monotonic() + 0.1))
+    release.set()
+    leader.join(5)
@@ -0,0 +1,61 @@
+"""
+Prometheus 文本格式输出
+"""
+
+import pytest
+
+from metrics import Registry
+
+
+def test_counter_render_with_labels():
+    registry = Registry()
+    requests_total = registry.counter("cf_requests_total", "请求数", ["endpoint", "status"])
+    requests_total.inc(endpoint="/solve", status=200)
+    requests_total.inc(2, endpoint="/solve", status=200)
+    requests_total.inc(endpoint='/a"b', status=500)
+
+    assert registry.render() == (
+        "# HELP cf_requests_total 请求数\n"
+        "# TYPE cf_requests_total counter\n"
+        'cf_requests_total{endpoint="/a\\"b",status="500"} 1\n'
+        'cf_requests_total{endpoint="/solve",status="200"} 3\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    seconds = registry.histogram("cf_solve_seconds", "求解耗时", ["phase"], buckets=(0.5, 1))
+    seconds.observe(0.2, phase="wait")
+    seconds.observe(0.7, phase="wait")
+    seconds.observe(3, phase="wait")
+
+    assert registry.render().splitlines()[2:] == [
+        'cf_solve_seconds_bucket{phase="wait",le="0.5"} 1',
+        'cf_solve_seconds_bucket{phase="wait",le="1"} 2',
+        'cf_solve_seconds_bucket{phase="wait",le="+Inf"} 3',
+        'cf_solve_seconds_sum{phase="wait"} 3.9',
+        'cf_solve_seconds_count{phase="wait"} 3',
+    ]
+
+
+def test_callback_gauges():
+    registry = Registry()
+    registry.gauge("cf_pool_idle", "空闲驱动数", lambda: [({"headless": True}, 2), ({"headless": False}, None)],
+                   ["headless"])
+    registry.counter_from("cf_refreshed_total", "刷新次数", lambda: 5)
+    registry.gauge("cf_broken", "回调出错时不输出", lambda: 1 / 0)
+
+    assert registry.render() == (
+        "# HELP cf_pool_idle 空闲驱动数\n"
+        "# TYPE cf_pool_idle gauge\n"
+        'cf_pool_idle{headless="True"} 2\n'
+        "# HELP cf_refreshed_total 刷新次数\n"
+        "# TYPE cf_refreshed_total counter\n"
+        "cf_refreshed_total 5\n"
+    )
+
+
+def test_labels_must_match_declaration():
+    counter = Registry().counter("cf_requests_total", "请求数", ["endpoint"])
+    with pytest.raises(ValueError):
+        counter.inc(status=200)
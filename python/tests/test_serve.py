@@ -0,0 +1,40 @@
+"""
+生产环境入口的 WSGI 中间件：默认截止时间
+"""
+
+import io
+import json
+
+from serve import DeadlineMiddleware
+
+
+def echo_app(environ, start_response):
+    """把收到的请求体原样返回"""
+    body = environ['wsgi.input'].read(int(environ.get('CONTENT_LENGTH') or 0))
+    start_response('200 OK', [('Content-Type', 'application/json')])
+    return [body]
+
+
+def call(app, path, body, method='POST'):
+    raw = body if isinstance(body, bytes) else json.dumps(body).encode('utf-8')
+    environ = {
+        'PATH_INFO': path,
+        'REQUEST_METHOD': method,
+        'CONTENT_LENGTH': str(len(raw)),
+        'wsgi.input': io.BytesIO(raw),
+    }
+    return b"".join(app(environ, lambda status, headers: None))
+
+
+def test_default_deadline_added_when_missing():
+    app = DeadlineMiddleware(echo_app, {"/solve": 120, "/fetch": 60})
+    assert json.loads(call(app, "/solve", {"url": "https://a.com/"})) == {"url": "https://a.com/", "deadline": 120}
+    assert json.loads(call(app, "/fetch", {"url": "https://a.com/"}))["deadline"] == 60
+
+
+def test_explicit_deadline_and_other_requests_unchanged():
+    app = DeadlineMiddleware(echo_app, {"/solve": 120, "/fetch": 0})
+    assert json.loads(call(app, "/solve", {"url": "https://a.com/", "deadline": 30}))["deadline"] == 30
+    assert "deadline" not in json.loads(call(app, "/fetch", {"url": "https://a.com/"}))
+    assert "deadline" not in json.loads(call(app, "/get_session", {"url": "https://a.com/"}))
+    assert call(app, "/solve", b"not json") == b"not json"
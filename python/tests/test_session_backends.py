@@ -0,0 +1,151 @@
+"""
+会话持久化后端：JSON 文件 / SQLite 的读写和 JSON -> SQLite 导入
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from session_backends import JsonFileBackend, SqliteBackend, SqliteConnectionPool, create_backend, import_json_sessions
+from session_store import SessionStore
+
+
+def make_session(domain, expiry=None, value="token"):
+    cookie = {"name": "cf_clearance", "value": value, "domain": domain, "path": "/"}
+    if expiry is not None:
+        cookie["expiry"] = expiry
+    return {
+        "cookies": [cookie],
+        "user_agent": "Mozilla/5.0 (test)",
+        "timestamp": datetime.now().isoformat(),
+        "url": f"https://{domain}/",
+        "domain": domain,
+    }
+
+
+def session_key(session_dir, domain):
+    return os.path.join(str(session_dir), f"session_{domain.replace('.', '_')}.json")
+
+
+@pytest.fixture(params=["json", "sqlite"])
+def backend(request, tmp_path):
+    backend = create_backend(request.param, str(tmp_path))
+    yield backend
+    backend.close()
+
+
+
+def test_backend_round_trip(backend, tmp_path):
+    """写入、按 key 读取、版本、列举、按过期时间查询和删除"""
+    soon = time.time() + 60
+    items = [
+        (session_key(tmp_path, "a.com"), make_session("a.com", expiry=soon)),
+        (session_key(tmp_path, "b.com"), make_session("b.com", expiry=time.time() + 86400)),
+    ]
+
+    versions = backend.write_many(items)
+
+    for key, session_data in items:
+        loaded, version, size = backend.load(key)
+        assert loaded == session_data
+        assert version == versions[key] == backend.version(key)
+        assert size > 0
+    assert sorted(backend.keys()) == sorted(key for key, _ in items)
+    assert [key for key, _ in backend.expiring_within(3600)] == [items[0][0]]
+    assert backend.count() == 2
+
+    backend.delete(items[0][0])
+    assert backend.load(items[0][0]) is None
+    assert backend.version(items[0][0]) is None
+    assert backend.count() == 1
+
+
+def test_store_round_trip_through_backend(backend, tmp_path):
+    """会话经 SessionStore 落盘后，新的 SessionStore 可以读回"""
+    key = session_key(tmp_path, "a.com")
+    store = SessionStore(backend, flush_delay=0)
+    store.put(key, make_session("a.com", value="persisted"))
+    store.flush()
+
+    reopened = SessionStore(backend)
+    assert reopened.get(key)["cookies"][0]["value"] == "persisted"
+    assert reopened.stats()["disk_loads"] == 1
+
+
+def test_import_json_sessions_into_sqlite(tmp_path):
+    """JSON 会话文件批量导入 SQLite 后内容和 key 不变，无法解析的文件被跳过"""
+    session_dir = tmp_path / "cf_sessions"
+    source = JsonFileBackend(str(session_dir))
+    items = [(session_key(session_dir, f"s{i}.com"), make_session(f"s{i}.com")) for i in range(7)]
+    source.write_many(items)
+    with open(session_key(session_dir, "broken.com"), "w", encoding="utf-8") as f:
+        f.write("{not json")
+
+    target = SqliteBackend(str(tmp_path / "sessions.db"))
+    try:
+        assert import_json_sessions(target, str(session_dir), batch_size=3) == 7
+        assert target.count() == 7
+        for key, session_data in items:
+            assert target.load(key)[0] == session_data
+    finally:
+        target.close()
+
+
+def test_create_backend_rejects_unknown_kind(tmp_path):
+    with pytest.raises(ValueError):
+        create_backend("redis", str(tmp_path))
+
+
+def test_sqlite_indexes_proxy_and_user_agent(tmp_path):
+    """同一主机直连和走代理的会话分开保存，proxy / user_agent 列可按索引查询"""
+    backend = SqliteBackend(str(tmp_path / "sessions.db"))
+    direct, proxied = session_key(tmp_path, "a.com"), session_key(tmp_path, "a.com-1a2b3c4d")
+    backend.write_many([
+        (direct, make_session("a.com")),
+        (proxied, {**make_session("a.com"), "proxy": "http://127.0.0.1:8080"}),
+    ])
+
+    with backend._pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT session_key, domain FROM sessions WHERE proxy = ? AND user_agent = ?",
+            ("http://127.0.0.1:8080", "Mozilla/5.0 (test)")
+        ).fetchall()
+    assert rows == [(proxied, "a.com")]
+    assert backend.load(direct)[0].get("proxy") is None
+    backend.close()
+
+
+def test_sqlite_connections_are_bounded_across_threads(tmp_path):
+    """每个请求在新线程中执行时，连接数也不超过连接池大小"""
+    backend = SqliteBackend(str(tmp_path / "sessions.db"), pool_size=2)
+    key = session_key(tmp_path, "a.com")
+    backend.write_many([(key, make_session("a.com"))])
+
+    def read():
+        assert backend.load(key)[0]["domain"] == "a.com"
+
+    for _ in range(5):
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+    assert backend._pool.stats()["created"] <= 2
+    backend.close()
+    assert backend._pool.stats()["created"] == 0
+
+
+def test_connection_pool_waits_for_returned_connection(tmp_path):
+    pool = SqliteConnectionPool(str(tmp_path / "pool.db"), size=1, timeout=0.1)
+    with pool.connection() as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            with pool.connection():
+                pass
+    with pool.connection() as again:
+        assert again is conn
+    pool.close()
@@ -0,0 +1,99 @@
+"""
+会话后台刷新：到期调度、闲置跳过、访问记录清理
+"""
+
+import os
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from session_backends import JsonFileBackend
+from session_refresher import SessionRefresher
+from session_store import SessionStore
+
+
+def make_session(domain, expiry):
+    return {
+        "cookies": [{"name": "cf_clearance", "value": "token", "domain": domain, "path": "/", "expiry": expiry}],
+        "user_agent": "Mozilla/5.0 (test)",
+        "timestamp": datetime.now().isoformat(),
+        "url": f"https://{domain}/",
+        "domain": domain,
+    }
+
+
+def session_key(session_dir, domain):
+    return os.path.join(str(session_dir), f"session_{domain.replace('.', '_')}.json")
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(JsonFileBackend(str(tmp_path)), flush_delay=0)
+    yield store
+    store.close()
+
+
+class RecordingRefresh:
+    def __init__(self):
+        self.calls = []
+        self.done = threading.Event()
+
+    def __call__(self, session_file, session_data):
+        self.calls.append((session_file, session_data["domain"]))
+        self.done.set()
+        return True
+
+
+def test_refreshes_due_session_that_was_accessed(store, tmp_path):
+    """即将过期且最近被访问过的会话提交刷新，未被访问过的跳过"""
+    due, untouched = session_key(tmp_path, "a.com"), session_key(tmp_path, "b.com")
+    store.put(due, make_session("a.com", time.time() + 60))
+    store.put(untouched, make_session("b.com", time.time() + 60))
+
+    refresh = RecordingRefresh()
+    refresher = SessionRefresher(store, refresh, lead_time=300, jitter=0)
+    refresher.touch(due)
+    refresher.scan()
+
+    assert refresh.done.wait(5)
+    assert refresh.calls == [(due, "a.com")]
+    stats = refresher.stats()
+    assert stats["skipped_idle"] == 1
+    refresher.shutdown()
+
+
+def test_session_not_yet_due_sets_next_due(store, tmp_path):
+    key = session_key(tmp_path, "a.com")
+    store.put(key, make_session("a.com", time.time() + 400))
+
+    refresh = RecordingRefresh()
+    refresher = SessionRefresher(store, refresh, lead_time=300, jitter=0, scan_interval=200)
+    refresher.touch(key)
+    refresher.scan()
+
+    assert refresh.calls == []
+    assert 90 < refresher.stats()["next_due_in"] <= 100
+    refresher.shutdown()
+
+
+def test_scan_prunes_access_records(store, tmp_path):
+    """存储中不存在的 key 在宽限期后清理，闲置超过 idle_cutoff 的 key 也清理"""
+    stored = session_key(tmp_path, "a.com")
+    store.put(stored, make_session("a.com", time.time() + 3600))
+
+    refresher = SessionRefresher(store, RecordingRefresh(), idle_cutoff=0.2, missing_grace=0.05)
+    refresher.touch(stored)
+    refresher.touch(session_key(tmp_path, "missing.com"))
+    time.sleep(0.1)
+    refresher.touch(session_key(tmp_path, "solving.com"))  # 刚开始求解，会话尚未保存
+
+    refresher.scan()
+    assert refresher.stats()["tracked"] == 2
+    assert refresher.stats()["pruned"] == 1
+
+    time.sleep(0.25)
+    refresher.scan()
+    assert refresher.stats()["tracked"] == 0
+    refresher.shutdown()
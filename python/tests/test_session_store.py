@@ -0,0 +1,156 @@
+"""
+进程内会话存储：LRU 淘汰、write-behind 落盘、有效性判断
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+from session_backends import JsonFileBackend
+from session_store import SessionStore, check_freshness
+
+
+def make_session(domain, expiry=None, saved_at=None, value="token"):
+    cookie = {"name": "cf_clearance", "value": value, "domain": domain, "path": "/"}
+    if expiry is not None:
+        cookie["expiry"] = expiry
+    return {
+        "cookies": [cookie],
+        "user_agent": "Mozilla/5.0 (test)",
+        "timestamp": (saved_at or datetime.now()).isoformat(),
+        "url": f"https://{domain}/",
+        "domain": domain,
+    }
+
+
+def session_key(session_dir, domain):
+    return os.path.join(str(session_dir), f"session_{domain.replace('.', '_')}.json")
+
+
+# ---- LRU 淘汰 ----
+
+def test_evicts_least_recently_used_entry(tmp_path):
+    """超过条目数上限时淘汰最久未使用的会话，被淘汰的会话仍可从后端重新加载"""
+    store = SessionStore(JsonFileBackend(str(tmp_path)), max_entries=2, flush_delay=0)
+    keys = [session_key(tmp_path, domain) for domain in ("a.com", "b.com", "c.com")]
+
+    store.put(keys[0], make_session("a.com"))
+    store.put(keys[1], make_session("b.com"))
+    store.flush()
+    store.get(keys[0])  # a 变为最近使用
+    store.put(keys[2], make_session("c.com"))
+    store.flush()
+
+    stats = store.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+    disk_loads = stats["disk_loads"]
+    assert store.get(keys[0])["domain"] == "a.com"
+    assert store.stats()["disk_loads"] == disk_loads
+    assert store.get(keys[1])["domain"] == "b.com"
+    assert store.stats()["disk_loads"] == disk_loads + 1
+    store.close()
+
+
+def test_evicts_by_total_bytes(tmp_path):
+    """超过字节数上限时淘汰，直到总大小回到上限以内"""
+    session = make_session("a.com", value="x" * 500)
+    size = len(json.dumps(session, ensure_ascii=False))
+    store = SessionStore(JsonFileBackend(str(tmp_path)), max_entries=100, max_bytes=size * 2, flush_delay=0)
+
+    for domain in ("a.com", "b.com", "c.com", "d.com"):
+        store.put(session_key(tmp_path, domain), make_session(domain, value="x" * 500))
+        store.flush()
+
+    stats = store.stats()
+    assert stats["bytes"] <= size * 2
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 2
+
+
+def test_unflushed_entries_are_not_evicted(tmp_path):
+    """未落盘的会话不参与淘汰，落盘后再按上限淘汰"""
+    # flush_delay 足够长，后台线程在测试期间不会落盘
+    store = SessionStore(JsonFileBackend(str(tmp_path)), max_entries=1, flush_delay=60)
+    first, second = session_key(tmp_path, "a.com"), session_key(tmp_path, "b.com")
+
+    store.put(first, make_session("a.com"))
+    store.put(second, make_session("b.com"))
+    assert store.stats()["entries"] == 2
+    assert store.stats()["pending_writes"] == 2
+
+    store.flush()
+    assert store.stats()["entries"] == 1
+    assert os.path.exists(first) and os.path.exists(second)
+
+
+def test_expired_sessions_are_not_cached(tmp_path):
+    """cookie 已过期的会话从后端读取后不常驻内存"""
+    key = session_key(tmp_path, "a.com")
+    JsonFileBackend(str(tmp_path)).write_many([(key, make_session("a.com", expiry=time.time() - 10))])
+
+    store = SessionStore(JsonFileBackend(str(tmp_path)))
+    assert store.get(key)["domain"] == "a.com"
+    assert store.stats()["entries"] == 0
+
+
+# ---- write-behind 落盘 ----
+
+def test_close_flushes_pending_writes(tmp_path):
+    """close() 时把尚未由后台线程写入的会话落盘"""
+    key = session_key(tmp_path, "a.com")
+    store = SessionStore(JsonFileBackend(str(tmp_path)), flush_delay=60)
+    store.put(key, make_session("a.com", value="pending"))
+    assert not os.path.exists(key)
+
+    store.close()
+
+    with open(key, encoding="utf-8") as f:
+        assert f.read().count("pending") == 1
+    reopened = SessionStore(JsonFileBackend(str(tmp_path)))
+    assert reopened.get(key)["cookies"][0]["value"] == "pending"
+
+
+def test_background_writer_coalesces_writes(tmp_path):
+    """短时间内对同一会话的多次写入只落盘最后一次"""
+    key = session_key(tmp_path, "a.com")
+    store = SessionStore(JsonFileBackend(str(tmp_path)), flush_delay=0.2)
+    for i in range(5):
+        store.put(key, make_session("a.com", value=f"v{i}"))
+
+    deadline = time.monotonic() + 5
+    while store.stats()["pending_writes"] and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    assert store.stats()["pending_writes"] == 0
+    assert store.stats()["flushes"] == 1
+    assert JsonFileBackend(str(tmp_path)).load(key)[0]["cookies"][0]["value"] == "v4"
+    store.close()
+
+
+def test_reload_after_external_write(tmp_path):
+    """后端中的版本被其他进程修改后重新加载"""
+    key = session_key(tmp_path, "a.com")
+    store = SessionStore(JsonFileBackend(str(tmp_path)), flush_delay=0)
+    store.put(key, make_session("a.com", value="old"))
+    store.flush()
+
+    time.sleep(0.01)
+    JsonFileBackend(str(tmp_path)).write_many([(key, make_session("a.com", value="new"))])
+    os.utime(key, (time.time() + 5, time.time() + 5))
+
+    assert store.get(key)["cookies"][0]["value"] == "new"
+    store.close()
+
+
+# ---- 有效性 ----
+
+def test_check_freshness():
+    now = time.time()
+    assert check_freshness(make_session("a.com"), max_age=60, now=now) == (True, "fresh")
+    assert check_freshness(make_session("a.com", saved_at=datetime.now() - timedelta(hours=1)),
+                           max_age=60, now=now) == (False, "too_old")
+    assert check_freshness(make_session("a.com", expiry=now + 5), max_age=60, now=now) == (False, "cookie_expired")
+    assert check_freshness({"cookies": []}, max_age=60) == (False, "no_timestamp")
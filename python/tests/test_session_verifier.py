@@ -0,0 +1,88 @@
+"""
+会话有效性验证：HEAD / Range GET 探测和结论缓存
+"""
+
+import pytest
+
+pytest.importorskip("requests")  # http_fast_path 依赖 requests
+
+from session_verifier import SessionVerifier  # noqa: E402
+
+CHALLENGE_PAGE = b"<html><title>Just a moment...</title><script src='/cdn-cgi/challenge-platform/x.js'></script>"
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, content=b""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = content
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    """按预设返回 HEAD / GET 响应并记录请求"""
+
+    def __init__(self, head, get=None):
+        self.cookies = {}
+        self.head_response = head
+        self.get_response = get
+        self.calls = []
+
+    def head(self, url, headers=None):
+        self.calls.append(("HEAD", dict(self.cookies), dict(headers or {})))
+        return self.head_response
+
+    def get(self, url, headers=None, stream=False):
+        self.calls.append(("GET", dict(self.cookies), dict(headers or {})))
+        return self.get_response
+
+
+def make_verifier(client, **kwargs):
+    return SessionVerifier(lambda: client, **kwargs)
+
+
+def test_2xx_head_is_valid_without_get():
+    client = FakeClient(head=FakeResponse(200))
+    verdict = make_verifier(client).verify("https://a.com/", {"cf_clearance": "x"}, "UA")
+
+    assert verdict["valid"] is True
+    assert verdict["probe"] == "head"
+    assert client.calls == [("HEAD", {"cf_clearance": "x"}, {"User-Agent": "UA"})]
+
+
+def test_head_with_cf_mitigated_is_invalid():
+    client = FakeClient(head=FakeResponse(403, {"CF-Mitigated": "challenge"}))
+    verdict = make_verifier(client).verify("https://a.com/", {"cf_clearance": "x"})
+
+    assert verdict["valid"] is False
+    assert verdict["probe"] == "head"
+    assert len(client.calls) == 1
+
+
+@pytest.mark.parametrize("get_response, valid", [
+    (FakeResponse(200, {"Content-Type": "text/html"}, b"<html>ok</html>"), True),
+    (FakeResponse(403, {"Content-Type": "text/html"}, CHALLENGE_PAGE), False),
+])
+def test_3xx_head_is_inconclusive_and_falls_back_to_range_get(get_response, valid):
+    """HEAD 返回 3xx 时不下结论，改用 Range GET 读取正文开头判断"""
+    client = FakeClient(head=FakeResponse(302, {"Location": "/login"}), get=get_response)
+    verdict = make_verifier(client, max_bytes=1024).verify("https://a.com/", {"cf_clearance": "x"}, "UA")
+
+    assert verdict["valid"] is valid
+    assert verdict["probe"] == "get"
+    assert [call[0] for call in client.calls] == ["HEAD", "GET"]
+    assert client.calls[1][2]["Range"] == "bytes=0-1023"
+
+
+def test_verdict_is_cached_and_client_cookies_are_reset():
+    client = FakeClient(head=FakeResponse(204))
+    verifier = make_verifier(client)
+
+    assert verifier.verify("https://a.com/", {"a": "1"})["cached"] is False
+    assert verifier.verify("https://a.com/", {"a": "1"})["cached"] is True
+    verifier.verify("https://a.com/", {"b": "2"})
+
+    assert [call[1] for call in client.calls] == [{"a": "1"}, {"b": "2"}]
+    assert verifier.stats()["clients_created"] == 1
@@ -559,7 +559,8 @@ namespace WebScraperApp.Views
                     url = UrlTextBox.Text,
                     headless = false,
                     timeout = 60,
-                    wait_time = 15
+                    wait_time = 15,
+                    stream = "ndjson"
                 };
 
                 var json = System.Text.Json.JsonSerializer.Serialize(requestData);
@@ -570,17 +571,58 @@ namespace WebScraperApp.Views
 
                 UpdateStatus("⏳ 正在解决挑战（15-30 秒）...");
 
-                var response = await httpClient.PostAsync("http://localhost:5000/solve", content);
-                var responseBody = await response.Content.ReadAsStringAsync();
+                // 流式读取进度事件（每行一个 JSON），最后一条 result 事件为完整响应
+                using var solveRequest = new System.Net.Http.HttpRequestMessage(
+                    System.Net.Http.HttpMethod.Post, "http://localhost:5000/solve") { Content = content };
+                using var response = await httpClient.SendAsync(
+                    solveRequest, System.Net.Http.HttpCompletionOption.ResponseHeadersRead);
+                using var reader = new StreamReader(await response.Content.ReadAsStreamAsync());
 
-                var result = System.Text.Json.JsonDocument.Parse(responseBody);
+                System.Text.Json.JsonElement? resultElement = null;
+                string? line;
+                while ((line = await reader.ReadLineAsync()) != null)
+                {
+                    if (string.IsNullOrWhiteSpace(line))
+                    {
+                        continue;
+                    }
+
+                    var progressEvent = System.Text.Json.JsonDocument.Parse(line).RootElement;
+                    if (!progressEvent.TryGetProperty("event", out var eventProperty))
+                    {
+                        // 旧版服务不支持流式，直接返回完整响应
+                        resultElement = progressEvent.Clone();
+                        break;
+                    }
+
+                    var eventName = eventProperty.GetString();
+                    var elapsed = progressEvent.GetProperty("elapsed").GetDouble();
+
+                    if (eventName == "result")
+                    {
+                        resultElement = progressEvent.GetProperty("result").Clone();
+                        break;
+                    }
+
+                    Log($"   [{elapsed,6:F1}s] {DescribeProgressEvent(eventName, progressEvent)}");
+                    UpdateStatus($"⏳ {DescribeProgressEvent(eventName, progressEvent)}（{elapsed:F0}s）");
+                }
 
-                if (result.RootElement.GetProperty("success").GetBoolean())
+                if (resultElement == null)
                 {
-                    var cookies = result.RootElement.GetProperty("cookies");
-                    var userAgent = result.RootElement.GetProperty("user_agent").GetString();
-                    var sessionFile = result.RootElement.GetProperty("session_file").GetString();
-                    var currentUrl = result.RootElement.GetProperty("current_url").GetString();
+                    throw new InvalidOperationException("服务在返回结果前断开了连接");
+                }
+
+                var root = resultElement.Value;
+
+                if (root.GetProperty("success").GetBoolean())
+                {
+                    var cookies = root.GetProperty("cookies");
+                    var userAgent = root.GetProperty("user_agent").GetString();
+                    var sessionFile = root.GetProperty("session_file").GetString();
+                    var currentUrl = root.TryGetProperty("current_url", out var currentUrlElement)
+                        ? currentUrlElement.GetString()
+                        : UrlTextBox.Text;
 
                     Log("\n━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━");
                     Log("✅ 挑战成功!");
@@ -619,14 +661,19 @@ namespace WebScraperApp.Views
                 }
                 else
                 {
-                    var error = result.RootElement.GetProperty("error").GetString();
+                    var error = root.GetProperty("error").GetString();
                     Log($"\n❌ 挑战失败: {error}");
 
-                    if (result.RootElement.TryGetProperty("traceback", out var traceback))
+                    if (root.TryGetProperty("traceback", out var traceback))
                     {
                         Log($"\n详细错误:\n{traceback.GetString()}");
                     }
 
+                    if (root.TryGetProperty("request_id", out var requestId))
+                    {
+                        Log($"🔖 请求 ID: {requestId.GetString()}（在服务日志中搜索此 ID 查看详细堆栈）");
+                    }
+
                     UpdateStatus($"❌ 失败: {error}");
 
                     MessageBox.Show(
@@ -660,6 +707,29 @@ namespace WebScraperApp.Views
             }
         }
 
+        private static string DescribeProgressEvent(string? eventName, System.Text.Json.JsonElement progressEvent)
+        {
+            return eventName switch
+            {
+                "accepted" => "服务已接受请求",
+                "driver_launching" => "正在启动浏览器...",
+                "driver_acquired" => progressEvent.TryGetProperty("pool_hit", out var hit) && hit.GetBoolean()
+                    ? "已取得预热浏览器"
+                    : "浏览器已启动",
+                "navigation_started" => "正在访问页面...",
+                "navigation_done" => "页面已加载",
+                "challenge_detected" => "检测到 Cloudflare 挑战，等待验证...",
+                "cleared" => "验证已通过",
+                "clearance_timeout" => "等待验证超时",
+                "fixed_wait_done" => "固定等待结束",
+                "cookies_saved" => "会话已保存",
+                "cache_hit" => "使用缓存会话",
+                "coalesced" => "复用同域名进行中的求解",
+                "waiting_for_node" => "其他节点正在求解，等待其完成...",
+                _ => eventName ?? ""
+            };
+        }
+
         protected override void OnClosing(System.ComponentModel.CancelEventArgs e)
         {
             if (_driver != null)